@@ -0,0 +1,48 @@
+"""add chunks table
+
+Revision ID: 0004_add_chunks_table
+Revises: b05bfd4de95e
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0004_add_chunks_table'
+down_revision = 'b05bfd4de95e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('chunks',
+        sa.Column('chunk_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('doc_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('source', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('page_number', sa.Integer(), nullable=True),
+        sa.Column('text', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column(
+            'text_tsv',
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english', text)", persisted=True),
+            nullable=True,
+        ),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('chunk_id')
+    )
+    op.create_index(op.f('ix_chunks_doc_id'), 'chunks', ['doc_id'], unique=False)
+    op.create_index(op.f('ix_chunks_sha256'), 'chunks', ['sha256'], unique=False)
+    op.create_index('ix_chunks_text_tsv', 'chunks', ['text_tsv'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chunks_text_tsv', table_name='chunks', postgresql_using='gin')
+    op.drop_index(op.f('ix_chunks_sha256'), table_name='chunks')
+    op.drop_index(op.f('ix_chunks_doc_id'), table_name='chunks')
+    op.drop_table('chunks')
@@ -0,0 +1,30 @@
+"""add vector deletions queue
+
+Revision ID: 0005_add_vector_deletions
+Revises: 0004_add_chunks_table
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+import sqlalchemy as sa
+import sqlmodel
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0005_add_vector_deletions'
+down_revision = '0004_add_chunks_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('vector_deletions',
+        sa.Column('sha256', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('storage_path', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column('requested_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('vector_deletions')
@@ -0,0 +1,24 @@
+"""add chunk token count
+
+Revision ID: 0006_add_chunk_token_count
+Revises: 0005_add_vector_deletions
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0006_add_chunk_token_count'
+down_revision = '0005_add_vector_deletions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('chunks', sa.Column('token_count', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('chunks', 'token_count')
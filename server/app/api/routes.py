@@ -1,9 +1,12 @@
 from __future__ import annotations
 
-import inngest
-from fastapi import APIRouter, File, Form, HTTPException, Response, UploadFile
+from pathlib import Path
+from typing import Literal
 
+import inngest
+from fastapi import APIRouter, File, Form, HTTPException, Query, Response, UploadFile
 from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy import desc
 from sqlmodel import Session, select
 
@@ -17,39 +20,55 @@ from app.api.schemas import (
     FolderResponse,
     FolderUpdate,
     JobStatusResponse,
+    PageWarmRequest,
+    PageWarmResponse,
     QueryRequest,
     QueryResponse,
     ReactionCreate,
     UpdateDocumentRequest,
     UploadResponse,
 )
+from app.domain.errors import RenderError, RenderRequestError
 from app.services.db import engine
 from app.services.jobs_client import InngestJobsClient
+from app.services.metrics import intent_metrics
 from app.services.models import Document, Folder
-from app.services.repositories import ChatRepo, DocumentRepo, FolderRepo
-from app.services.storage import LocalStorage
-from app.services.vector_store import QdrantVectorStore
+from app.services.page_renderer import MEDIA_TYPES, PageRenderer, RenderKey
+from app.services.query_cache import answer_cache, invalidate_documents, retrieval_cache
+from app.services.repositories import ChatRepo, DocumentRepo, FolderRepo, VectorDeletionRepo
 from app.services.scanner import FileScanner
+from app.services.single_flight import query_flights
+from app.services.storage import LocalStorage, content_sha256
 from app.settings import settings
+from app.workflows.agent_stream import stream_agent_query
 from app.workflows.inngest_app import get_inngest_client
+from app.workflows.vector_gc import request_vector_gc
 
 router = APIRouter()
 
 storage = LocalStorage(settings.uploads_dir)
 jobs = InngestJobsClient(settings.inngest_api_base)
 scanner = FileScanner()
-
-def get_vector_store() -> QdrantVectorStore:
-    return QdrantVectorStore(
-        url=settings.qdrant_url, 
-        collection=settings.qdrant_collection, 
-        dim=settings.embed_dim
-    )
+renderer = PageRenderer(
+    cache_dir=settings.render_cache_dir,
+    max_cache_mb=settings.render_cache_max_mb,
+    max_workers=settings.render_workers,
+)
 
 @router.get("/health")
 def health():
     return {"ok": True, "service": settings.app_name, "env": settings.env}
 
+@router.get("/metrics")
+def metrics():
+    # Per worker process: counters are kept in memory.
+    return {
+        "intent": intent_metrics.snapshot(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "single_flight": query_flights.stats(),
+    }
+
 @router.post("/folders", response_model=FolderResponse)
 def create_folder(req: FolderCreate):
     with Session(engine) as session:
@@ -85,14 +104,12 @@ def delete_folder(folder_id: int):
     with Session(engine) as session:
         repo = FolderRepo(session)
         deleted_docs = repo.delete(folder_id)
-        
-        vstore = get_vector_store()
-        for doc in deleted_docs:
-            try:
-                vstore.delete_by_doc_id(doc.doc_id)
-                storage.delete(doc.storage_path)
-            except Exception:
-                pass
+        # Vectors, chunks and PDFs are shared per content hash; the background flush drops
+        # them in one batch once no remaining twin references them.
+        VectorDeletionRepo(session).enqueue(deleted_docs)
+    if deleted_docs:
+        invalidate_documents({d.sha256 for d in deleted_docs})
+        request_vector_gc()
                 
     return {"ok": True}
 
@@ -155,9 +172,11 @@ async def upload_documents(
                 if total_size > 2 * 1024 * 1024 * 1024:
                      raise HTTPException(status_code=400, detail="Folder size limit reached (max 2GB).")
 
-        stored = storage.save_pdf(file.filename, file_bytes)
-
         with Session(engine) as session:
+            # Held until the document row commits, so a vector flush of the same content
+            # cannot delete the PDF or vectors this upload is about to rely on
+            VectorDeletionRepo(session).lock_sha256s([content_sha256(file_bytes)])
+            stored = storage.save_pdf(file.filename, file_bytes)
             repo = DocumentRepo(session)
             doc_id, created_new = repo.create_document(
                 source_filename=stored.filename,
@@ -166,8 +185,14 @@ async def upload_documents(
                 size_bytes=stored.size_bytes,
                 folder_id=folder_id
             )
+            if not created_new:
+                # The background flush adds this folder to the twin's vector scopes
+                VectorDeletionRepo(session).enqueue_sha256s({stored.sha256: stored.path})
 
         ingest_event_id = "already_exists"
+        if not created_new:
+            invalidate_documents([stored.sha256])
+            await run_in_threadpool(request_vector_gc)
         if created_new:
             client = get_inngest_client()
             res = await client.send(
@@ -208,6 +233,10 @@ def update_document(doc_id: str, req: UpdateDocumentRequest):
                  if len(target_docs) >= 10:
                       raise HTTPException(status_code=400, detail="Target folder limit reached (max 10 files).")
              repo.move_to_folder(doc_id, fid)
+             # The background flush moves the vectors' folder scopes along
+             VectorDeletionRepo(session).enqueue([doc])
+             invalidate_documents([doc.sha256])
+             request_vector_gc()
              
     return {"ok": True}
 
@@ -217,13 +246,71 @@ def delete_document(doc_id: str):
         repo = DocumentRepo(session)
         doc = repo.delete(doc_id)
         if doc:
-            try:
-                get_vector_store().delete_by_doc_id(doc_id)
-                storage.delete(doc.storage_path)
-            except Exception:
-                pass
+            VectorDeletionRepo(session).enqueue([doc])
+    if doc:
+        invalidate_documents([doc.sha256])
+        request_vector_gc()
     return {"ok": True}
 
+def _get_renderable_document(doc_id: str) -> Document:
+    with Session(engine) as session:
+        doc = DocumentRepo(session).get_by_doc_id(doc_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not Path(doc.storage_path).exists():
+        raise HTTPException(status_code=410, detail="Original PDF is no longer stored")
+    return doc
+
+def _parse_clip(clip: str | None) -> tuple[float, float, float, float] | None:
+    if not clip:
+        return None
+    try:
+        x0, y0, x1, y1 = (float(v) for v in clip.split(","))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail="clip must be 'x0,y0,x1,y1' in PDF points"
+        ) from e
+    if x1 <= x0 or y1 <= y0:
+        raise HTTPException(status_code=400, detail="clip must have positive width and height")
+    return (x0, y0, x1, y1)
+
+@router.get("/documents/{doc_id}/pages/{page_number}/render")
+async def render_page(
+    doc_id: str,
+    page_number: int,
+    dpi: int = Query(default=110, ge=36),
+    fmt: Literal["png", "webp"] = Query(default="webp"),
+    clip: str | None = Query(default=None),
+):
+    if dpi > settings.render_max_dpi:
+        raise HTTPException(status_code=400, detail=f"dpi must be <= {settings.render_max_dpi}")
+    doc = await run_in_threadpool(_get_renderable_document, doc_id)
+    key = RenderKey(sha256=doc.sha256, page_number=page_number, dpi=dpi, fmt=fmt, clip=_parse_clip(clip))
+    try:
+        data = await renderer.render(doc.storage_path, key)
+    except RenderRequestError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except RenderError as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+    # Renders are keyed by content hash, so they never change for a given URL.
+    return Response(
+        content=data,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Cache-Control": "public, max-age=86400, immutable"},
+    )
+
+@router.post("/documents/{doc_id}/pages/warm", response_model=PageWarmResponse)
+async def warm_pages(doc_id: str, req: PageWarmRequest):
+    if req.dpi > settings.render_max_dpi:
+        raise HTTPException(status_code=400, detail=f"dpi must be <= {settings.render_max_dpi}")
+    doc = await run_in_threadpool(_get_renderable_document, doc_id)
+    keys = [
+        RenderKey(sha256=doc.sha256, page_number=p, dpi=req.dpi, fmt=req.fmt)
+        for p in sorted(set(req.pages))
+    ]
+    rendered = await renderer.warm(doc.storage_path, keys)
+    return PageWarmResponse(requested=len(keys), rendered=rendered)
+
 @router.post("/query", response_model=QueryResponse)
 async def query_agentic(req: QueryRequest):
     # If thread_id is provided, we save the user message first
@@ -242,11 +329,43 @@ async def query_agentic(req: QueryRequest):
                 "doc_id": req.doc_id,
                 "folder_id": req.folder_id,
                 "thread_id": req.thread_id,
+                "filters": req.filters.model_dump() if req.filters else None,
+                "expand_query": req.expand_query,
+                "mmr_lambda": req.mmr_lambda,
+                "mmr_oversample": req.mmr_oversample,
+                "use_answer_cache": req.use_answer_cache,
             },
         )
     )
     return QueryResponse(query_event_id=res[0])
 
+@router.post("/query/stream")
+async def query_agentic_stream(req: QueryRequest):
+    """
+    Same answer as /query, streamed as server-sent events instead of polled via /jobs.
+    """
+    if req.thread_id:
+        with Session(engine) as session:
+            ChatRepo(session).add_message(req.thread_id, "user", req.question)
+
+    events = stream_agent_query(
+        question=req.question,
+        top_k=int(req.top_k),
+        doc_id=req.doc_id,
+        folder_id=req.folder_id,
+        thread_id=req.thread_id,
+        filters=req.filters.model_dump() if req.filters else None,
+        mmr_lambda=req.mmr_lambda,
+        mmr_oversample=req.mmr_oversample,
+        use_answer_cache=req.use_answer_cache,
+        expand_query=req.expand_query,
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/jobs/{event_id}", response_model=JobStatusResponse)
 def job_status(event_id: str, response: Response):
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import Any, Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class UploadResponse(BaseModel):
@@ -30,12 +30,46 @@ class UpdateDocumentRequest(BaseModel):
     folder_id: int | None = None
 
 
+class PageWarmRequest(BaseModel):
+    pages: list[int] = Field(min_length=1, max_length=50)
+    dpi: int = Field(default=110, ge=36)
+    fmt: Literal["png", "webp"] = "webp"
+
+
+class PageWarmResponse(BaseModel):
+    requested: int
+    rendered: int
+
+
+class PageRange(BaseModel):
+    start: int = Field(ge=1)
+    end: int | None = Field(default=None, ge=1) # Inclusive; None means "to the last page"
+
+    @model_validator(mode="after")
+    def _check_order(self) -> PageRange:
+        if self.end is not None and self.end < self.start:
+            raise ValueError("end must be >= start")
+        return self
+
+
+class QueryFilters(BaseModel):
+    pages: list[PageRange] = Field(default_factory=list, max_length=20)
+    chunk_index_gte: int | None = Field(default=None, ge=0)
+    chunk_index_lte: int | None = Field(default=None, ge=0)
+
+
 class QueryRequest(BaseModel):
     question: str = Field(min_length=1, max_length=4000)
     top_k: int = Field(default=6, ge=1, le=20)
     doc_id: str | None = None 
     folder_id: int | None = None
     thread_id: int | None = None # Optional for stateless queries, required for threaded
+    filters: QueryFilters | None = None
+    expand_query: bool | None = None # None follows the server's QUERY_EXPANSION setting
+    # MMR reranking: 1.0 is pure relevance, lower values favour diversity
+    mmr_lambda: float | None = Field(default=None, ge=0.0, le=1.0)
+    mmr_oversample: int | None = Field(default=None, ge=1, le=10)
+    use_answer_cache: bool = True # False forces a fresh answer
 
 
 class QueryResponse(BaseModel):
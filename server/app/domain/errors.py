@@ -16,3 +16,11 @@ class DatabaseError(AppError):
 
 class JobError(AppError):
     pass
+
+
+class RenderError(AppError):
+    pass
+
+
+class RenderRequestError(RenderError):
+    pass
@@ -1,21 +1,46 @@
 from __future__ import annotations
 
+import logging
+from contextlib import asynccontextmanager
+
 import inngest.fast_api
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api.routes import router
+from app.api.routes import renderer, router
 from app.logging_config import setup_logging
+from app.services.db import dispose_async_engine
+from app.services.tokens import load_encoding
+from app.services.vector_store import close_clients, get_vector_store
 from app.settings import settings
 from app.workflows.agent_query import agent_query
 from app.workflows.inngest_app import get_inngest_client
 from app.workflows.inngest_pdf import inngest_pdf
+from app.workflows.vector_gc import flush_vector_deletions
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bootstrap the Qdrant collection once; requests reuse the pooled client afterwards.
+    try:
+        await run_in_threadpool(get_vector_store)
+    except Exception as e:
+        logger.warning(f"Qdrant bootstrap failed at startup, will retry on first use: {e}")
+    # tiktoken fetches its encoding on first use; do that now rather than in a request.
+    await run_in_threadpool(load_encoding)
+    yield
+    await close_clients()
+    await dispose_async_engine()
+    renderer.shutdown()
 
 
 def create_app() -> FastAPI:
     setup_logging(settings.log_level)
 
-    app = FastAPI(title=settings.app_name)
+    app = FastAPI(title=settings.app_name, lifespan=lifespan)
 
     app.add_middleware(
         CORSMiddleware,
@@ -33,6 +58,7 @@ def create_app() -> FastAPI:
         [
             inngest_pdf,
             agent_query,
+            flush_vector_deletions,
         ],
     )
     return app
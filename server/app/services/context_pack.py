@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from itertools import groupby
+
+# Shortest overlap that is stripped; shorter matches are likely coincidental.
+MIN_OVERLAP = 20
+
+
+def strip_overlap(prev: str, text: str, max_chars: int = 2000) -> str:
+    """
+    `text` without the leading part that repeats the end of `prev` (the splitter's chunk
+    overlap). Returns `text` unchanged when they do not overlap.
+    """
+    probe = text[:MIN_OVERLAP]
+    if len(probe) < MIN_OVERLAP:
+        return text
+    start = prev.find(probe, max(0, len(prev) - max_chars))
+    # The earliest match that runs to the end of `prev` is the longest overlap.
+    while start != -1:
+        if text.startswith(prev[start:]):
+            return text[len(prev) - start :].lstrip()
+        start = prev.find(probe, start + 1)
+    return text
+
+
+def _doc(c: dict) -> str:
+    return c.get("sha256") or c.get("doc_id") or ""
+
+
+def build_context_pack(chunks: list[dict]) -> str:
+    """
+    Renders retrieved chunks for the prompt: ordered by document and position, with one
+    header per source and page, consecutive chunks merged and their overlap removed.
+    Every chunk keeps a `[chunk_id=...]` marker so it can still be cited; a chunk the
+    previous one already covers entirely is listed in that chunk's marker instead.
+    """
+    ordered = sorted(
+        chunks,
+        key=lambda c: (
+            c.get("source") or "",
+            _doc(c),
+            c.get("chunk_index") is None,
+            c.get("chunk_index") or 0,
+        ),
+    )
+    sections: list[str] = []
+    seen: set[str] = set()
+    groups = groupby(ordered, key=lambda c: (c.get("source"), _doc(c), c.get("page_number")))
+    for (source, _, page), group in groups:
+        # [chunk ids, text] per rendered chunk; None is a gap
+        parts: list[tuple[list[str], str] | None] = []
+        prev: dict | None = None
+        for c in group:
+            if c["chunk_id"] in seen:
+                continue
+            seen.add(c["chunk_id"])
+            text = c["text"]
+            consecutive = (
+                prev is not None
+                and prev.get("chunk_index") is not None
+                and c.get("chunk_index") == prev["chunk_index"] + 1
+            )
+            if consecutive:
+                text = strip_overlap(prev["text"], text)
+            gap = prev is not None and not consecutive
+            prev = c
+            if not text.strip():
+                if consecutive and c["text"].strip() and parts and parts[-1] is not None:
+                    # Nothing the previous chunk did not already say; cite it through that one
+                    parts[-1][0].append(c["chunk_id"])
+                continue
+            if gap and parts:
+                # A gap between chunks of the same page
+                parts.append(None)
+            parts.append(([c["chunk_id"]], text))
+        # Groups left without text would only spend budget on a header
+        if parts:
+            lines = [f"### source={source} | page={page}"]
+            for part in parts:
+                if part is None:
+                    lines.append("[...]")
+                else:
+                    ids, text = part
+                    lines.append(f"[chunk_id={', '.join(ids)}]\n{text}")
+            sections.append("\n".join(lines))
+    return "\n\n".join(sections)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from app.services.vector_store import RetrievedChunk
+
+
+@dataclass(frozen=True)
+class ContextPolicy:
+    """
+    Decides how many ranked hits go into the prompt. The list is cut where scores fall off
+    (a large drop between neighbours or an absolute floor) and may run past the requested
+    `top_k` while scores stay within `flat_band` of the best hit.
+    """
+
+    min_chunks: int = 2
+    max_chunks: int = 30
+    # Stop when a score is more than this fraction below the previous one.
+    relative_drop: float = 0.2
+    # Beyond the target, keep only hits within this fraction of the best score.
+    flat_band: float = 0.05
+    score_floor: float = 0.2
+
+    def select(
+        self, chunks: list[RetrievedChunk], target: int, similarity: bool = True
+    ) -> list[RetrievedChunk]:
+        """
+        Returns the leading hits to use. Without similarity scores (e.g. RRF-fused ranks)
+        the list is simply cut at `target`.
+        """
+        if not similarity or any(c.score is None for c in chunks):
+            return chunks[:target]
+        if not chunks:
+            return []
+
+        best = chunks[0].score or 0.0
+        kept = [chunks[0]]
+        for prev, c in zip(chunks, chunks[1:], strict=False):
+            score, prev_score = c.score or 0.0, prev.score or 0.0
+            if len(kept) >= self.max_chunks:
+                break
+            if len(kept) >= self.min_chunks:
+                if score < self.score_floor:
+                    break
+                if score < prev_score * (1 - self.relative_drop):
+                    break
+                if len(kept) >= target and score < best * (1 - self.flat_band):
+                    break
+            kept.append(c)
+        return kept
+
+    def above_floor(
+        self, chunks: list[RetrievedChunk], similarity: bool = True
+    ) -> list[RetrievedChunk]:
+        """
+        Drops hits under the absolute score floor, keeping at least `min_chunks`.
+        """
+        if not similarity:
+            return chunks
+        return [
+            c
+            for i, c in enumerate(chunks)
+            if i < self.min_chunks or (c.score or 0.0) >= self.score_floor
+        ]
+
+
+def interleave_groups(
+    chunks: list[RetrievedChunk], cap: int, per_group: int | None = None
+) -> list[RetrievedChunk]:
+    """
+    Round-robin over per-document groups (in group order) up to `cap` hits, so every
+    document contributes its best hits before any document contributes more. `per_group`
+    additionally limits each document's share.
+    """
+    groups: dict[str, list[RetrievedChunk]] = {}
+    for c in chunks:
+        groups.setdefault(c.sha256 or c.doc_id or "", []).append(c)
+    out: list[RetrievedChunk] = []
+    depth = 0
+    while len(out) < cap and (per_group is None or depth < per_group):
+        layer = [g[depth] for g in groups.values() if depth < len(g)]
+        if not layer:
+            break
+        out.extend(layer[: cap - len(out)])
+        depth += 1
+    return out
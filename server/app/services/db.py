@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import threading
+
 from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.settings import settings
 
@@ -16,6 +20,41 @@ def build_engine() -> Engine:
 engine: Engine = build_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+_async_engine: AsyncEngine | None = None
+_async_sessions: async_sessionmaker[AsyncSession] | None = None
+_lock = threading.Lock()
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Process-wide async engine over the same DATABASE_URL (psycopg 3 serves both). Built on
+    first use so the sync-only entry points (Alembic, scripts) never open an async pool.
+    """
+    global _async_engine
+    if _async_engine is None:
+        with _lock:
+            if _async_engine is None:
+                _async_engine = create_async_engine(settings.database_url, pool_pre_ping=True)
+    return _async_engine
+
+
+def async_session() -> AsyncSession:
+    """
+    New async session; use as `async with async_session() as session: ...`.
+    """
+    global _async_sessions
+    if _async_sessions is None:
+        _async_sessions = async_sessionmaker(get_async_engine(), class_=AsyncSession, expire_on_commit=False)
+    return _async_sessions()
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _async_sessions
+    with _lock:
+        eng, _async_engine, _async_sessions = _async_engine, None, None
+    if eng is not None:
+        await eng.dispose()
+
 
 def create_tables_dev_only() -> None:
     SQLModel.metadata.create_all(engine)
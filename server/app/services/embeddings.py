@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from openai import OpenAI
+import base64
+from collections import OrderedDict
+
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
 
 
 class OpenAIEmbedder:
@@ -11,5 +15,46 @@ class OpenAIEmbedder:
     def embed(self, texts: list[str]) -> list[list[float]]:
         if not texts:
             return []
-        resp = self.client.embeddings.create(model=self.model, input=texts)  
+        resp = self.client.embeddings.create(model=self.model, input=texts)
         return [item.embedding for item in resp.data]
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Embeddings as one contiguous float32 matrix (len(texts) x dim). Requests the base64
+        encoding so vectors are decoded straight into the array instead of via JSON floats.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        resp = self.client.embeddings.create(model=self.model, input=texts, encoding_format="base64")
+        rows = [np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32) for item in resp.data]
+        return np.ascontiguousarray(np.vstack(rows))
+
+
+class AsyncOpenAIEmbedder:
+    """
+    `OpenAIEmbedder` for code running on the event loop. With `cache_size` it keeps the
+    most recent embeddings, so the steps of one query embed its question only once.
+    """
+
+    def __init__(self, api_key: str, model: str, cache_size: int = 0) -> None:
+        self.client = AsyncOpenAI(api_key=api_key)
+        self.model = model
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        known = {t: self._cache[t] for t in texts if t in self._cache}
+        missing = [t for t in dict.fromkeys(texts) if t not in known]
+        if missing:
+            resp = await self.client.embeddings.create(model=self.model, input=missing)
+            known.update((t, item.embedding) for t, item in zip(missing, resp.data, strict=True))
+        out = [known[t] for t in texts]
+        if self.cache_size > 0:
+            for t in texts:
+                self._cache[t] = known[t]
+                self._cache.move_to_end(t)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return out
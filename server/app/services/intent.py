@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import re
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+INTENTS = ("qa", "summarize", "extract", "clarify")
+
+# Requests that cannot be answered without more context ("tell me about it").
+_VAGUE = re.compile(
+    r"^(please\s+)?((tell me|talk) about (it|this|that)|explain( (it|this|that))?"
+    r"|what about (it|this|that)|more|continue|help|hi|hello|hey|\?+)[\s.!?]*$",
+    re.IGNORECASE,
+)
+_SUMMARIZE = re.compile(
+    r"\b(summari[sz]e|summary|overview|tl;?dr|gist|recap|key (points|takeaways|findings)"
+    r"|main (points|ideas|themes|findings))\b"
+    r"|^what('s| is) (this|the) (document|paper|report|pdf|file|book|article) about\b",
+    re.IGNORECASE,
+)
+_EXTRACT = re.compile(
+    r"^(please\s+)?(list|extract|enumerate|tabulate|pull out|give me (a list|all|every))\b"
+    r"|\b(all|every) (the )?"
+    r"(dates|names|amounts|numbers|emails|addresses|tables|figures|invoice numbers)\b",
+    re.IGNORECASE,
+)
+
+# Labelled examples whose mean embeddings are the class centroids.
+SEED_EXAMPLES: dict[str, tuple[str, ...]] = {
+    "qa": (
+        "What is the termination notice period in the contract?",
+        "Who is responsible for maintenance under this agreement?",
+        "How does the proposed method handle missing data?",
+        "When does the warranty expire?",
+        "Why did revenue decline in the third quarter?",
+        "Does the policy cover water damage?",
+    ),
+    "summarize": (
+        "Summarize this document.",
+        "Give me an overview of the report.",
+        "What are the main findings of this paper?",
+        "Condense chapter 3 into a few paragraphs.",
+        "Briefly describe what this PDF is about.",
+        "What are the key takeaways?",
+    ),
+    "extract": (
+        "List all dates mentioned in the document.",
+        "Extract the invoice number and total amount.",
+        "Pull out every email address.",
+        "Find all tables and give their titles.",
+        "Give me the names of all parties as a bullet list.",
+        "Extract the line items with quantities and prices.",
+    ),
+    "clarify": (
+        "Tell me about it.",
+        "What about that?",
+        "Explain.",
+        "Can you help?",
+        "The thing from before.",
+        "And the other one?",
+    ),
+}
+
+
+@dataclass(frozen=True)
+class IntentGuess:
+    intent: str
+    confidence: float
+    # "rules" or "centroid"
+    method: str
+
+
+def rule_intent(question: str) -> IntentGuess | None:
+    """
+    Keyword rules for unambiguous requests. Returns None when no rule (or more than one
+    competing rule) matches; a plain question is not enough to call it qa, since
+    "What are the main findings?" asks for a summary.
+    """
+    q = question.strip()
+    if not q or _VAGUE.match(q):
+        return IntentGuess("clarify", 1.0, "rules")
+    summarize, extract = bool(_SUMMARIZE.search(q)), bool(_EXTRACT.search(q))
+    if summarize != extract:
+        return IntentGuess("summarize" if summarize else "extract", 1.0, "rules")
+    return None
+
+
+class CentroidClassifier:
+    """
+    Nearest-centroid intent model over question embeddings. Confidence is the cosine
+    margin between the best and the runner-up centroid.
+    """
+
+    def __init__(self, labels: list[str], centroids: np.ndarray) -> None:
+        self.labels = labels
+        self.centroids = _normalize(centroids)
+
+    @classmethod
+    def fit(cls, examples: dict[str, list[list[float]]]) -> CentroidClassifier:
+        labels = list(examples)
+        centroids = np.vstack(
+            [np.asarray(examples[label], dtype=np.float32).mean(axis=0) for label in labels]
+        )
+        return cls(labels, centroids)
+
+    def predict(self, vector: list[float]) -> IntentGuess:
+        sims = self.centroids @ _normalize(np.asarray(vector, dtype=np.float32))
+        order = np.argsort(-sims)
+        margin = float(sims[order[0]] - sims[order[1]]) if len(order) > 1 else 1.0
+        return IntentGuess(self.labels[int(order[0])], margin, "centroid")
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=-1, keepdims=True), 1e-12)
+
+
+class LocalIntentClassifier:
+    """
+    Rules first, then the centroid model over the question's embedding. Give `embed` the
+    caching embedder retrieval uses: the question is embedded once and both share it. The
+    seed examples are embedded once per process on first use.
+    """
+
+    def __init__(self, embed: Callable[[list[str]], Awaitable[list[list[float]]]]) -> None:
+        self.embed = embed
+        self._model: CentroidClassifier | None = None
+        self._lock = asyncio.Lock()
+
+    async def _centroids(self) -> CentroidClassifier:
+        async with self._lock:
+            if self._model is None:
+                texts = [t for examples in SEED_EXAMPLES.values() for t in examples]
+                vectors = iter(await self.embed(texts))
+                self._model = CentroidClassifier.fit(
+                    {
+                        label: [next(vectors) for _ in examples]
+                        for label, examples in SEED_EXAMPLES.items()
+                    }
+                )
+            return self._model
+
+    async def classify(self, question: str, vector: list[float] | None = None) -> IntentGuess:
+        """
+        The rule verdict, else the centroid prediction for `vector` (the question is
+        embedded when no vector is given).
+        """
+        guess = rule_intent(question)
+        if guess is not None:
+            return guess
+        model = await self._centroids()
+        if vector is None:
+            [vector] = await self.embed([question])
+        return model.predict(vector)
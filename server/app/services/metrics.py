@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import threading
+from collections import Counter, OrderedDict
+
+
+class IntentMetrics:
+    """
+    In-process counters for the local intent classifier: how often it answered without
+    the LLM, and how often it agreed with the LLM when both ran.
+
+    Inngest re-enters a function once per step, so records are keyed by run id and each
+    run is counted once.
+    """
+
+    def __init__(self, remember_runs: int = 4096) -> None:
+        self._lock = threading.Lock()
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._remember_runs = remember_runs
+        self.by_method: Counter[str] = Counter()
+        self.compared = 0
+        self.agreed = 0
+        self.confusion: Counter[str] = Counter()
+
+    def record(self, run_id: str, method: str, local: str | None = None, llm: str | None = None) -> None:
+        """
+        `method` is what decided the intent: "rules" or "centroid" (answered locally) or
+        "llm" (fallback). `local` and `llm` are both set when both classifiers ran.
+        """
+        with self._lock:
+            if run_id in self._seen:
+                return
+            self._seen[run_id] = None
+            if len(self._seen) > self._remember_runs:
+                self._seen.popitem(last=False)
+
+            self.by_method[method] += 1
+            if local is not None and llm is not None:
+                self.compared += 1
+                self.agreed += local == llm
+                if local != llm:
+                    self.confusion[f"{local}->{llm}"] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = sum(self.by_method.values())
+            local = total - self.by_method["llm"]
+            return {
+                "total": total,
+                "by_method": dict(self.by_method),
+                "local_hit_rate": local / total if total else None,
+                "compared": self.compared,
+                "agreement": self.agreed / self.compared if self.compared else None,
+                "disagreements": dict(self.confusion),
+            }
+
+
+intent_metrics = IntentMetrics()
@@ -1,7 +1,8 @@
 import datetime as dt
 from typing import Optional
 
-from sqlalchemy import Column, Index
+from sqlalchemy import Column, Computed, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlmodel import JSON, Field, Relationship, SQLModel
 
 
@@ -94,4 +95,40 @@ class ChatMessage(SQLModel, table=True):
     created_at: dt.datetime = Field(default_factory=lambda: dt.datetime.now(dt.UTC))
 
 
+class Chunk(SQLModel, table=True):
+    __tablename__: str = "chunks"
+
+    # Same id as the Qdrant point, which only keeps ids and filter keys in its payload.
+    chunk_id: str = Field(primary_key=True)
+    doc_id: str = Field(index=True)
+    sha256: str = Field(index=True)
+    source: str
+    chunk_index: int
+    page_number: int | None = None
+    text: str
+    # Chat-model tokens in `text`, counted at ingestion for prompt budgeting.
+    token_count: int | None = None
+
+    # Maintained by Postgres; used for SQL-side full-text search.
+    text_tsv: str | None = Field(
+        default=None,
+        sa_column=Column(TSVECTOR, Computed("to_tsvector('english', text)", persisted=True)),
+    )
+
+    created_at: dt.datetime = Field(default_factory=lambda: dt.datetime.now(dt.UTC))
+
+
+class VectorDeletion(SQLModel, table=True):
+    __tablename__: str = "vector_deletions"
+
+    # Vector sets and stored PDFs are owned per content hash and shared by twin documents.
+    # A hash is queued when one of its documents is deleted or changes folder; the
+    # background flush removes it only if no Document row still references it, and
+    # otherwise rewrites its folder scopes.
+    sha256: str = Field(primary_key=True)
+    storage_path: str | None = None
+    requested_at: dt.datetime = Field(default_factory=lambda: dt.datetime.now(dt.UTC))
+
+
 Index("ix_documents_sha256", Document.sha256)
+Index("ix_chunks_text_tsv", Chunk.text_tsv, postgresql_using="gin")
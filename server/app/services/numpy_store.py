@@ -0,0 +1,650 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None  # type: ignore[assignment]
+
+from app.domain.errors import VectorStoreError
+from app.services.vector_store import (
+    ChunkLoader,
+    MetadataFilter,
+    RetrievedChunk,
+    _merge_texts,
+    _missing_text,
+    _rehydrate_lists,
+    _unique,
+    merge_neighbors,
+    neighbor_ids,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per matrix multiply; bounds the float32 working set to BLOCK_ROWS * dim * 4 B.
+BLOCK_ROWS = 2048
+_PAYLOAD_KEYS = ("doc_id", "sha256", "scopes", "chunk_index", "page_number")
+_FILTER_KEYS = ("doc_id", "sha256", "scopes")
+
+
+class NumpyVectorStore:
+    """
+    In-process exact-search backend for small corpora. Vectors are L2-normalized and kept as
+    float16 in a memory-mapped file; ids and filter keys live in memory and are persisted
+    as an append-only log (index.jsonl) next to it, so a write only appends its own rows.
+    Implements the same search/upsert/delete interface as `QdrantVectorStore`.
+
+    Several processes (API workers, the Inngest worker, migrate_qdrant.py) may open the same
+    directory: writes take an exclusive file lock, reads a shared one, and each process
+    replays what the others appended since its last look. Without fcntl (Windows) the store
+    is single-process only.
+    """
+
+    hybrid = False
+    similarity_scores = True
+
+    def __init__(self, data_dir: str, dim: int, chunk_loader: ChunkLoader | None = None) -> None:
+        self.base = Path(data_dir)
+        self.base.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.chunk_loader = chunk_loader
+        self._vectors_path = self.base / "vectors.f16"
+        self._log_path = self.base / "index.jsonl"
+        # Written by versions that rewrote the whole index on every change; imported once.
+        self._legacy_index_path = self.base / "index.json"
+        self._lock = threading.RLock()
+        # Held open for the store's lifetime; flock() on it guards the files across processes.
+        self._lock_file = open(self.base / ".lock", "a+")  # noqa: SIM115
+        self._lock_depth = 0
+        # Inode and byte offset of the log this process has applied up to
+        self._log_ino: int | None = None
+        self._log_offset = 0
+        self._log_records = 0
+
+        self._ids: list[str] = []
+        self._payloads: list[dict[str, Any]] = []
+        # Sized to capacity; rows at or past len(self._ids) are always False
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of: dict[str, int] = {}
+        self._by_key: dict[str, dict[str, set[int]]] = {k: {} for k in _FILTER_KEYS}
+        # Live rows written before scoped search, i.e. without a scopes payload
+        self._unscoped = 0
+        self._vectors: np.memmap | None = None
+
+        try:
+            # Exclusive: the first open may import a legacy index and write the log
+            with self._locked(exclusive=True):
+                if self._vectors is None:
+                    self._load()
+        except Exception as e:
+            raise VectorStoreError(f"Failed to open vector store at {self.base}: {e}") from e
+
+    # --- Persistence ---
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """
+        Thread lock plus the cross-process file lock; catches up with what other processes
+        wrote. Nested calls reuse the outer file lock.
+        """
+        with self._lock:
+            outer = self._lock_depth == 0
+            if outer and fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                if outer and self._vectors is not None:
+                    self._sync()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if outer and fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _sync(self) -> None:
+        try:
+            st = os.stat(self._log_path)
+        except FileNotFoundError:
+            if self._log_ino is not None:
+                self._load()
+            return
+        if st.st_ino != self._log_ino or st.st_size < self._log_offset:
+            # Compacted (replaced) by another process
+            self._load()
+        elif st.st_size > self._log_offset:
+            self._replay()
+
+    def _reset(self) -> None:
+        self._ids = []
+        self._payloads = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._row_of = {}
+        self._by_key = {k: {} for k in _FILTER_KEYS}
+        self._unscoped = 0
+        self._log_ino = None
+        self._log_offset = 0
+        self._log_records = 0
+
+    def _load(self) -> None:
+        self._reset()
+        if self._log_path.exists():
+            self._replay()
+        elif self._legacy_index_path.exists():
+            self._import_legacy()
+        self._open_vectors(max(len(self._ids), 1024))
+
+    def _import_legacy(self) -> None:
+        index = json.loads(self._legacy_index_path.read_text())
+        self._check_dim(index["dim"])
+        rows = zip(index["ids"], index["payloads"], strict=True)
+        for row, (chunk_id, payload) in enumerate(rows):
+            self._apply({"row": row, "id": chunk_id, "payload": payload})
+        self._apply({"del": [r for r, alive in enumerate(index["alive"]) if not alive]})
+        self._open_vectors(max(len(self._ids), 1024))
+        self._compact()
+        self._rewrite_log()
+        self._legacy_index_path.unlink()
+
+    def _check_dim(self, dim: int) -> None:
+        if dim != self.dim:
+            raise VectorStoreError(f"Stored dim {dim} does not match configured dim {self.dim}")
+
+    def _replay(self) -> None:
+        """
+        Applies log records past the current offset.
+        """
+        with open(self._log_path, "rb") as f:
+            self._log_ino = os.fstat(f.fileno()).st_ino
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # never expected: writers hold the exclusive lock
+                rec = json.loads(line)
+                if "dim" in rec:
+                    self._check_dim(rec["dim"])
+                else:
+                    self._apply(rec)
+                    self._log_records += 1
+                self._log_offset += len(line)
+        if self._vectors is not None and len(self._ids) > self._vectors.shape[0]:
+            self._open_vectors(len(self._ids))
+
+    def _append(self, records: list[dict[str, Any]]) -> None:
+        with open(self._log_path, "ab") as f:
+            if f.tell() == 0:
+                f.write(json.dumps({"dim": self.dim}).encode() + b"\n")
+            for rec in records:
+                f.write(json.dumps(rec).encode() + b"\n")
+            f.flush()
+            self._log_ino = os.fstat(f.fileno()).st_ino
+            self._log_offset = f.tell()
+        self._log_records += len(records)
+
+    def _rewrite_log(self) -> None:
+        """
+        Replaces the log with one record per live row. Requires compacted rows.
+        """
+        tmp = self._log_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(json.dumps({"dim": self.dim}).encode() + b"\n")
+            for row, (chunk_id, payload) in enumerate(zip(self._ids, self._payloads, strict=True)):
+                rec = {"row": row, "id": chunk_id, "payload": payload}
+                f.write(json.dumps(rec).encode() + b"\n")
+        os.replace(tmp, self._log_path)
+        st = os.stat(self._log_path)
+        self._log_ino, self._log_offset = st.st_ino, st.st_size
+        self._log_records = len(self._ids)
+
+    def _apply(self, rec: dict[str, Any]) -> None:
+        """
+        One log record: `{"row", "id", "payload"}` writes a row (appending when `row` is
+        the next free one), `{"del": rows}` deletes rows.
+        """
+        if "del" in rec:
+            for row in rec["del"]:
+                if self._alive[row]:
+                    self._unindex_row(row)
+                    self._alive[row] = False
+            return
+        row, chunk_id, payload = rec["row"], rec["id"], rec["payload"]
+        if row == len(self._ids):
+            if row >= len(self._alive):
+                alive = np.zeros(max(2 * len(self._alive), 1024), dtype=bool)
+                alive[: len(self._alive)] = self._alive
+                self._alive = alive
+            self._ids.append(chunk_id)
+            self._payloads.append(payload)
+        elif row < len(self._ids):
+            if self._alive[row]:
+                self._unindex_row(row)
+            self._ids[row] = chunk_id
+            self._payloads[row] = payload
+        else:
+            raise VectorStoreError(f"Corrupt vector index: row {row} past {len(self._ids)}")
+        self._alive[row] = True
+        self._index_row(row, chunk_id, payload)
+
+    def _maybe_compact(self) -> None:
+        """
+        Drops deleted rows and superseded log records once they outweigh the live rows.
+        """
+        live = len(self._row_of)
+        if live * 2 < len(self._ids) or self._log_records > 2 * live + 1024:
+            self._compact()
+            self._rewrite_log()
+
+    def _open_vectors(self, capacity: int) -> None:
+        size = capacity * self.dim * np.dtype(np.float16).itemsize
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        rows = os.path.getsize(self._vectors_path) // (self.dim * np.dtype(np.float16).itemsize)
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float16, mode="r+", shape=(rows, self.dim)
+        )
+
+    # --- In-memory filter index ---
+
+    @staticmethod
+    def _values(payload: dict[str, Any], key: str) -> list[str]:
+        value = payload.get(key)
+        if value is None:
+            return []
+        return value if isinstance(value, list) else [value]
+
+    def _index_row(self, row: int, chunk_id: str, payload: dict[str, Any]) -> None:
+        self._row_of[chunk_id] = row
+        if payload.get("scopes") is None:
+            self._unscoped += 1
+        for key, rows in self._by_key.items():
+            for value in self._values(payload, key):
+                rows.setdefault(value, set()).add(row)
+
+    def _unindex_row(self, row: int) -> None:
+        self._row_of.pop(self._ids[row], None)
+        payload = self._payloads[row]
+        if payload.get("scopes") is None:
+            self._unscoped -= 1
+        for key, rows in self._by_key.items():
+            for value in self._values(payload, key):
+                bucket = rows.get(value)
+                if bucket is not None:
+                    bucket.discard(row)
+                    if not bucket:
+                        del rows[value]
+
+    def _candidate_rows(
+        self,
+        doc_ids: list[str] | None,
+        sha256s: list[str] | None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+    ) -> np.ndarray | None:
+        """
+        Row numbers matching the filters, or None when unfiltered (all live rows).
+        """
+        selected: set[int] | None = None
+        for key, values in (("doc_id", doc_ids), ("sha256", sha256s), ("scopes", scopes)):
+            if not values:
+                continue
+            rows: set[int] = set()
+            for v in values:
+                rows |= self._by_key[key].get(v, set())
+            selected = rows if selected is None else selected & rows
+        if metadata:
+            candidates = selected if selected is not None else np.flatnonzero(self._alive).tolist()
+            selected = {row for row in candidates if metadata.matches(self._payloads[row])}
+        if selected is None:
+            return None
+        return np.fromiter(sorted(selected), dtype=np.int64, count=len(selected))
+
+    def _compact(self) -> None:
+        """
+        Moves live rows to the front of the file, dropping deleted ones.
+        """
+        assert self._vectors is not None
+        live = np.flatnonzero(self._alive)
+        kept = np.array(self._vectors[live])
+        self._vectors[: len(live)] = kept
+        self._vectors.flush()
+        ids = [self._ids[r] for r in live]
+        payloads = [self._payloads[r] for r in live]
+        self._ids, self._payloads = [], []
+        self._alive = np.zeros(max(len(live), 1024), dtype=bool)
+        self._row_of = {}
+        self._by_key = {k: {} for k in _FILTER_KEYS}
+        self._unscoped = 0
+        for row, (chunk_id, payload) in enumerate(zip(ids, payloads, strict=True)):
+            self._apply({"row": row, "id": chunk_id, "payload": payload})
+
+    # --- Interface ---
+
+    def upsert(
+        self,
+        ids: list[str],
+        vectors: Any,
+        payloads: list[dict],
+        sparse_vectors: list[Any] | None = None,
+    ) -> None:
+        try:
+            arr = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+            norms = np.linalg.norm(arr, axis=1, keepdims=True)
+            arr = (arr / np.maximum(norms, 1e-12)).astype(np.float16)
+
+            with self._locked(exclusive=True):
+                needed = len(self._ids) + sum(1 for i in ids if i not in self._row_of)
+                assert self._vectors is not None
+                if needed > self._vectors.shape[0]:
+                    self._open_vectors(max(needed, self._vectors.shape[0] * 2))
+
+                records = []
+                for i, chunk_id in enumerate(ids):
+                    row = self._row_of.get(chunk_id, len(self._ids))
+                    rec = {
+                        "row": row,
+                        "id": chunk_id,
+                        "payload": {k: payloads[i].get(k) for k in _PAYLOAD_KEYS},
+                    }
+                    self._vectors[row] = arr[i]
+                    self._apply(rec)
+                    records.append(rec)
+                # Vectors first: a reader that sees a row in the log can score it
+                self._vectors.flush()
+                self._append(records)
+                self._maybe_compact()
+        except VectorStoreError:
+            raise
+        except Exception as e:
+            raise VectorStoreError(f"Vector upsert failed: {e}") from e
+
+    def bulk_upsert(
+        self,
+        ids: list[str],
+        vectors: np.ndarray,
+        payloads: list[dict],
+        sparse_vectors: list[Any] | None = None,
+        batch_size: int = 256,
+        parallel: int = 1,
+    ) -> None:
+        # Writes go straight into the memmap, so there is nothing to batch or parallelize.
+        self.upsert(ids, vectors, payloads, sparse_vectors)
+
+    def wait_for_points(self, doc_id: str, expected: int, timeout: float = 120.0) -> None:
+        # Upserts are applied synchronously.
+        return None
+
+    def set_scopes(self, scopes: dict[str, list[str]]) -> None:
+        try:
+            with self._locked(exclusive=True):
+                records = [
+                    {
+                        "row": row,
+                        "id": self._ids[row],
+                        "payload": {**self._payloads[row], "scopes": values},
+                    }
+                    for sha256, values in scopes.items()
+                    for row in sorted(self._by_key["sha256"].get(sha256, ()))
+                ]
+                for rec in records:
+                    self._apply(rec)
+                if records:
+                    self._append(records)
+                    self._maybe_compact()
+        except Exception as e:
+            raise VectorStoreError(f"Vector payload update failed: {e}") from e
+
+    def scopes_ready(self) -> bool:
+        """
+        Whether every live row carries a scopes payload (rows written before scoped
+        search do not).
+        """
+        with self._locked(exclusive=False):
+            return self._unscoped == 0
+
+    def _delete_rows(self, key: str, values: list[str]) -> None:
+        try:
+            with self._locked(exclusive=True):
+                rows = sorted({row for v in values for row in self._by_key[key].get(v, ())})
+                if rows:
+                    rec = {"del": rows}
+                    self._apply(rec)
+                    self._append([rec])
+                    self._maybe_compact()
+        except Exception as e:
+            raise VectorStoreError(f"Vector delete failed: {e}") from e
+
+    def delete_by_doc_id(self, doc_id: str) -> None:
+        self._delete_rows("doc_id", [doc_id])
+
+    def delete_by_sha256s(self, sha256s: list[str]) -> None:
+        self._delete_rows("sha256", sha256s)
+
+    def _scores(
+        self, query_vector: list[float], rows: np.ndarray | None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Cosine scores for the candidate rows, computed block by block. Returns (rows, scores).
+        """
+        assert self._vectors is not None
+        q = np.asarray(query_vector, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+
+        if rows is None:
+            rows = np.flatnonzero(self._alive)
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block = rows[start : start + BLOCK_ROWS]
+            scores[start : start + len(block)] = self._vectors[block].astype(np.float32) @ q
+        return rows, scores
+
+    def _chunk(
+        self, row: int, score: float | None = None, with_vector: bool = False
+    ) -> RetrievedChunk:
+        assert self._vectors is not None
+        payload = self._payloads[row]
+        return RetrievedChunk(
+            chunk_id=self._ids[row],
+            source="",
+            text="",
+            doc_id=payload.get("doc_id"),
+            chunk_index=payload.get("chunk_index"),
+            page_number=payload.get("page_number"),
+            sha256=payload.get("sha256"),
+            score=score,
+            vector=self._vectors[row].astype(np.float32).tolist() if with_vector else None,
+        )
+
+    def _hydrate(self, chunks: list[RetrievedChunk]) -> list[RetrievedChunk]:
+        missing = _missing_text(chunks)
+        rows = self.chunk_loader(missing) if self.chunk_loader and missing else {}
+        return _merge_texts(chunks, rows)
+
+    def retrieve(self, ids: list[str]) -> list[RetrievedChunk]:
+        with self._locked(exclusive=False):
+            chunks = [self._chunk(self._row_of[i]) for i in ids if i in self._row_of]
+        return self._hydrate(chunks)
+
+    def expand_neighbors(self, hits: list[RetrievedChunk], window: int) -> list[RetrievedChunk]:
+        if window <= 0 or not hits:
+            return hits
+        return merge_neighbors(hits, self.retrieve(neighbor_ids(hits, window)), window)
+
+    def search(
+        self,
+        query_vector: list[float],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[RetrievedChunk]:
+        try:
+            with self._locked(exclusive=False):
+                candidates = self._candidate_rows(doc_ids, sha256s, scopes, metadata)
+                rows, scores = self._scores(query_vector, candidates)
+                k = min(top_k, len(rows))
+                if k == 0:
+                    return []
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                chunks = [self._chunk(int(rows[i]), float(scores[i]), with_vectors) for i in top]
+            return self._hydrate(chunks)
+        except Exception as e:
+            raise VectorStoreError(f"Vector search failed: {e}") from e
+
+    def search_batch(
+        self,
+        query_vectors: list[list[float]],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_texts: list[str] | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[RetrievedChunk]]:
+        try:
+            lists: list[list[RetrievedChunk]] = []
+            with self._locked(exclusive=False):
+                candidates = self._candidate_rows(doc_ids, sha256s, scopes, metadata)
+                for qvec in query_vectors:
+                    rows, scores = self._scores(qvec, candidates)
+                    k = min(top_k, len(rows))
+                    if k == 0:
+                        lists.append([])
+                        continue
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    top = top[np.argsort(-scores[top])]
+                    lists.append(
+                        [self._chunk(int(rows[i]), float(scores[i]), with_vectors) for i in top]
+                    )
+            return _rehydrate_lists(lists, self._hydrate(_unique(lists)))
+        except Exception as e:
+            raise VectorStoreError(f"Vector batch search failed: {e}") from e
+
+    def search_grouped(
+        self,
+        query_vector: list[float],
+        top_k_groups: int,
+        group_size: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+    ) -> list[RetrievedChunk]:
+        try:
+            with self._locked(exclusive=False):
+                candidates = self._candidate_rows(doc_ids, sha256s, scopes, metadata)
+                rows, scores = self._scores(query_vector, candidates)
+                groups: dict[str, list[int]] = {}
+                # Walk rows best-first; groups are ordered by their best hit like Qdrant's.
+                for i in np.argsort(-scores):
+                    row = int(rows[i])
+                    key = self._payloads[row].get("sha256") or ""
+                    hits = groups.get(key)
+                    if hits is None:
+                        if len(groups) >= top_k_groups:
+                            continue
+                        hits = groups[key] = []
+                    if len(hits) < group_size:
+                        hits.append(int(i))
+                chunks = [
+                    self._chunk(int(rows[i]), float(scores[i]))
+                    for hits in groups.values()
+                    for i in hits
+                ]
+            return self._hydrate(chunks)
+        except Exception as e:
+            raise VectorStoreError(f"Vector search groups failed: {e}") from e
+
+
+class AsyncNumpyVectorStore:
+    """
+    Async facade over a `NumpyVectorStore` so the query path has one interface for both
+    backends. Searches are CPU-bound and run in worker threads.
+    """
+
+    hybrid = False
+    similarity_scores = True
+
+    def __init__(self, store: NumpyVectorStore) -> None:
+        self.store = store
+
+    async def retrieve(self, ids: list[str]) -> list[RetrievedChunk]:
+        return await asyncio.to_thread(self.store.retrieve, ids)
+
+    async def expand_neighbors(
+        self, hits: list[RetrievedChunk], window: int
+    ) -> list[RetrievedChunk]:
+        return await asyncio.to_thread(self.store.expand_neighbors, hits, window)
+
+    async def delete_by_doc_id(self, doc_id: str) -> None:
+        await asyncio.to_thread(self.store.delete_by_doc_id, doc_id)
+
+    async def delete_by_sha256s(self, sha256s: list[str]) -> None:
+        await asyncio.to_thread(self.store.delete_by_sha256s, sha256s)
+
+    async def search(
+        self,
+        query_vector: list[float],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[RetrievedChunk]:
+        return await asyncio.to_thread(
+            self.store.search,
+            query_vector, top_k, doc_ids, sha256s, query_text, scopes, metadata, with_vectors,
+        )
+
+    async def search_batch(
+        self,
+        query_vectors: list[list[float]],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_texts: list[str] | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[RetrievedChunk]]:
+        return await asyncio.to_thread(
+            self.store.search_batch,
+            query_vectors, top_k, doc_ids, sha256s, query_texts, scopes, metadata, with_vectors,
+        )
+
+    async def search_grouped(
+        self,
+        query_vector: list[float],
+        top_k_groups: int,
+        group_size: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+    ) -> list[RetrievedChunk]:
+        return await asyncio.to_thread(
+            self.store.search_grouped,
+            query_vector, top_k_groups, group_size, doc_ids, sha256s, query_text, scopes, metadata,
+        )
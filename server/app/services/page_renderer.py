@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Literal
+
+from app.domain.errors import RenderError, RenderRequestError
+
+logger = logging.getLogger(__name__)
+
+ImageFormat = Literal["png", "webp"]
+
+MEDIA_TYPES: dict[str, str] = {"png": "image/png", "webp": "image/webp"}
+
+
+@dataclass(frozen=True)
+class RenderKey:
+    sha256: str
+    page_number: int
+    dpi: int
+    fmt: ImageFormat = "png"
+    clip: tuple[float, float, float, float] | None = None
+
+    def filename(self) -> str:
+        # Clipped renders get a short digest suffix so they never collide with full pages.
+        suffix = ""
+        if self.clip:
+            digest = hashlib.sha1(",".join(f"{v:.2f}" for v in self.clip).encode()).hexdigest()
+            suffix = f"-c{digest[:12]}"
+        return f"{self.sha256}-p{self.page_number}-d{self.dpi}{suffix}.{self.fmt}"
+
+
+def _render_page(
+    pdf_path: str,
+    page_number: int,
+    dpi: int,
+    fmt: str,
+    clip: tuple[float, float, float, float] | None,
+) -> bytes:
+    """
+    Renders one page (1-based) to image bytes. Runs inside a worker process.
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(pdf_path) as doc:
+        if page_number < 1 or page_number > len(doc):
+            raise ValueError(f"Page {page_number} out of range (1-{len(doc)})")
+        page = doc[page_number - 1]
+        rect = fitz.Rect(*clip) & page.rect if clip else None
+        if rect is not None and rect.is_empty:
+            raise ValueError("Clip region does not intersect the page")
+        pix = page.get_pixmap(dpi=dpi, clip=rect, alpha=False)
+
+        if fmt == "png":
+            return pix.tobytes("png")
+
+        from PIL import Image
+
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        buf = io.BytesIO()
+        img.save(buf, format="WEBP", quality=85, method=4)
+        return buf.getvalue()
+
+
+class DiskLRUCache:
+    """
+    Size-bounded file cache. Recency is tracked in memory and seeded from file mtimes on startup.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int) -> None:
+        self.base = Path(cache_dir)
+        self.base.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total = 0
+
+        existing = sorted(
+            (p for p in self.base.iterdir() if p.is_file() and not p.name.endswith(".tmp")),
+            key=lambda p: p.stat().st_mtime,
+        )
+        for p in existing:
+            size = p.stat().st_size
+            self._entries[p.name] = size
+            self._total += size
+        self._evict()
+
+    def get(self, name: str) -> bytes | None:
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self.base / name
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                size = self._entries.pop(name, 0)
+                self._total -= size
+            return None
+
+    def put(self, name: str, data: bytes) -> None:
+        path = self.base / name
+        tmp = path.with_name(f"{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._total -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._total += len(data)
+            self._evict()
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._entries
+
+    def _evict(self) -> None:
+        while self._total > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                (self.base / name).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Failed to evict render cache entry {name}: {e}")
+
+
+class PageRenderer:
+    def __init__(self, cache_dir: str, max_cache_mb: int, max_workers: int) -> None:
+        self.cache = DiskLRUCache(cache_dir, max_cache_mb * 1024 * 1024)
+        self.max_workers = max_workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        self._inflight: dict[str, asyncio.Task[bytes]] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    async def render(self, pdf_path: str, key: RenderKey) -> bytes:
+        """
+        Returns the rendered image for `key`, rendering in the worker pool on a cache miss.
+        Concurrent requests for the same key share a single render, which keeps running
+        when any one of them is cancelled (e.g. its client disconnected).
+        """
+        name = key.filename()
+        cached = await asyncio.to_thread(self.cache.get, name)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(name)
+        if task is None:
+            task = asyncio.create_task(self._render(pdf_path, key))
+            self._inflight[name] = task
+            task.add_done_callback(lambda t: self._render_done(name, t))
+        return await asyncio.shield(task)
+
+    async def _render(self, pdf_path: str, key: RenderKey) -> bytes:
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(
+                self._get_pool(),
+                _render_page,
+                pdf_path,
+                key.page_number,
+                key.dpi,
+                key.fmt,
+                key.clip,
+            )
+            await asyncio.to_thread(self.cache.put, key.filename(), data)
+            return data
+        except ValueError as e:
+            raise RenderRequestError(str(e)) from e
+        except Exception as e:
+            raise RenderError(f"Failed to render page {key.page_number}: {e}") from e
+
+    def _render_done(self, name: str, task: asyncio.Task[bytes]) -> None:
+        if self._inflight.get(name) is task:
+            del self._inflight[name]
+        if not task.cancelled():
+            # Mark the exception as retrieved when every requester had already gone.
+            task.exception()
+
+    async def warm(self, pdf_path: str, keys: list[RenderKey]) -> int:
+        """
+        Renders any keys that are not cached yet. Returns how many renders were performed.
+        """
+        missing = [k for k in keys if k.filename() not in self.cache]
+        results = await asyncio.gather(
+            *(self.render(pdf_path, k) for k in missing), return_exceptions=True
+        )
+        for k, r in zip(missing, results, strict=True):
+            if isinstance(r, Exception):
+                logger.warning(f"Render warm-up failed for {k.filename()}: {r}")
+        return sum(1 for r in results if not isinstance(r, Exception))
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
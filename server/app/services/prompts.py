@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from app.services.context_pack import build_context_pack
+from app.services.tokens import count_tokens
+
+# Static instructions shared by every generation request. They lead the prompt unchanged
+# so the provider's prompt cache can reuse them; everything per-query comes after.
+GENERATION_SYSTEM_PROMPT = """
+You are DocuAgent, an advanced AI research assistant.
+Your goal is to answer the user's question using ONLY the provided context chunks.
+
+Intents and how to handle them:
+- QA: Answer the question directly and accurately based on the evidence.
+- SUMMARIZE: Focus on providing a comprehensive yet concise overview. Capture the main themes
+  and key points.
+- EXTRACT: Focus on precision. List the extracted data clearly, preferably in bullet points or
+  a structured format.
+
+Guidelines:
+1. **Groundedness**: Use ONLY the context provided. Do not hallucinate. If the answer is not in
+   the context, set `needs_clarification` to true.
+2. **Citations**: You MUST cite your sources. Every distinct claim should have a citation
+   pointing to the specific chunk. Chunks are marked `[chunk_id=...]` under a
+   `### source=... | page=...` header giving their source and page; a marker listing several
+   ids means the text belongs to each of them, so cite any one.
+3. **Tone**: Professional, helpful, and concise. Use Markdown for readability.
+4. **Analysis**: Synthesize information from multiple chunks if necessary. Handle conflicts by
+   noting the discrepancy.
+
+Return ONLY JSON (no markdown fences) with:
+- answer: string (Markdown supported)
+- citations: array of {"chunk_id":"...","source":"...","page_number":123,"quote":"..."}
+  - quote must be short (<= ~25 words) and exact from the text.
+- needs_clarification: boolean
+- clarifying_question: string | null (Ask ONE specific question if context is missing)
+- reaction: string | null (Any single emoji that reflects the nature of the answer/finding)
+""".strip()
+
+# Marker line and separators the context pack adds per chunk.
+CHUNK_OVERHEAD_TOKENS = 12
+
+
+@dataclass(frozen=True)
+class GenerationPrompt:
+    messages: list[dict]
+    # Chunks that fit the budget, in retrieval order
+    chunks: list[dict]
+    prompt_tokens: int
+    context_tokens: int
+
+
+def chunk_tokens(chunk: dict) -> int:
+    """
+    Token count cached at ingestion, counted locally for chunks stored before that.
+    """
+    cached = chunk.get("token_count")
+    return cached if cached is not None else count_tokens(chunk["text"])
+
+
+def fit_to_budget(chunks: list[dict], budget: int) -> list[dict]:
+    """
+    Fills `budget` tokens in the given order, which is already the ranking (MMR's when it
+    ran), skipping chunks that no longer fit. The first chunk is always kept.
+    """
+    kept: list[dict] = []
+    used = 0
+    for c in chunks:
+        cost = chunk_tokens(c) + CHUNK_OVERHEAD_TOKENS
+        if kept and used + cost > budget:
+            continue
+        kept.append(c)
+        used += cost
+    return kept
+
+
+def build_generation_prompt(
+    question: str, chunks: list[dict], intent: str, budget: int
+) -> GenerationPrompt:
+    """
+    System prefix, then context, then the question: the parts most likely to repeat
+    across queries come first.
+    """
+    selected = fit_to_budget(chunks, budget)
+    context_pack = build_context_pack(selected)
+    user = f"""
+Context:
+{context_pack}
+
+Intent: {intent.upper()}
+
+User request:
+{question}
+""".strip()
+    return GenerationPrompt(
+        messages=[
+            {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
+            {"role": "user", "content": user},
+        ],
+        chunks=selected,
+        prompt_tokens=count_tokens(GENERATION_SYSTEM_PROMPT) + count_tokens(user),
+        context_tokens=count_tokens(context_pack),
+    )
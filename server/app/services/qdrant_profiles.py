@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Literal
+
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
+    HnswConfigDiff,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+)
+
+
+@dataclass(frozen=True)
+class QdrantProfile:
+    """
+    Storage and index settings for the collection. Unset HNSW fields keep Qdrant's defaults.
+    """
+
+    name: str
+    quantization: Literal["none", "scalar", "binary"] = "none"
+    # Keep the quantized copy in RAM even when the original vectors live on disk.
+    quantization_always_ram: bool = True
+    oversampling: float | None = None
+    rescore: bool = True
+    hnsw_m: int | None = None
+    hnsw_ef_construct: int | None = None
+    hnsw_ef: int | None = None
+    # Links of the per-tenant (folder scope) graphs; None builds none.
+    hnsw_payload_m: int | None = None
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+
+    def quantization_config(self) -> ScalarQuantization | BinaryQuantization | None:
+        if self.quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=self.quantization_always_ram,
+                )
+            )
+        if self.quantization == "binary":
+            return BinaryQuantization(
+                binary=BinaryQuantizationConfig(always_ram=self.quantization_always_ram)
+            )
+        return None
+
+    def quantization_diff(self) -> ScalarQuantization | BinaryQuantization | Disabled:
+        """
+        Like `quantization_config`, but explicitly disables quantization for existing collections.
+        """
+        return self.quantization_config() or Disabled.DISABLED
+
+    def hnsw_config(self) -> HnswConfigDiff | None:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None and self.hnsw_payload_m is None:
+            return None
+        return HnswConfigDiff(
+            m=self.hnsw_m, ef_construct=self.hnsw_ef_construct, payload_m=self.hnsw_payload_m
+        )
+
+    def search_params(self) -> SearchParams | None:
+        quantization = None
+        if self.quantization != "none":
+            quantization = QuantizationSearchParams(
+                ignore=False,
+                rescore=self.rescore,
+                oversampling=self.oversampling,
+            )
+        if self.hnsw_ef is None and quantization is None:
+            return None
+        return SearchParams(hnsw_ef=self.hnsw_ef, quantization=quantization)
+
+
+PROFILES: dict[str, QdrantProfile] = {
+    # Qdrant defaults: float32 vectors and payload in RAM, no quantization.
+    "default": QdrantProfile(name="default"),
+    # int8 copies in RAM (~4x smaller), full vectors on disk for rescoring.
+    "balanced": QdrantProfile(
+        name="balanced",
+        quantization="scalar",
+        oversampling=2.0,
+        hnsw_m=16,
+        hnsw_ef_construct=128,
+        hnsw_ef=128,
+        on_disk_vectors=True,
+        on_disk_payload=True,
+    ),
+    # 1-bit copies in RAM (~32x smaller); relies on oversampling + rescoring for recall.
+    "low_memory": QdrantProfile(
+        name="low_memory",
+        quantization="binary",
+        oversampling=3.0,
+        hnsw_m=16,
+        hnsw_ef_construct=100,
+        hnsw_ef=128,
+        on_disk_vectors=True,
+        on_disk_payload=True,
+    ),
+    # Denser graph and wider search for the best recall; everything stays in RAM.
+    "high_recall": QdrantProfile(
+        name="high_recall",
+        quantization="scalar",
+        oversampling=1.5,
+        hnsw_m=32,
+        hnsw_ef_construct=256,
+        hnsw_ef=256,
+    ),
+    # Qdrant's multitenancy layout: no global graph (m=0), one graph per folder scope.
+    # Folder queries stay fast as the corpus grows; queries over every document fall
+    # back to a full scan, so use it when most queries are folder-scoped.
+    "multitenant": QdrantProfile(
+        name="multitenant",
+        hnsw_m=0,
+        hnsw_payload_m=16,
+    ),
+}
+
+
+def get_profile(name: str) -> QdrantProfile:
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown Qdrant profile '{name}'. Expected one of: {', '.join(sorted(PROFILES))}"
+        ) from None
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+import numpy as np
+
+from app.settings import settings
+
+# Index key for entries whose scope is every document (no doc or folder given).
+ANY_SCOPE = "*"
+
+# Tokens with a digit (numbers, dates, invoice and part numbers), all-caps codes
+# (ACME, EU-27) and double-quoted strings.
+_IDENTIFIER_RE = re.compile(r'"[^"]+"|\w*\d[\w./:-]*|\b[A-Z][A-Z0-9_-]+\b')
+
+
+def normalize_question(question: str) -> str:
+    """
+    Case, whitespace and trailing punctuation do not change what is retrieved.
+    """
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!.").strip().lower()
+
+
+def question_identifiers(question: str) -> frozenset[str]:
+    """
+    Numbers, dates, codes and quoted strings in the question. Embeddings barely tell
+    "invoice 1042" from "invoice 1043", so cached answers are only reused when these match.
+    """
+    return frozenset(m.strip('"').casefold() for m in _IDENTIFIER_RE.findall(question))
+
+
+def scope_fingerprint(sha256s: list[str] | set[str] | None) -> str:
+    """
+    Stable id of the set of content hashes a query searches; None means every document.
+    """
+    if sha256s is None:
+        return ANY_SCOPE
+    return hashlib.sha1(",".join(sorted(set(sha256s))).encode()).hexdigest()
+
+
+class ScopedTTLCache[V]:
+    """
+    TTL + LRU cache whose entries are tagged with the content hashes they were computed
+    from, so a change to any of those documents drops them. Entries tagged None depend
+    on every document.
+
+    `version()` taken before computing a value and passed to `put()` keeps results that
+    raced with an invalidation out of the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float) -> None:
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[float, V, tuple[str, ...]]] = OrderedDict()
+        self._by_sha256: dict[str, set[Hashable]] = {}
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(
+        self,
+        key: Hashable,
+        value: V,
+        sha256s: list[str] | set[str] | None,
+        version: int | None = None,
+    ) -> None:
+        if self.maxsize <= 0:
+            return
+        tags = (ANY_SCOPE,) if sha256s is None else tuple(sorted(set(sha256s)))
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_s, value, tags)
+            for tag in tags:
+                self._by_sha256.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def items(self) -> list[tuple[Hashable, V]]:
+        """
+        Live entries, oldest first.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [(k, e[1]) for k, e in self._entries.items() if e[0] >= now]
+
+    def record_lookup(self, hit: Hashable | None) -> None:
+        """
+        Counts a lookup made through `items()` instead of `get()`; `hit` is the key it
+        returned, which becomes the most recently used entry.
+        """
+        with self._lock:
+            if hit is None:
+                self.misses += 1
+                return
+            self.hits += 1
+            if hit in self._entries:
+                self._entries.move_to_end(hit)
+
+    def invalidate(self, sha256s: list[str] | set[str]) -> int:
+        """
+        Drops every entry computed from any of the hashes (and every all-documents entry).
+        Returns the number of entries dropped.
+        """
+        with self._lock:
+            self._version += 1
+            keys: set[Hashable] = set(self._by_sha256.get(ANY_SCOPE, ()))
+            for sha256 in sha256s:
+                keys |= self._by_sha256.get(sha256, set())
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._by_sha256.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
+
+    def _drop(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._by_sha256.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_sha256[tag]
+
+
+class SemanticAnswerCache:
+    """
+    Finished answers per scope, looked up by question embedding: a new question reuses
+    the answer of the most similar cached question in the same scope if their cosine
+    similarity reaches `threshold` and both name the same identifiers.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float, threshold: float) -> None:
+        self.threshold = threshold
+        self._cache: ScopedTTLCache[tuple[np.ndarray, frozenset[str], dict]] = ScopedTTLCache(
+            maxsize, ttl_s
+        )
+
+    def version(self) -> int:
+        return self._cache.version()
+
+    def lookup(
+        self, scope_key: Hashable, question: str, vector: list[float]
+    ) -> tuple[dict, float] | None:
+        """
+        The best cached answer for the scope and its similarity, if above the threshold.
+        """
+        q = _unit(vector)
+        idents = question_identifiers(question)
+        best: tuple[dict, float] | None = None
+        best_key: Hashable | None = None
+        for key, (cached_vec, cached_idents, answer) in self._cache.items():
+            if key[0] != scope_key or cached_idents != idents:
+                continue
+            sim = float(cached_vec @ q)
+            if sim >= self.threshold and (best is None or sim > best[1]):
+                best, best_key = (answer, sim), key
+        self._cache.record_lookup(best_key)
+        return best
+
+    def put(
+        self,
+        scope_key: Hashable,
+        question: str,
+        vector: list[float],
+        answer: dict,
+        sha256s: list[str] | set[str] | None,
+        version: int | None = None,
+    ) -> None:
+        value = (_unit(vector), question_identifiers(question), answer)
+        self._cache.put((scope_key, normalize_question(question)), value, sha256s, version)
+
+    def invalidate(self, sha256s: list[str] | set[str]) -> int:
+        return self._cache.invalidate(sha256s)
+
+    def stats(self) -> dict[str, Any]:
+        return self._cache.stats()
+
+
+def _unit(vector: list[float]) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    return v / max(float(np.linalg.norm(v)), 1e-12)
+
+
+# Process-wide caches; every worker process keeps its own.
+retrieval_cache: ScopedTTLCache[dict] = ScopedTTLCache(
+    settings.retrieval_cache_size, settings.retrieval_cache_ttl_s
+)
+answer_cache = SemanticAnswerCache(
+    settings.answer_cache_size, settings.answer_cache_ttl_s, settings.answer_cache_threshold
+)
+
+
+def invalidate_documents(sha256s: list[str] | set[str]) -> None:
+    """
+    Call after documents with these hashes were ingested, moved or deleted.
+    """
+    retrieval_cache.invalidate(sha256s)
+    answer_cache.invalidate(sha256s)
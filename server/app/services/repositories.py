@@ -4,9 +4,12 @@ import datetime as dt
 import uuid
 from typing import Sequence
 
+from sqlalchemy import and_, delete, func, or_
+from sqlalchemy.dialects.postgresql import insert
 from sqlmodel import Session, col, desc, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.services.models import ChatMessage, ChatThread, Document, Folder
+from app.services.models import ChatMessage, ChatThread, Chunk, Document, Folder, VectorDeletion
 
 
 class FolderRepo:
@@ -60,6 +63,27 @@ class DocumentRepo:
         stmt = select(Document).where(Document.sha256 == sha256)
         return self.session.exec(stmt).first()
     
+    def referenced_sha256s(self, sha256s: list[str]) -> set[str]:
+        """
+        The subset of hashes still referenced by at least one document.
+        """
+        if not sha256s:
+            return set()
+        stmt = select(Document.sha256).where(col(Document.sha256).in_(sha256s)).distinct()
+        return set(self.session.exec(stmt).all())
+
+    def folders_by_sha256(self, sha256s: list[str]) -> dict[str, set[int | None]]:
+        """
+        Folder ids (None for root) of the documents referencing each hash.
+        """
+        if not sha256s:
+            return {}
+        stmt = select(Document.sha256, Document.folder_id).where(col(Document.sha256).in_(sha256s)).distinct()
+        out: dict[str, set[int | None]] = {}
+        for sha256, folder_id in self.session.exec(stmt).all():
+            out.setdefault(sha256, set()).add(folder_id)
+        return out
+
     def get_by_folder(self, folder_id: int) -> Sequence[Document]:
         stmt = select(Document).where(Document.folder_id == folder_id)
         return self.session.exec(stmt).all()
@@ -155,12 +179,196 @@ class DocumentRepo:
         return doc
 
 
+class ChunkRepo:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def upsert_many(self, rows: list[dict]) -> None:
+        """
+        Inserts chunk rows, overwriting existing ones so retried ingestion steps stay idempotent.
+        Rows are shared by every document with the same content hash, so the document fields
+        (`doc_id`, `source`) keep their first value; queries resolve them per document.
+        """
+        if not rows:
+            return
+        stmt = insert(Chunk).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Chunk.chunk_id],
+            set_={
+                "sha256": stmt.excluded.sha256,
+                "chunk_index": stmt.excluded.chunk_index,
+                "page_number": stmt.excluded.page_number,
+                "text": stmt.excluded.text,
+                "token_count": stmt.excluded.token_count,
+            },
+        )
+        self.session.exec(stmt)
+        self.session.commit()
+
+    def get_many(self, chunk_ids: list[str]) -> Sequence[Chunk]:
+        if not chunk_ids:
+            return []
+        stmt = select(Chunk).where(col(Chunk.chunk_id).in_(chunk_ids))
+        return self.session.exec(stmt).all()
+
+    def delete_by_sha256s(self, sha256s: list[str], commit: bool = True) -> None:
+        if not sha256s:
+            return
+        self.session.exec(delete(Chunk).where(col(Chunk.sha256).in_(sha256s)))
+        if commit:
+            self.session.commit()
+
+
+class AsyncDocumentRepo:
+    """
+    Read-only document lookups for the async query path.
+    """
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def get_by_doc_id(self, doc_id: str) -> Document | None:
+        stmt = select(Document).where(Document.doc_id == doc_id)
+        return (await self.session.exec(stmt)).first()
+
+    async def first_by_sha256s(self, sha256s: list[str]) -> dict[str, Document]:
+        """
+        The oldest document referencing each hash.
+        """
+        if not sha256s:
+            return {}
+        stmt = (
+            select(Document)
+            .where(col(Document.sha256).in_(sha256s))
+            .order_by(col(Document.created_at))
+        )
+        out: dict[str, Document] = {}
+        for doc in (await self.session.exec(stmt)).all():
+            out.setdefault(doc.sha256, doc)
+        return out
+
+    async def get_by_folder(self, folder_id: int) -> Sequence[Document]:
+        stmt = select(Document).where(Document.folder_id == folder_id)
+        return (await self.session.exec(stmt)).all()
+
+
+class AsyncChunkRepo:
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def get_many(self, chunk_ids: list[str]) -> Sequence[Chunk]:
+        if not chunk_ids:
+            return []
+        stmt = select(Chunk).where(col(Chunk.chunk_id).in_(chunk_ids))
+        return (await self.session.exec(stmt)).all()
+
+    async def search_text(
+        self,
+        query: str,
+        limit: int,
+        sha256s: list[str] | None = None,
+        page_ranges: Sequence[tuple[int, int | None]] = (),
+        chunk_index_gte: int | None = None,
+        chunk_index_lte: int | None = None,
+    ) -> Sequence[Chunk]:
+        """
+        Full-text matches for `query` on the GIN-indexed tsvector, best `ts_rank_cd` first.
+        """
+        tsquery = func.websearch_to_tsquery("english", query)
+        stmt = select(Chunk).where(col(Chunk.text_tsv).op("@@")(tsquery))
+        if sha256s:
+            stmt = stmt.where(col(Chunk.sha256).in_(sha256s))
+        if page_ranges:
+            page = col(Chunk.page_number)
+            stmt = stmt.where(
+                or_(*(
+                    and_(page >= start, page <= end) if end is not None else page >= start
+                    for start, end in page_ranges
+                ))
+            )
+        if chunk_index_gte is not None:
+            stmt = stmt.where(col(Chunk.chunk_index) >= chunk_index_gte)
+        if chunk_index_lte is not None:
+            stmt = stmt.where(col(Chunk.chunk_index) <= chunk_index_lte)
+        stmt = stmt.order_by(desc(func.ts_rank_cd(col(Chunk.text_tsv), tsquery))).limit(limit)
+        return (await self.session.exec(stmt)).all()
+
+
+class VectorDeletionRepo:
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def enqueue(self, docs: Sequence[Document]) -> None:
+        """
+        Queues the content hashes of deleted or moved documents for the background vector
+        flush, which drops unreferenced hashes and resyncs the folder scopes of the rest.
+        """
+        self.enqueue_sha256s({d.sha256: d.storage_path for d in docs})
+
+    def enqueue_sha256s(self, storage_paths: dict[str, str | None]) -> None:
+        """
+        Queues content hashes with their stored PDF paths.
+        """
+        rows = [{"sha256": s, "storage_path": path} for s, path in storage_paths.items()]
+        if not rows:
+            return
+        stmt = insert(VectorDeletion).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[VectorDeletion.sha256],
+            set_={"storage_path": stmt.excluded.storage_path},
+        )
+        self.session.exec(stmt)
+        self.session.commit()
+
+    def lock_sha256s(self, sha256s: list[str]) -> None:
+        """
+        Transaction-scoped advisory locks on content hashes, taken in sorted order. The flush
+        holds them from its reference check until its deletes commit, and uploads hold them
+        from storing the PDF until their document row commits, so neither sees the other
+        half done.
+        """
+        for sha256 in sorted(set(sha256s)):
+            self.session.exec(select(func.pg_advisory_xact_lock(func.hashtextextended(sha256, 0))))
+
+    def lock_batch(self, limit: int) -> Sequence[VectorDeletion]:
+        """
+        Locks up to `limit` queued hashes for the current transaction; rows locked by a
+        concurrent flush are skipped.
+        """
+        stmt = (
+            select(VectorDeletion)
+            .order_by(col(VectorDeletion.requested_at))
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return self.session.exec(stmt).all()
+
+    def remove(self, sha256s: list[str]) -> None:
+        if not sha256s:
+            return
+        self.session.exec(delete(VectorDeletion).where(col(VectorDeletion.sha256).in_(sha256s)))
+        self.session.commit()
+
+
 class ChatRepo:
     def __init__(self, session: Session) -> None:
         self.session = session
 
-    def create_thread(self, title: str, folder_id: int | None = None, document_id: int | None = None, parent_id: int | None = None, is_starred: bool = False) -> ChatThread:
-        thread = ChatThread(title=title, folder_id=folder_id, document_id=document_id, parent_id=parent_id, is_starred=is_starred)
+    def create_thread(
+        self,
+        title: str,
+        folder_id: int | None = None,
+        document_id: int | None = None,
+        parent_id: int | None = None,
+        is_starred: bool = False,
+    ) -> ChatThread:
+        thread = ChatThread(
+            title=title,
+            folder_id=folder_id,
+            document_id=document_id,
+            parent_id=parent_id,
+            is_starred=is_starred,
+        )
         self.session.add(thread)
         self.session.commit()
         self.session.refresh(thread)
@@ -169,7 +377,9 @@ class ChatRepo:
     def get_thread(self, thread_id: int) -> ChatThread | None:
         return self.session.get(ChatThread, thread_id)
 
-    def list_threads(self, folder_id: int | None = None, document_id: int | None = None) -> Sequence[ChatThread]:
+    def list_threads(
+        self, folder_id: int | None = None, document_id: int | None = None
+    ) -> Sequence[ChatThread]:
         stmt = select(ChatThread)
         
         if folder_id is not None:
@@ -177,14 +387,18 @@ class ChatRepo:
         elif document_id is not None:
              stmt = stmt.where(ChatThread.document_id == document_id)
         else:
-            # Root threads (folder_id is NULL) - this includes independent root chats AND chats attached to root documents
+            # Root threads (folder_id is NULL) - this includes independent root chats AND
+            # chats attached to root documents
             stmt = stmt.where(ChatThread.folder_id == None)
             
-        # We return all threads matching the context, frontend builds the tree using parent_id
+        # We return all threads matching the context, frontend builds the tree using
+        # parent_id
         stmt = stmt.order_by(desc(col(ChatThread.updated_at)))
         return self.session.exec(stmt).all()
 
-    def update_thread(self, thread_id: int, title: str | None = None, is_starred: bool | None = None) -> ChatThread | None:
+    def update_thread(
+        self, thread_id: int, title: str | None = None, is_starred: bool | None = None
+    ) -> ChatThread | None:
         thread = self.get_thread(thread_id)
         if thread:
             if title is not None:
@@ -203,7 +417,9 @@ class ChatRepo:
             self.session.delete(thread)
             self.session.commit()
 
-    def add_message(self, thread_id: int, role: str, content: str, citations: list[dict] | None = None) -> ChatMessage:
+    def add_message(
+        self, thread_id: int, role: str, content: str, citations: list[dict] | None = None
+    ) -> ChatMessage:
         msg = ChatMessage(thread_id=thread_id, role=role, content=content, citations=citations)
         self.session.add(msg)
         
@@ -231,7 +447,8 @@ class ChatRepo:
                 # Toggle logic: if user already reacted, remove it? 
                 # The requirement is "add chat reactions". "Unstar" implies toggle.
                 # Emoji pickers usually toggle.
-                # We need to track who reacted. Since no auth, we assume "user" is one entity and "agent" is another.
+                # We need to track who reacted. Since no auth, we assume "user" is one entity
+                # and "agent" is another.
                 if role == "user":
                     if r.get("user_reacted"):
                         r["user_reacted"] = False
@@ -266,5 +483,9 @@ class ChatRepo:
         return msg
 
     def get_messages(self, thread_id: int) -> Sequence[ChatMessage]:
-        stmt = select(ChatMessage).where(ChatMessage.thread_id == thread_id).order_by(col(ChatMessage.created_at))
+        stmt = (
+            select(ChatMessage)
+            .where(ChatMessage.thread_id == thread_id)
+            .order_by(col(ChatMessage.created_at))
+        )
         return self.session.exec(stmt).all()
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.services.vector_store import RetrievedChunk
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=-1, keepdims=True), 1e-12)
+
+
+def mmr(query_vector: list[float], candidate_vectors: np.ndarray, k: int, lambda_: float = 0.7) -> list[int]:
+    """
+    Maximal marginal relevance: greedily picks `k` candidates maximizing
+    `lambda * sim(query, c) - (1 - lambda) * max sim(c, already picked)`.
+    Returns candidate indices in pick order. All similarities come from one matrix product.
+    """
+    n = len(candidate_vectors)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    cands = _normalize(np.asarray(candidate_vectors, dtype=np.float32))
+    # Candidates may carry a truncated (Matryoshka) vector; compare on the same prefix.
+    q = _normalize(np.asarray(query_vector[: cands.shape[1]], dtype=np.float32))
+    relevance = cands @ q
+    pairwise = cands @ cands.T
+
+    picked = [int(np.argmax(relevance))]
+    # Highest similarity of every candidate to anything picked so far.
+    redundancy = pairwise[picked[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < k:
+        gain = lambda_ * relevance - (1 - lambda_) * redundancy
+        gain[~available] = -np.inf
+        best = int(np.argmax(gain))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return picked
+
+
+def mmr_rerank(query_vector: list[float], chunks: list[RetrievedChunk], k: int, lambda_: float = 0.7) -> list[RetrievedChunk]:
+    """
+    Diverse top-`k` of chunks retrieved with their vectors. Chunks without a vector are
+    kept in their original order after the reranked ones.
+    """
+    with_vec = [c for c in chunks if c.vector is not None]
+    if len(with_vec) <= 1:
+        return chunks[:k]
+    order = mmr(query_vector, np.asarray([c.vector for c in with_vec], dtype=np.float32), k, lambda_)
+    out = [with_vec[i] for i in order]
+    if len(out) < k:
+        out.extend(c for c in chunks if c.vector is None)
+    return out[:k]
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Any
+
+from app.settings import settings
+
+
+@dataclass
+class _Flight:
+    run_id: str
+    future: asyncio.Future
+    started: float
+
+
+class SingleFlight:
+    """
+    Coalesces identical queries running in this process: the first run leads and the
+    runs that join while it is in flight wait for its result instead of repeating the
+    work. A leader that fails releases its followers at once, and one that neither
+    finishes nor fails within `ttl_s` is replaced.
+
+    `join()` must be called from a memoized step: Inngest re-enters a function once per
+    step, possibly in another worker, and a run must keep the role it started with.
+    """
+
+    def __init__(self, ttl_s: float) -> None:
+        self.ttl_s = ttl_s
+        self._flights: dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+        self.shared = 0
+        self.failed = 0
+
+    def join(self, key: Hashable, run_id: str) -> bool:
+        """
+        True when `run_id` leads the flight for `key`, False when it should wait.
+        """
+        flight = self._flights.get(key)
+        if flight is not None and flight.run_id == run_id:
+            return True
+        now = time.monotonic()
+        stale = flight is not None and (flight.future.done() or now - flight.started > self.ttl_s)
+        if flight is None or stale:
+            future = asyncio.get_running_loop().create_future()
+            self._flights[key] = _Flight(run_id, future, now)
+            self.leaders += 1
+            return True
+        self.followers += 1
+        return False
+
+    async def wait(self, key: Hashable, timeout: float) -> dict | None:
+        """
+        The leader's result, or None if there is no flight in this process or it fails or
+        does not finish in time; the caller then answers the query itself.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            return None
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight.future), timeout)
+        except (TimeoutError, asyncio.CancelledError):
+            return None
+        if result is None:
+            return None
+        self.shared += 1
+        return result
+
+    def finish(self, key: Hashable, run_id: str, result: dict) -> None:
+        flight = self._flights.get(key)
+        if flight is None or flight.run_id != run_id:
+            return
+        del self._flights[key]
+        if not flight.future.done():
+            flight.future.set_result(result)
+
+    def fail(self, key: Hashable, run_id: str) -> None:
+        """
+        Ends the leader's flight without a result; its followers stop waiting.
+        """
+        flight = self._flights.get(key)
+        if flight is None or flight.run_id != run_id:
+            return
+        del self._flights[key]
+        self.failed += 1
+        if not flight.future.done():
+            flight.future.set_result(None)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "shared": self.shared,
+            "failed": self.failed,
+        }
+
+
+# Process-wide registry for agent queries.
+query_flights = SingleFlight(settings.single_flight_timeout_s)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import re
+import zlib
+from collections import Counter
+
+from qdrant_client.models import SparseVector
+
+# Letters and digits of any script. Keeps identifiers such as "INV-2024-0042", "4.2.1" or
+# "part_no" together as one token.
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[-_./:#][^\W_]+)*")
+_SPLIT_RE = re.compile(r"[-_./:#]")
+# Han, Hiragana and Katakana are written without spaces between words.
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+_STOPWORDS = frozenset(
+    """
+    a an and are as at be been but by can did do does for from had has have how i if in into is
+    it its me my no not of on or our she so than that the their them then there these they this
+    to was we were what when where which who why will with you your
+    """.split()
+)
+
+
+def _cjk_bigrams(run: str) -> list[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i : i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Case-folded word tokens without stopwords. Compound identifiers are emitted both whole
+    and split into their parts, so "INV-2024-0042" also matches a query for "0042". Runs of
+    CJK characters become overlapping character bigrams, since they have no word breaks.
+    """
+    tokens: list[str] = []
+    for tok in _TOKEN_RE.findall(text.casefold()):
+        if tok in _STOPWORDS:
+            continue
+        if _CJK_RE.search(tok):
+            for part in _CJK_RE.split(tok):
+                if part:
+                    tokens.extend(tokenize(part))
+            for run in _CJK_RE.findall(tok):
+                tokens.extend(_cjk_bigrams(run))
+            continue
+        tokens.append(tok)
+        parts = _SPLIT_RE.split(tok)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p and p not in _STOPWORDS)
+    return tokens
+
+
+def _term_id(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8"))
+
+
+class BM25SparseEncoder:
+    """
+    BM25 term-frequency weights computed locally. The IDF part is applied by Qdrant through
+    the sparse vector's IDF modifier, so document weights never need re-computing as the
+    corpus grows.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_len: float = 180.0) -> None:
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_len = avg_doc_len
+
+    def _to_vector(self, weights: dict[int, float]) -> SparseVector:
+        indices = sorted(weights)
+        return SparseVector(indices=indices, values=[weights[i] for i in indices])
+
+    def encode_document(self, text: str) -> SparseVector:
+        tokens = tokenize(text)
+        norm = self.k1 * (1 - self.b + self.b * len(tokens) / self.avg_doc_len)
+        weights: dict[int, float] = {}
+        for token, tf in Counter(tokens).items():
+            # Hash collisions are rare at 32 bits; colliding terms simply share a weight.
+            tid = _term_id(token)
+            weights[tid] = weights.get(tid, 0.0) + tf * (self.k1 + 1) / (tf + norm)
+        return self._to_vector(weights)
+
+    def encode_query(self, text: str) -> SparseVector:
+        return self._to_vector({_term_id(t): 1.0 for t in set(tokenize(text))})
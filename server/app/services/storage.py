@@ -15,6 +15,10 @@ class StoredFile:
     size_bytes: int
 
 
+def content_sha256(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
 class LocalStorage:
     def __init__(self, uploads_dir: str) -> None:
         self.base = Path(uploads_dir)
@@ -22,7 +26,7 @@ class LocalStorage:
 
     def save_pdf(self, filename: str, file_bytes: bytes) -> StoredFile:
         try:
-            sha = hashlib.sha256(file_bytes).hexdigest()
+            sha = content_sha256(file_bytes)
             safe_name = filename.replace("/", "_").replace("\\", "_")
             ext = Path(safe_name).suffix.lower() or ".pdf"
             path = self.base / f"{sha}{ext}"
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import logging
+from functools import lru_cache
+
+import tiktoken
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Characters per token for the estimate used when no encoding could be loaded.
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str) -> tiktoken.Encoding | None:
+    # tiktoken downloads the encoding on first use. A failure is cached too, so requests
+    # fall back to the estimate instead of retrying the download.
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"Could not load the tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+
+def load_encoding(model: str | None = None) -> bool:
+    """
+    Loads the chat model's encoding ahead of the first request; False if it is unavailable.
+    """
+    return _encoding(model or settings.chat_model) is not None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    """
+    Token count of `text` for the chat model, computed locally. Estimated from its length
+    when the encoding could not be loaded.
+    """
+    encoding = _encoding(model or settings.chat_model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,19 +1,54 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Awaitable, Callable, Iterator
+from dataclasses import dataclass, field, replace
+from typing import TYPE_CHECKING, Any
 
-from qdrant_client import QdrantClient
+import httpx
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.models import (
+    CollectionParamsDiff,
     Distance,
     FieldCondition,
     Filter,
+    Fusion,
+    FusionQuery,
+    IntegerIndexParams,
+    IntegerIndexType,
+    KeywordIndexParams,
+    KeywordIndexType,
     MatchAny,
     MatchValue,
+    Modifier,
     PointStruct,
+    Prefetch,
+    QueryRequest,
+    Range,
+    SetPayload,
+    SetPayloadOperation,
+    SparseVector,
+    SparseVectorParams,
     VectorParams,
+    VectorParamsDiff,
 )
+from sqlmodel import Session
 
 from app.domain.errors import VectorStoreError
+from app.services.db import async_session, engine
+from app.services.qdrant_profiles import QdrantProfile, get_profile
+from app.services.repositories import AsyncChunkRepo, ChunkRepo, DocumentRepo
+from app.services.sparse import BM25SparseEncoder
+from app.settings import settings
+
+if TYPE_CHECKING:
+    from app.services.numpy_store import AsyncNumpyVectorStore, NumpyVectorStore
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -24,44 +59,804 @@ class RetrievedChunk:
     doc_id: str | None = None
     chunk_index: int | None = None
     page_number: int | None = None
+    sha256: str | None = None
+    score: float | None = None
+    token_count: int | None = None
+    # Dense vector (the truncated one when the collection has it), only filled when a search
+    # asks for it, e.g. for MMR reranking.
+    vector: list[float] | None = field(default=None, repr=False, compare=False)
+
+
+def chunk_point_id(owner: str, chunk_index: int) -> str:
+    """
+    Deterministic point/chunk id. The owner is the content hash (or the doc_id for points
+    ingested before vector sets were shared per hash).
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{owner}:{chunk_index}"))
+
+
+# Maps chunk ids to (source, text, token_count); chunk text lives in Postgres, not in the
+# Qdrant payload.
+ChunkRow = tuple[str, str, int | None]
+ChunkLoader = Callable[[list[str]], dict[str, ChunkRow]]
+AsyncChunkLoader = Callable[[list[str]], Awaitable[dict[str, ChunkRow]]]
+
+
+def _match(key: str, values: list[str]) -> FieldCondition:
+    if len(values) == 1:
+        return FieldCondition(key=key, match=MatchValue(value=values[0]))
+    return FieldCondition(key=key, match=MatchAny(any=values))
+
+
+# Payload key listing the folders (tenants) whose documents reference a point's content hash.
+SCOPES_KEY = "scopes"
+# Collection metadata flag: every point carries `SCOPES_KEY` (new collection or backfilled).
+SCOPES_READY_KEY = "scopes_backfilled"
+# Seconds between re-reading the flag while it is unset.
+SCOPES_READY_RECHECK_S = 60.0
+
+
+def folder_scope(folder_id: int | None) -> str:
+    return f"folder:{folder_id}" if folder_id else "root"
+
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """
+    Chunk metadata constraints applied inside the vector search. `page_ranges` are
+    inclusive (start, end) pairs, `end=None` meaning open-ended; a chunk matches if it
+    falls in any of them.
+    """
+
+    page_ranges: tuple[tuple[int, int | None], ...] = ()
+    chunk_index_gte: int | None = None
+    chunk_index_lte: int | None = None
+
+    def conditions(self) -> list[Any]:
+        out: list[Any] = []
+        if self.page_ranges:
+            ranges = [
+                FieldCondition(key="page_number", range=Range(gte=start, lte=end))
+                for start, end in self.page_ranges
+            ]
+            out.append(ranges[0] if len(ranges) == 1 else Filter(should=ranges))
+        if self.chunk_index_gte is not None or self.chunk_index_lte is not None:
+            out.append(
+                FieldCondition(key="chunk_index", range=Range(gte=self.chunk_index_gte, lte=self.chunk_index_lte))
+            )
+        return out
+
+    def matches(self, payload: dict[str, Any]) -> bool:
+        """
+        Python-side equivalent of `conditions` for stores without server-side filtering.
+        """
+        if self.page_ranges:
+            page = payload.get("page_number")
+            if page is None or not any(page >= start and (end is None or page <= end) for start, end in self.page_ranges):
+                return False
+        index = payload.get("chunk_index")
+        if self.chunk_index_gte is not None and (index is None or index < self.chunk_index_gte):
+            return False
+        if self.chunk_index_lte is not None and (index is None or index > self.chunk_index_lte):
+            return False
+        return True
+
+
+def _build_filter(
+    doc_ids: list[str] | None,
+    sha256s: list[str] | None,
+    scopes: list[str] | None = None,
+    metadata: MetadataFilter | None = None,
+) -> Filter | None:
+    must_filters = []
+    if scopes:
+        must_filters.append(_match(SCOPES_KEY, scopes))
+    if doc_ids:
+        must_filters.append(_match("doc_id", doc_ids))
+    if sha256s:
+        must_filters.append(_match("sha256", sha256s))
+    if metadata:
+        must_filters.extend(metadata.conditions())
+    return Filter(must=must_filters) if must_filters else None
+
+
+def _to_chunks(points: list[Any]) -> list[RetrievedChunk]:
+    out: list[RetrievedChunk] = []
+    for r in points:
+        payload = getattr(r, "payload", None) or {}
+        out.append(
+            RetrievedChunk(
+                chunk_id=str(getattr(r, "id", "")),
+                # Points written before payloads were slimmed still carry source/text.
+                source=payload.get("source", ""),
+                text=payload.get("text", ""),
+                doc_id=payload.get("doc_id"),
+                chunk_index=payload.get("chunk_index"),
+                page_number=payload.get("page_number"),
+                sha256=payload.get("sha256"),
+                score=getattr(r, "score", None),
+            )
+        )
+    return out
+
+
+def _missing_text(chunks: list[RetrievedChunk]) -> list[str]:
+    return [c.chunk_id for c in chunks if not c.text]
+
+
+def _merge_texts(chunks: list[RetrievedChunk], rows: dict[str, ChunkRow]) -> list[RetrievedChunk]:
+    out: list[RetrievedChunk] = []
+    for c in chunks:
+        if not c.text:
+            row = rows.get(c.chunk_id)
+            if row is None:
+                continue
+            c = replace(c, source=row[0], text=row[1], token_count=row[2])
+        out.append(c)
+    return out
+
+
+def _owner(chunk: RetrievedChunk) -> str | None:
+    if chunk.chunk_index is None:
+        return None
+    if chunk.sha256 and chunk_point_id(chunk.sha256, chunk.chunk_index) == chunk.chunk_id:
+        return chunk.sha256
+    return chunk.doc_id
+
+
+def neighbor_ids(hits: list[RetrievedChunk], window: int) -> list[str]:
+    """
+    Ids of the chunks within `window` positions of each hit, computed without a search.
+    """
+    seen = {h.chunk_id for h in hits}
+    out: list[str] = []
+    for h in hits:
+        owner = _owner(h)
+        if owner is None or h.chunk_index is None:
+            continue
+        for offset in range(-window, window + 1):
+            index = h.chunk_index + offset
+            if offset == 0 or index < 0:
+                continue
+            chunk_id = chunk_point_id(owner, index)
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                out.append(chunk_id)
+    return out
+
+
+def merge_neighbors(hits: list[RetrievedChunk], neighbors: list[RetrievedChunk], window: int) -> list[RetrievedChunk]:
+    """
+    Extends every hit with the adjacent chunks on the same page. Each run is returned in
+    reading order at the rank of its best hit, with neighbours taking that hit's score;
+    every chunk keeps its own id so it stays citable. Hits absorbed into a better-ranked
+    run are not repeated. The context pack merges the runs and strips their overlap.
+    """
+    pool = {c.chunk_id: c for c in neighbors}
+    pool.update({h.chunk_id: h for h in hits})
+    used: set[str] = set()
+    out: list[RetrievedChunk] = []
+    for h in hits:
+        if h.chunk_id in used:
+            continue
+        owner = _owner(h)
+        if owner is None or h.chunk_index is None:
+            used.add(h.chunk_id)
+            out.append(h)
+            continue
+
+        run = [h]
+        for step in (-1, 1):
+            for k in range(1, window + 1):
+                c = pool.get(chunk_point_id(owner, h.chunk_index + step * k))
+                if c is None or c.chunk_id in used or c.page_number != h.page_number:
+                    break
+                run.append(c)
+        run.sort(key=lambda c: c.chunk_index or 0)
+        used.update(c.chunk_id for c in run)
+        out.extend(c if c is h else replace(c, score=h.score) for c in run)
+    return out
+
+
+def _rehydrate_lists(lists: list[list[RetrievedChunk]], hydrated: list[RetrievedChunk]) -> list[list[RetrievedChunk]]:
+    """
+    Copies text from one batched hydration back into every result list, keeping each
+    list's own scores. Chunks without text are dropped.
+    """
+    texts = {c.chunk_id: c for c in hydrated}
+    out: list[list[RetrievedChunk]] = []
+    for chunks in lists:
+        row = []
+        for c in chunks:
+            h = texts.get(c.chunk_id)
+            if h is not None:
+                row.append(replace(c, source=h.source, text=h.text, token_count=h.token_count))
+        out.append(row)
+    return out
+
+
+def _unique(lists: list[list[RetrievedChunk]]) -> list[RetrievedChunk]:
+    return list({c.chunk_id: c for chunks in lists for c in chunks}.values())
+
+
+def fuse_results(lists: list[list[RetrievedChunk]], similarity: bool = True, k: int = 60) -> list[RetrievedChunk]:
+    """
+    Merges the result lists of several queries, deduplicated by chunk id. Similarity scores
+    are comparable across queries, so each chunk keeps its best score; rank-only scores
+    are fused with reciprocal rank fusion instead.
+    """
+    if similarity:
+        best: dict[str, RetrievedChunk] = {}
+        for chunks in lists:
+            for c in chunks:
+                cur = best.get(c.chunk_id)
+                if cur is None or (c.score or 0.0) > (cur.score or 0.0):
+                    best[c.chunk_id] = c
+        return sorted(best.values(), key=lambda c: c.score or 0.0, reverse=True)
+
+    fused: dict[str, float] = {}
+    first: dict[str, RetrievedChunk] = {}
+    for chunks in lists:
+        seen: set[str] = set()
+        for rank, c in enumerate(chunks):
+            # A chunk repeated within one list only counts at its best rank.
+            if c.chunk_id in seen:
+                continue
+            seen.add(c.chunk_id)
+            fused[c.chunk_id] = fused.get(c.chunk_id, 0.0) + 1.0 / (k + rank + 1)
+            first.setdefault(c.chunk_id, c)
+    return [
+        replace(first[cid], score=score)
+        for cid, score in sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+    ]
+
+
+def load_chunk_texts(chunk_ids: list[str]) -> dict[str, ChunkRow]:
+    with Session(engine) as session:
+        return {c.chunk_id: (c.source, c.text, c.token_count) for c in ChunkRepo(session).get_many(chunk_ids)}
+
+
+async def load_chunk_texts_async(chunk_ids: list[str]) -> dict[str, ChunkRow]:
+    async with async_session() as session:
+        return {c.chunk_id: (c.source, c.text, c.token_count) for c in await AsyncChunkRepo(session).get_many(chunk_ids)}
+
+
+async def search_chunk_text(
+    query: str,
+    limit: int,
+    sha256s: list[str] | None = None,
+    metadata: MetadataFilter | None = None,
+) -> list[RetrievedChunk]:
+    """
+    Postgres full-text search over chunk text: the keyword leg for stores without sparse
+    vectors. Hits carry no score; only their rank is meaningful.
+    """
+    metadata = metadata or MetadataFilter()
+    async with async_session() as session:
+        rows = await AsyncChunkRepo(session).search_text(
+            query,
+            limit,
+            sha256s=sha256s,
+            page_ranges=metadata.page_ranges,
+            chunk_index_gte=metadata.chunk_index_gte,
+            chunk_index_lte=metadata.chunk_index_lte,
+        )
+    return [
+        RetrievedChunk(
+            chunk_id=r.chunk_id,
+            source=r.source,
+            text=r.text,
+            doc_id=r.doc_id,
+            chunk_index=r.chunk_index,
+            page_number=r.page_number,
+            sha256=r.sha256,
+            token_count=r.token_count,
+        )
+        for r in rows
+    ]
+
+
+def load_scopes(sha256s: list[str]) -> dict[str, list[str]]:
+    """
+    Folder scopes per content hash, derived from the documents that reference it.
+    """
+    with Session(engine) as session:
+        folders = DocumentRepo(session).folders_by_sha256(sha256s)
+    return {sha: sorted({folder_scope(f) for f in ids}) for sha, ids in folders.items()}
+
+
+def sync_scopes(sha256s: list[str]) -> None:
+    """
+    Rewrites the scopes payload of every point of the given hashes, in one batched update.
+    Hashes without documents get no scopes.
+    """
+    if not sha256s:
+        return
+    scopes = load_scopes(sha256s)
+    get_vector_store().set_scopes({s: scopes.get(s, []) for s in dict.fromkeys(sha256s)})
+
 
+def folder_scopes_ready() -> bool:
+    """
+    Whether folder search can filter on the scopes payload. Collections that predate it
+    filter on the folder's content hashes until `migrate_qdrant.py backfill-scopes` has run.
+    """
+    return get_vector_store().scopes_ready()
 
-class QdrantVectorStore:
-    def __init__(self, url: str, collection: str, dim: int, api_key: str | None = None) -> None:
-        self.client = QdrantClient(url=url, api_key=api_key, timeout=30)
+
+DENSE_VECTOR = "dense"
+MINI_VECTOR = "dense_mini"
+SPARSE_VECTOR = "bm25"
+
+
+@dataclass(frozen=True)
+class CollectionLayout:
+    """
+    Which vectors the collection holds. `dense=None` is the legacy single unnamed vector;
+    `mini` is the truncated Matryoshka vector used for first-pass candidate search and
+    `sparse` holds BM25 term weights for hybrid search.
+    """
+
+    dense: str | None = None
+    mini: str | None = None
+    mini_dim: int = 0
+    sparse: str | None = None
+
+    @classmethod
+    def from_config(cls, vectors: Any, sparse_vectors: Any) -> CollectionLayout:
+        sparse = SPARSE_VECTOR if sparse_vectors and SPARSE_VECTOR in sparse_vectors else None
+        if not isinstance(vectors, dict):
+            return cls(sparse=sparse)
+        mini = vectors.get(MINI_VECTOR)
+        return cls(
+            dense=DENSE_VECTOR,
+            mini=MINI_VECTOR if mini is not None else None,
+            mini_dim=mini.size if mini is not None else 0,
+            sparse=sparse,
+        )
+
+    def point_vectors(self, vector: list[float], sparse: SparseVector | None = None) -> Any:
+        if self.dense is None and not (self.sparse and sparse):
+            return vector
+        vectors: dict[str, Any] = {self.dense or "": vector}
+        if self.mini:
+            # Qdrant normalizes cosine vectors on write, so a plain prefix is enough.
+            vectors[self.mini] = vector[: self.mini_dim]
+        if self.sparse and sparse:
+            vectors[self.sparse] = sparse
+        return vectors
+
+    def bulk_vectors(self, vectors: np.ndarray, sparse: list[SparseVector] | None = None) -> Any:
+        """
+        Vectors in the shape `upload_collection` takes. Without sparse vectors the dense matrix
+        (and its truncated prefix) is handed over as contiguous arrays and only sliced per batch.
+        """
+        if not (self.sparse and sparse):
+            if self.dense is None:
+                return vectors
+            arrays = {self.dense: vectors}
+            if self.mini:
+                arrays[self.mini] = np.ascontiguousarray(vectors[:, : self.mini_dim])
+            return arrays
+        return self._iter_point_vectors(vectors, sparse)
+
+    def _iter_point_vectors(self, vectors: np.ndarray, sparse: list[SparseVector]) -> Iterator[Any]:
+        for i in range(len(vectors)):
+            yield self.point_vectors(vectors[i].tolist(), sparse[i])
+
+    def dense_vector(self, vectors: Any) -> list[float]:
+        return vectors[self.dense or ""] if isinstance(vectors, dict) else vectors
+
+
+class _QdrantStoreBase:
+    """
+    Request building shared by the sync and async stores.
+    """
+
+    collection: str
+    profile: QdrantProfile
+    layout: CollectionLayout
+    candidates: int
+    hybrid_candidates: int
+    fusion: Fusion
+    sparse_encoder: BM25SparseEncoder | None
+    chunk_loader: ChunkLoader | None
+
+    def _points(
+        self,
+        ids: list[str],
+        vectors: list[list[float]],
+        payloads: list[dict],
+        sparse_vectors: list[SparseVector] | None = None,
+    ) -> list[PointStruct]:
+        return [
+            PointStruct(
+                id=ids[i],
+                vector=self.layout.point_vectors(vectors[i], sparse_vectors[i] if sparse_vectors else None),
+                payload=payloads[i],
+            )
+            for i in range(len(ids))
+        ]
+
+    @property
+    def hybrid(self) -> bool:
+        """
+        Whether the collection has a sparse (keyword) leg: upserts carry sparse vectors and
+        searches fuse both legs.
+        """
+        return bool(self.layout.sparse and self.sparse_encoder)
+
+    @property
+    def similarity_scores(self) -> bool:
+        """
+        Whether hit scores measure similarity. RRF-fused scores only encode ranks.
+        """
+        return not (self.layout.sparse and self.sparse_encoder and self.fusion == Fusion.RRF)
+
+    def _vector_selector(self) -> list[str] | bool:
+        # The truncated Matryoshka vector is enough to compare chunks with each other and
+        # an order of magnitude smaller to transfer.
+        if self.layout.mini:
+            return [self.layout.mini]
+        return [self.layout.dense] if self.layout.dense else True
+
+    def _attach_vectors(self, points: list[Any], chunks: list[RetrievedChunk]) -> list[RetrievedChunk]:
+        out: list[RetrievedChunk] = []
+        for p, c in zip(points, chunks, strict=True):
+            vector = p.vector
+            if vector is not None:
+                vector = vector[self.layout.mini] if self.layout.mini else self.layout.dense_vector(vector)
+            out.append(replace(c, vector=vector))
+        return out
+
+    def _dense_query(self, query_vector: list[float], limit: int, qfilter: Filter | None) -> dict[str, Any]:
+        query: dict[str, Any] = {"query": query_vector, "using": self.layout.dense}
+        if self.layout.mini:
+            # Two-stage search: the truncated vector finds candidates, the full vector re-scores them.
+            query["prefetch"] = Prefetch(
+                query=query_vector[: self.layout.mini_dim],
+                using=self.layout.mini,
+                limit=max(self.candidates, limit),
+                filter=qfilter,
+            )
+        return query
+
+    def _query_kwargs(
+        self,
+        query_vector: list[float],
+        limit: int,
+        qfilter: Filter | None,
+        query_text: str | None = None,
+    ) -> dict[str, Any]:
+        kwargs: dict[str, Any] = {
+            "collection_name": self.collection,
+            "query_filter": qfilter,
+            "with_payload": True,
+        }
+        sparse = None
+        if self.layout.sparse and self.sparse_encoder and query_text:
+            sparse = self.sparse_encoder.encode_query(query_text)
+
+        if sparse is None or not sparse.indices:
+            kwargs.update(self._dense_query(query_vector, limit, qfilter))
+            kwargs["search_params"] = self.profile.search_params()
+            return kwargs
+
+        # Hybrid search: dense and sparse candidates fused in one request, by reciprocal rank
+        # fusion or by distribution-based score fusion (which keeps scores comparable).
+        branch_limit = max(self.hybrid_candidates, limit)
+        kwargs["prefetch"] = [
+            Prefetch(
+                **self._dense_query(query_vector, branch_limit, qfilter),
+                filter=qfilter,
+                params=self.profile.search_params(),
+                limit=branch_limit,
+            ),
+            Prefetch(query=sparse, using=self.layout.sparse, filter=qfilter, limit=branch_limit),
+        ]
+        kwargs["query"] = FusionQuery(fusion=self.fusion)
+        return kwargs
+
+
+    def _query_request(
+        self,
+        query_vector: list[float],
+        limit: int,
+        qfilter: Filter | None,
+        query_text: str | None = None,
+        with_vectors: bool = False,
+    ) -> QueryRequest:
+        """
+        `_query_kwargs` as a request for `query_batch_points`.
+        """
+        kwargs = self._query_kwargs(query_vector, limit, qfilter, query_text)
+        return QueryRequest(
+            query=kwargs["query"],
+            using=kwargs.get("using"),
+            prefetch=kwargs.get("prefetch"),
+            filter=kwargs["query_filter"],
+            params=kwargs.get("search_params"),
+            limit=limit,
+            with_payload=True,
+            with_vector=self._vector_selector() if with_vectors else False,
+        )
+
+
+class QdrantVectorStore(_QdrantStoreBase):
+    """
+    Qdrant-backed store. `NumpyVectorStore` implements the same search/upsert/delete
+    interface for deployments without a Qdrant server.
+    """
+
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection: str,
+        dim: int,
+        profile: QdrantProfile | None = None,
+        mini_dim: int = 0,
+        candidates: int = 100,
+        sparse_encoder: BM25SparseEncoder | None = None,
+        hybrid_candidates: int = 50,
+        chunk_loader: ChunkLoader | None = None,
+        fusion: Fusion = Fusion.RRF,
+        ingest_client: QdrantClient | None = None,
+    ) -> None:
+        self.client = client
+        # Separate (gRPC) client for `bulk_upsert`; the shared client otherwise
+        self.ingest_client = ingest_client or client
         self.collection = collection
+        self.dim = dim
+        self.chunk_loader = chunk_loader
+        self.profile = profile or get_profile("default")
+        self.mini_dim = mini_dim
+        self.candidates = candidates
+        self.sparse_encoder = sparse_encoder
+        self.hybrid_candidates = hybrid_candidates
+        self.fusion = fusion
+        self.layout = CollectionLayout()
+        self._scopes_ready = False
+        self._scopes_checked = 0.0
+
+    def bootstrap(self) -> None:
+        """
+        Creates the collection and payload indices if missing and detects the vector layout.
+        Called once per process. The profile is only applied to new collections; see
+        `apply_profile` for existing ones.
+        """
         try:
             if not self.client.collection_exists(self.collection):
+                vectors_config = {
+                    DENSE_VECTOR: VectorParams(
+                        size=self.dim,
+                        distance=Distance.COSINE,
+                        on_disk=self.profile.on_disk_vectors,
+                    )
+                }
+                if self.mini_dim:
+                    # The candidate vector is small, keep it in RAM regardless of profile.
+                    vectors_config[MINI_VECTOR] = VectorParams(size=self.mini_dim, distance=Distance.COSINE)
+                sparse_config = None
+                if self.sparse_encoder:
+                    # Documents store BM25 term weights; Qdrant applies IDF at query time.
+                    sparse_config = {SPARSE_VECTOR: SparseVectorParams(modifier=Modifier.IDF)}
                 self.client.create_collection(
                     collection_name=self.collection,
-                    vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+                    vectors_config=vectors_config,
+                    sparse_vectors_config=sparse_config,
+                    hnsw_config=self.profile.hnsw_config(),
+                    quantization_config=self.profile.quantization_config(),
+                    on_disk_payload=self.profile.on_disk_payload,
+                    # Every point written from now on carries its scopes
+                    metadata={SCOPES_READY_KEY: True},
+                )
+            info = self.client.get_collection(self.collection)
+            self._read_scopes_ready(info)
+            if not self._scopes_ready:
+                logger.warning(
+                    f"Collection '{self.collection}' has no folder scopes yet; folder search "
+                    "filters on content hashes. Run `python migrate_qdrant.py backfill-scopes`."
+                )
+            params = info.config.params
+            self.layout = CollectionLayout.from_config(params.vectors, params.sparse_vectors)
+            if self.mini_dim and not self.layout.mini:
+                logger.warning(
+                    f"Collection '{self.collection}' has no '{MINI_VECTOR}' vector; two-stage search "
+                    "is disabled. Run `python migrate_qdrant.py reindex` to migrate it."
+                )
+            if self.sparse_encoder and not self.layout.sparse:
+                logger.warning(
+                    f"Collection '{self.collection}' has no '{SPARSE_VECTOR}' sparse vector; hybrid "
+                    "search is disabled. Run `python migrate_qdrant.py reindex` to migrate it."
                 )
             self.ensure_indices()
         except Exception as e:
             raise VectorStoreError(f"Failed to init Qdrant: {e}") from e
 
-    def ensure_indices(self) -> None:
+    def apply_profile(self) -> None:
+        """
+        Migrates an existing collection to the store's profile. Qdrant rebuilds the
+        affected segments in the background, so this returns before the optimizer finishes.
+        """
         try:
-            self.client.create_payload_index(
+            self.client.update_collection(
                 collection_name=self.collection,
-                field_name="doc_id",
-                field_schema="keyword",
+                vectors_config={self.layout.dense or "": VectorParamsDiff(on_disk=self.profile.on_disk_vectors)},
+                hnsw_config=self.profile.hnsw_config(),
+                quantization_config=self.profile.quantization_diff(),
+                collection_params=CollectionParamsDiff(on_disk_payload=self.profile.on_disk_payload),
             )
-            self.client.create_payload_index(
-                collection_name=self.collection,
-                field_name="sha256",
-                field_schema="keyword",
+        except Exception as e:
+            raise VectorStoreError(f"Failed to apply Qdrant profile '{self.profile.name}': {e}") from e
+
+    def _read_scopes_ready(self, info: Any) -> None:
+        metadata = getattr(info.config, "metadata", None) or {}
+        self._scopes_ready = bool(metadata.get(SCOPES_READY_KEY))
+        self._scopes_checked = time.monotonic()
+
+    def scopes_ready(self) -> bool:
+        """
+        True once the collection is flagged as having scopes on every point. Re-read at
+        most every `SCOPES_READY_RECHECK_S` until then, so a backfill run from another
+        process is picked up without a restart.
+        """
+        if self._scopes_ready or time.monotonic() - self._scopes_checked < SCOPES_READY_RECHECK_S:
+            return self._scopes_ready
+        try:
+            self._read_scopes_ready(self.client.get_collection(self.collection))
+        except Exception as e:
+            self._scopes_checked = time.monotonic()
+            logger.warning(f"Could not read collection metadata: {e}")
+        return self._scopes_ready
+
+    def mark_scopes_ready(self) -> None:
+        try:
+            self.client.update_collection(
+                collection_name=self.collection, metadata={SCOPES_READY_KEY: True}
             )
-        except Exception:
-            pass
+        except Exception as e:
+            raise VectorStoreError(f"Failed to flag scopes as backfilled: {e}") from e
+        self._scopes_ready = True
+
+    def ensure_indices(self) -> None:
+        indices: dict[str, Any] = {
+            "doc_id": "keyword",
+            "sha256": "keyword",
+            # Tenant index: Qdrant co-locates and links each folder's points so scoped search
+            # cost follows the folder's size rather than the collection's.
+            SCOPES_KEY: KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True),
+            # Range-only integer indexes back page and chunk-position filters.
+            "page_number": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=False, range=True),
+            "chunk_index": IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=False, range=True),
+        }
+        for field_name, field_schema in indices.items():
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection,
+                    field_name=field_name,
+                    field_schema=field_schema,
+                )
+            except Exception:
+                pass
+
+    def _hydrate(self, chunks: list[RetrievedChunk]) -> list[RetrievedChunk]:
+        """
+        Fills in chunk text with one batched fetch. Chunks whose text cannot be found are dropped.
+        """
+        missing = _missing_text(chunks)
+        if not missing:
+            return chunks
+        rows = self.chunk_loader(missing) if self.chunk_loader else {}
+        return _merge_texts(chunks, rows)
+
+    def retrieve(self, ids: list[str]) -> list[RetrievedChunk]:
+        """
+        Fetches chunks by id in one request; unknown ids are skipped.
+        """
+        if not ids:
+            return []
+        try:
+            points = self.client.retrieve(self.collection, ids=ids, with_payload=True, with_vectors=False)
+            return self._hydrate(_to_chunks(points))
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant retrieve failed: {e}") from e
+
+    def expand_neighbors(self, hits: list[RetrievedChunk], window: int) -> list[RetrievedChunk]:
+        """
+        Adds up to `window` adjacent chunks on each side of every hit (one batched lookup).
+        """
+        if window <= 0 or not hits:
+            return hits
+        return merge_neighbors(hits, self.retrieve(neighbor_ids(hits, window)), window)
 
-    def upsert(self, ids: list[str], vectors: list[list[float]], payloads: list[dict]) -> None:
+    def upsert(
+        self,
+        ids: list[str],
+        vectors: list[list[float]],
+        payloads: list[dict],
+        sparse_vectors: list[SparseVector] | None = None,
+    ) -> None:
         try:
-            points = [PointStruct(id=ids[i], vector=vectors[i], payload=payloads[i]) for i in range(len(ids))]
-            self.client.upsert(self.collection, points=points)
+            self.client.upsert(self.collection, points=self._points(ids, vectors, payloads, sparse_vectors))
         except Exception as e:
             raise VectorStoreError(f"Qdrant upsert failed: {e}") from e
 
+    def bulk_upsert(
+        self,
+        ids: list[str],
+        vectors: np.ndarray,
+        payloads: list[dict],
+        sparse_vectors: list[SparseVector] | None = None,
+        batch_size: int = 256,
+        parallel: int = 1,
+    ) -> None:
+        """
+        High-throughput upsert for ingest. Batches are sent from `parallel` worker processes
+        without waiting for Qdrant to apply them; call `wait_for_points` before relying on
+        the points being searchable.
+        """
+        try:
+            self.ingest_client.upload_collection(
+                collection_name=self.collection,
+                vectors=self.layout.bulk_vectors(np.ascontiguousarray(vectors, dtype=np.float32), sparse_vectors),
+                payload=payloads,
+                ids=ids,
+                batch_size=batch_size,
+                parallel=parallel,
+                wait=False,
+            )
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant bulk upload failed: {e}") from e
+
+    def wait_for_points(self, doc_id: str, expected: int, timeout: float = 120.0) -> None:
+        """
+        Consistency barrier after `bulk_upsert`: blocks until all `expected` points of the
+        document are applied and visible to search.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        try:
+            while True:
+                count = self.client.count(
+                    collection_name=self.collection,
+                    count_filter=_build_filter([doc_id], None),
+                    exact=True,
+                ).count
+                if count >= expected:
+                    return
+                if time.monotonic() >= deadline:
+                    raise VectorStoreError(
+                        f"Timed out waiting for Qdrant to apply {expected} points for {doc_id} ({count} visible)"
+                    )
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+        except VectorStoreError:
+            raise
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant count failed: {e}") from e
+
+    def set_scopes(self, scopes: dict[str, list[str]]) -> None:
+        """
+        Sets the scopes payload of every point of each content hash, in one request.
+        """
+        if not scopes:
+            return
+        try:
+            self.client.batch_update_points(
+                collection_name=self.collection,
+                update_operations=[
+                    SetPayloadOperation(
+                        set_payload=SetPayload(
+                            payload={SCOPES_KEY: values},
+                            filter=Filter(must=[_match("sha256", [sha256])]),
+                        )
+                    )
+                    for sha256, values in scopes.items()
+                ],
+            )
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant set payload failed: {e}") from e
+
     def delete_by_doc_id(self, doc_id: str) -> None:
         try:
             self.client.delete(
@@ -73,95 +868,414 @@ class QdrantVectorStore:
         except Exception as e:
             raise VectorStoreError(f"Qdrant delete failed: {e}") from e
 
-    def search(self, query_vector: list[float], top_k: int, doc_ids: list[str] | None = None, sha256s: list[str] | None = None) -> list[RetrievedChunk]:
+    def delete_by_sha256s(self, sha256s: list[str]) -> None:
+        """
+        Drops the vector sets of the given content hashes with one filtered delete.
+        """
+        if not sha256s:
+            return
         try:
-            must_filters = []
-            if doc_ids:
-                if len(doc_ids) == 1:
-                     must_filters.append(FieldCondition(key="doc_id", match=MatchValue(value=doc_ids[0])))
-                else:
-                     must_filters.append(FieldCondition(key="doc_id", match=MatchAny(any=doc_ids)))
-            
-            if sha256s:
-                if len(sha256s) == 1:
-                     must_filters.append(FieldCondition(key="sha256", match=MatchValue(value=sha256s[0])))
-                else:
-                     must_filters.append(FieldCondition(key="sha256", match=MatchAny(any=sha256s)))
-
-            qfilter = Filter(must=must_filters) if must_filters else None
+            self.client.delete(
+                collection_name=self.collection,
+                points_selector=Filter(must=[_match("sha256", sha256s)]),
+            )
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant delete failed: {e}") from e
 
+    def search(
+        self,
+        query_vector: list[float],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[RetrievedChunk]:
+        try:
+            qfilter = _build_filter(doc_ids, sha256s, scopes, metadata)
             results = self.client.query_points(
-                collection_name=self.collection,
-                query=query_vector,
-                with_payload=True,
+                **self._query_kwargs(query_vector, top_k, qfilter, query_text),
                 limit=top_k,
-                query_filter=qfilter,
+                with_vectors=self._vector_selector() if with_vectors else False,
             ).points
-
-            out: list[RetrievedChunk] = []
-            for r in results:
-                payload = getattr(r, "payload", None) or {}
-                text = payload.get("text", "")
-                if not text:
-                    continue
-                out.append(
-                    RetrievedChunk(
-                        chunk_id=str(getattr(r, "id", "")),
-                        source=payload.get("source", ""),
-                        text=text,
-                        doc_id=payload.get("doc_id"),
-                        chunk_index=payload.get("chunk_index"),
-                        page_number=payload.get("page_number"),
-                    )
-                )
-            return out
+            chunks = _to_chunks(results)
+            if with_vectors:
+                chunks = self._attach_vectors(results, chunks)
+            return self._hydrate(chunks)
         except Exception as e:
             raise VectorStoreError(f"Qdrant search failed: {e}") from e
 
-    def search_grouped(self, query_vector: list[float], top_k_groups: int, group_size: int, doc_ids: list[str] | None = None, sha256s: list[str] | None = None) -> list[RetrievedChunk]:
+    def search_batch(
+        self,
+        query_vectors: list[list[float]],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_texts: list[str] | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[RetrievedChunk]]:
+        """
+        Runs several queries with the same filters in one request; one result list per query.
+        """
+        if not query_vectors:
+            return []
+        qfilter = _build_filter(doc_ids, sha256s, scopes, metadata)
+        texts = query_texts or [None] * len(query_vectors)
         try:
-            must_filters = []
-            if doc_ids:
-                if len(doc_ids) == 1:
-                     must_filters.append(FieldCondition(key="doc_id", match=MatchValue(value=doc_ids[0])))
-                else:
-                     must_filters.append(FieldCondition(key="doc_id", match=MatchAny(any=doc_ids)))
-
-            if sha256s:
-                if len(sha256s) == 1:
-                     must_filters.append(FieldCondition(key="sha256", match=MatchValue(value=sha256s[0])))
-                else:
-                     must_filters.append(FieldCondition(key="sha256", match=MatchAny(any=sha256s)))
-
-            qfilter = Filter(must=must_filters) if must_filters else None
+            responses = self.client.query_batch_points(
+                self.collection,
+                requests=[
+                    self._query_request(v, top_k, qfilter, t, with_vectors)
+                    for v, t in zip(query_vectors, texts, strict=True)
+                ],
+            )
+            lists = [_to_chunks(r.points) for r in responses]
+            if with_vectors:
+                lists = [
+                    self._attach_vectors(r.points, chunks)
+                    for r, chunks in zip(responses, lists, strict=True)
+                ]
+            return _rehydrate_lists(lists, self._hydrate(_unique(lists)))
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant batch search failed: {e}") from e
 
+    def search_grouped(
+        self,
+        query_vector: list[float],
+        top_k_groups: int,
+        group_size: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+    ) -> list[RetrievedChunk]:
+        try:
+            qfilter = _build_filter(doc_ids, sha256s, scopes, metadata)
             groups = self.client.query_points_groups(
-                collection_name=self.collection,
-                query=query_vector,
+                **self._query_kwargs(query_vector, top_k_groups * group_size, qfilter, query_text),
                 group_by="sha256", # Group by content hash since multiple docs might share it
                 limit=top_k_groups,
                 group_size=group_size,
-                query_filter=qfilter,
-                with_payload=True,
             ).groups
 
             out: list[RetrievedChunk] = []
             for g in groups:
-                for r in g.hits:
-                    payload = getattr(r, "payload", None) or {}
-                    text = payload.get("text", "")
-                    if not text:
-                        continue
-                    out.append(
-                        RetrievedChunk(
-                            chunk_id=str(getattr(r, "id", "")),
-                            source=payload.get("source", ""),
-                            text=text,
-                            doc_id=payload.get("doc_id"),
-                            chunk_index=payload.get("chunk_index"),
-                            page_number=payload.get("page_number"),
-                        )
-                    )
-            return out
+                out.extend(_to_chunks(g.hits))
+            return self._hydrate(out)
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant search groups failed: {e}") from e
+
+
+class AsyncQdrantVectorStore(_QdrantStoreBase):
+    """
+    Async counterpart of `QdrantVectorStore` for code running on the event loop.
+    Collection bootstrap is left to the sync store, which runs it once at startup
+    and hands over the detected layout.
+    """
+
+    def __init__(
+        self,
+        client: AsyncQdrantClient,
+        collection: str,
+        profile: QdrantProfile | None = None,
+        layout: CollectionLayout | None = None,
+        candidates: int = 100,
+        sparse_encoder: BM25SparseEncoder | None = None,
+        hybrid_candidates: int = 50,
+        chunk_loader: AsyncChunkLoader | None = None,
+        fusion: Fusion = Fusion.RRF,
+    ) -> None:
+        self.client = client
+        self.collection = collection
+        self.chunk_loader = chunk_loader
+        self.profile = profile or get_profile("default")
+        self.layout = layout or CollectionLayout()
+        self.candidates = candidates
+        self.sparse_encoder = sparse_encoder
+        self.hybrid_candidates = hybrid_candidates
+        self.fusion = fusion
+
+    async def _hydrate(self, chunks: list[RetrievedChunk]) -> list[RetrievedChunk]:
+        missing = _missing_text(chunks)
+        if not missing:
+            return chunks
+        rows = await self.chunk_loader(missing) if self.chunk_loader else {}
+        return _merge_texts(chunks, rows)
+
+    async def retrieve(self, ids: list[str]) -> list[RetrievedChunk]:
+        if not ids:
+            return []
+        try:
+            points = await self.client.retrieve(self.collection, ids=ids, with_payload=True, with_vectors=False)
+            return await self._hydrate(_to_chunks(points))
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant retrieve failed: {e}") from e
+
+    async def expand_neighbors(self, hits: list[RetrievedChunk], window: int) -> list[RetrievedChunk]:
+        if window <= 0 or not hits:
+            return hits
+        return merge_neighbors(hits, await self.retrieve(neighbor_ids(hits, window)), window)
+
+    async def upsert(
+        self,
+        ids: list[str],
+        vectors: list[list[float]],
+        payloads: list[dict],
+        sparse_vectors: list[SparseVector] | None = None,
+    ) -> None:
+        try:
+            await self.client.upsert(self.collection, points=self._points(ids, vectors, payloads, sparse_vectors))
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant upsert failed: {e}") from e
+
+    async def delete_by_doc_id(self, doc_id: str) -> None:
+        try:
+            await self.client.delete(
+                collection_name=self.collection,
+                points_selector=Filter(
+                    must=[FieldCondition(key="doc_id", match=MatchValue(value=doc_id))]
+                ),
+            )
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant delete failed: {e}") from e
+
+    async def delete_by_sha256s(self, sha256s: list[str]) -> None:
+        if not sha256s:
+            return
+        try:
+            await self.client.delete(
+                collection_name=self.collection,
+                points_selector=Filter(must=[_match("sha256", sha256s)]),
+            )
         except Exception as e:
-            raise VectorStoreError(f"Qdrant search groups failed: {e}") from e
\ No newline at end of file
+            raise VectorStoreError(f"Qdrant delete failed: {e}") from e
+
+    async def search(
+        self,
+        query_vector: list[float],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[RetrievedChunk]:
+        try:
+            qfilter = _build_filter(doc_ids, sha256s, scopes, metadata)
+            response = await self.client.query_points(
+                **self._query_kwargs(query_vector, top_k, qfilter, query_text),
+                limit=top_k,
+                with_vectors=self._vector_selector() if with_vectors else False,
+            )
+            chunks = _to_chunks(response.points)
+            if with_vectors:
+                chunks = self._attach_vectors(response.points, chunks)
+            return await self._hydrate(chunks)
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant search failed: {e}") from e
+
+    async def search_batch(
+        self,
+        query_vectors: list[list[float]],
+        top_k: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_texts: list[str] | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[RetrievedChunk]]:
+        if not query_vectors:
+            return []
+        qfilter = _build_filter(doc_ids, sha256s, scopes, metadata)
+        texts = query_texts or [None] * len(query_vectors)
+        try:
+            responses = await self.client.query_batch_points(
+                self.collection,
+                requests=[
+                    self._query_request(v, top_k, qfilter, t, with_vectors)
+                    for v, t in zip(query_vectors, texts, strict=True)
+                ],
+            )
+            lists = [_to_chunks(r.points) for r in responses]
+            if with_vectors:
+                lists = [
+                    self._attach_vectors(r.points, chunks)
+                    for r, chunks in zip(responses, lists, strict=True)
+                ]
+            return _rehydrate_lists(lists, await self._hydrate(_unique(lists)))
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant batch search failed: {e}") from e
+
+    async def search_grouped(
+        self,
+        query_vector: list[float],
+        top_k_groups: int,
+        group_size: int,
+        doc_ids: list[str] | None = None,
+        sha256s: list[str] | None = None,
+        query_text: str | None = None,
+        scopes: list[str] | None = None,
+        metadata: MetadataFilter | None = None,
+    ) -> list[RetrievedChunk]:
+        try:
+            qfilter = _build_filter(doc_ids, sha256s, scopes, metadata)
+            response = await self.client.query_points_groups(
+                **self._query_kwargs(query_vector, top_k_groups * group_size, qfilter, query_text),
+                group_by="sha256",
+                limit=top_k_groups,
+                group_size=group_size,
+            )
+            out: list[RetrievedChunk] = []
+            for g in response.groups:
+                out.extend(_to_chunks(g.hits))
+            return await self._hydrate(out)
+        except Exception as e:
+            raise VectorStoreError(f"Qdrant search groups failed: {e}") from e
+
+
+# --- Process-wide clients ---
+
+_lock = threading.Lock()
+_client: QdrantClient | None = None
+_async_client: AsyncQdrantClient | None = None
+_ingest_client: QdrantClient | None = None
+_store: QdrantVectorStore | NumpyVectorStore | None = None
+_async_store: AsyncQdrantVectorStore | AsyncNumpyVectorStore | None = None
+
+
+def _client_kwargs() -> dict[str, Any]:
+    return {
+        "url": settings.qdrant_url,
+        "api_key": settings.qdrant_api_key or None,
+        "timeout": settings.qdrant_timeout,
+        "prefer_grpc": settings.qdrant_prefer_grpc,
+        "grpc_port": settings.qdrant_grpc_port,
+        "limits": httpx.Limits(
+            max_connections=settings.qdrant_pool_size,
+            max_keepalive_connections=settings.qdrant_pool_size,
+        ),
+    }
+
+
+def get_qdrant_client() -> QdrantClient:
+    global _client
+    with _lock:
+        if _client is None:
+            _client = QdrantClient(**_client_kwargs())
+        return _client
+
+
+def get_ingest_client() -> QdrantClient:
+    """
+    Client for bulk ingest uploads: gRPC regardless of QDRANT_PREFER_GRPC, which applies to
+    the shared client serving queries. The channel is only opened on first upload.
+    """
+    global _ingest_client
+    with _lock:
+        if _ingest_client is None:
+            _ingest_client = QdrantClient(**{**_client_kwargs(), "prefer_grpc": True})
+        return _ingest_client
+
+
+def get_async_qdrant_client() -> AsyncQdrantClient:
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncQdrantClient(**_client_kwargs())
+        return _async_client
+
+
+def get_sparse_encoder() -> BM25SparseEncoder:
+    return BM25SparseEncoder(avg_doc_len=settings.sparse_avg_doc_len)
+
+
+def get_vector_store() -> QdrantVectorStore | NumpyVectorStore:
+    """
+    Returns the shared store for the configured backend, bootstrapping it on first use.
+    A failed bootstrap is retried on the next call.
+    """
+    global _store
+    if _store is not None:
+        return _store
+    if settings.vector_backend == "numpy":
+        # Imported here because numpy_store builds on this module.
+        from app.services.numpy_store import NumpyVectorStore
+
+        with _lock:
+            if _store is None:
+                _store = NumpyVectorStore(
+                    data_dir=settings.numpy_store_dir,
+                    dim=settings.embed_dim,
+                    chunk_loader=load_chunk_texts,
+                )
+            return _store
+    client = get_qdrant_client()
+    with _lock:
+        if _store is None:
+            store = QdrantVectorStore(
+                client=client,
+                collection=settings.qdrant_collection,
+                dim=settings.embed_dim,
+                profile=get_profile(settings.qdrant_profile),
+                mini_dim=settings.matryoshka_dim,
+                candidates=settings.matryoshka_candidates,
+                sparse_encoder=get_sparse_encoder() if settings.hybrid_search else None,
+                hybrid_candidates=settings.hybrid_candidates,
+                chunk_loader=load_chunk_texts,
+                fusion=Fusion(settings.hybrid_fusion),
+                ingest_client=get_ingest_client() if settings.qdrant_ingest_grpc else None,
+            )
+            store.bootstrap()
+            _store = store
+        return _store
+
+
+def get_async_vector_store() -> AsyncQdrantVectorStore | AsyncNumpyVectorStore:
+    global _async_store
+    if _async_store is not None:
+        return _async_store
+    store = get_vector_store()
+    if not isinstance(store, QdrantVectorStore):
+        # The NumPy store has no async client; its calls run in worker threads instead.
+        from app.services.numpy_store import AsyncNumpyVectorStore
+
+        with _lock:
+            if _async_store is None:
+                _async_store = AsyncNumpyVectorStore(store)
+            return _async_store
+    client = get_async_qdrant_client()
+    with _lock:
+        if _async_store is None:
+            _async_store = AsyncQdrantVectorStore(
+                client=client,
+                collection=store.collection,
+                profile=store.profile,
+                layout=store.layout,
+                candidates=store.candidates,
+                sparse_encoder=store.sparse_encoder,
+                hybrid_candidates=store.hybrid_candidates,
+                chunk_loader=load_chunk_texts_async,
+                fusion=store.fusion,
+            )
+        return _async_store
+
+
+async def close_clients() -> None:
+    global _client, _async_client, _ingest_client, _store, _async_store
+    with _lock:
+        client, async_client, ingest_client = _client, _async_client, _ingest_client
+        _client = _async_client = _ingest_client = None
+        _store = _async_store = None
+    if client is not None:
+        client.close()
+    if ingest_client is not None:
+        ingest_client.close()
+    if async_client is not None:
+        await async_client.close()
@@ -15,6 +15,11 @@ class Settings(BaseSettings):
     delete_pdf_after_ingest: bool = Field(default=False)
     max_upload_mb: int = Field(default=25)
     
+    render_cache_dir: str = Field(default="data/render_cache")
+    render_cache_max_mb: int = Field(default=512)
+    render_workers: int = Field(default=2)
+    render_max_dpi: int = Field(default=300)
+    
     inngest_app_id: str = Field(default="docu_agent")
     inngest_api_base: str = Field(default="http://127.0.0.1:8288/v1")
     
@@ -24,11 +29,89 @@ class Settings(BaseSettings):
     chat_model: str = Field(default="gpt-4o-mini")
     vision_model: str = Field(default="gpt-4o-mini")
     
+    # "qdrant" or "numpy" (in-process exact search for small corpora and tests)
+    vector_backend: str = Field(default="qdrant")
+    numpy_store_dir: str = Field(default="data/vectors")
+    
     qdrant_url: str = Field(default="http://localhost:6333")
     qdrant_api_key: str = Field(default="")
     qdrant_collection: str = Field(default="docs")
+    qdrant_timeout: int = Field(default=30)
+    qdrant_pool_size: int = Field(default=32)
+    # gRPC for the shared client that serves queries.
+    qdrant_prefer_grpc: bool = Field(default=False)
+    qdrant_grpc_port: int = Field(default=6334)
+    # Bulk ingest: its own gRPC client and parallel, unacknowledged batches with one
+    # barrier at the end.
+    qdrant_ingest_grpc: bool = Field(default=True)
+    qdrant_upload_batch_size: int = Field(default=256)
+    qdrant_upload_parallel: int = Field(default=4)
+    qdrant_upload_wait_timeout: int = Field(default=120)
+    # One of app.services.qdrant_profiles.PROFILES:
+    # default | balanced | low_memory | high_recall | multitenant
+    qdrant_profile: str = Field(default="default")
+    # Truncated text-embedding-3 vector used for first-pass candidate search (0 disables it
+    # for new collections). Candidates are re-scored against the full embedding.
+    matryoshka_dim: int = Field(default=256)
+    matryoshka_candidates: int = Field(default=100)
+    # Dense + BM25 sparse retrieval fused with RRF (new collections get the sparse vector).
+    hybrid_search: bool = Field(default=True)
+    hybrid_candidates: int = Field(default=50)
+    # "rrf" (rank-based) or "dbsf" (normalized scores; enables score-aware context sizing).
+    hybrid_fusion: str = Field(default="rrf")
+    # Postgres full-text search as the keyword leg when the vector store has none (NumPy
+    # backend, hybrid search off, or a collection without the sparse vector).
+    text_search: bool = Field(default=True)
+    sparse_avg_doc_len: float = Field(default=180.0)
+    
+    # Deleted documents queue their content hash; a debounced background job drops vector sets
+    # no document references any more.
+    vector_gc_debounce_s: int = Field(default=10)
+    vector_gc_batch_size: int = Field(default=500)
+    vector_gc_max_batches: int = Field(default=20)
     
     default_top_k: int = Field(default=6)
+    # Adjacent chunks (same page) merged into each hit after search; 0 disables expansion.
+    neighbor_window: int = Field(default=1)
+    # Score-aware context sizing (see app.services.context_policy.ContextPolicy).
+    context_min_chunks: int = Field(default=2)
+    context_max_chunks: int = Field(default=30)
+    context_relative_drop: float = Field(default=0.2)
+    context_flat_band: float = Field(default=0.05)
+    context_score_floor: float = Field(default=0.2)
+    # Folder queries: grouped search with a per-document quota and a global cap.
+    folder_doc_quota: int = Field(default=4)
+    folder_max_chunks: int = Field(default=20)
+    # Multi-query retrieval: LLM reformulations searched in one batched request.
+    query_expansion: bool = Field(default=False)
+    query_expansion_count: int = Field(default=3)
+    # MMR reranking over oversampled candidates to drop near-duplicate (overlapping) chunks.
+    mmr_rerank: bool = Field(default=True)
+    mmr_lambda: float = Field(default=0.7)
+    mmr_oversample: int = Field(default=3)
+    # Classify before retrieving (instead of in parallel) so clarify requests skip retrieval.
+    skip_retrieval_on_clarify: bool = Field(default=False)
+    # Local intent classifier (keyword rules + nearest centroid); the LLM classifies below
+    # `intent_min_confidence` (centroid cosine margin) and a `intent_shadow_rate` sample.
+    local_intent: bool = Field(default=True)
+    intent_min_confidence: float = Field(default=0.04)
+    intent_shadow_rate: float = Field(default=0.05)
+    # Context tokens filled by score for generation, and the answer length cap.
+    context_token_budget: int = Field(default=6000)
+    generation_max_tokens: int = Field(default=900)
+    # In-process cache of retrieved chunks per (scope, normalized question); 0 disables it.
+    retrieval_cache_size: int = Field(default=512)
+    retrieval_cache_ttl_s: float = Field(default=600)
+    # Semantic answer cache: reuse an answer when a question in the same scope is at least
+    # this similar (cosine) to a cached one; size 0 disables it.
+    answer_cache_size: int = Field(default=256)
+    answer_cache_ttl_s: float = Field(default=3600)
+    answer_cache_threshold: float = Field(default=0.95)
+    # Identical queries arriving while one runs share its result; a leader that has not
+    # finished after the timeout is replaced, 0 disables coalescing. Followers wait at most
+    # `single_flight_wait_s` before answering the query themselves.
+    single_flight_timeout_s: float = Field(default=60)
+    single_flight_wait_s: float = Field(default=15)
     
     database_url: str = Field(default="")
     
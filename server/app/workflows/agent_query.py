@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import asyncio
 import dataclasses
+import hashlib
 import json
 import logging
+import time
 import typing
 from typing import Any, Literal
 
@@ -12,10 +15,30 @@ from pydantic import BaseModel
 from sqlmodel import Session
 
 from app.api.schemas import Citation
-from app.services.db import engine
-from app.services.embeddings import OpenAIEmbedder
-from app.services.repositories import ChatRepo, DocumentRepo
-from app.services.vector_store import QdrantVectorStore
+from app.services.context_policy import ContextPolicy, interleave_groups
+from app.services.db import async_session, engine
+from app.services.embeddings import AsyncOpenAIEmbedder
+from app.services.intent import LocalIntentClassifier
+from app.services.metrics import intent_metrics
+from app.services.prompts import build_generation_prompt
+from app.services.query_cache import (
+    answer_cache,
+    normalize_question,
+    retrieval_cache,
+    scope_fingerprint,
+)
+from app.services.repositories import AsyncDocumentRepo, ChatRepo
+from app.services.rerank import mmr_rerank
+from app.services.single_flight import query_flights
+from app.services.vector_store import (
+    MetadataFilter,
+    RetrievedChunk,
+    folder_scope,
+    folder_scopes_ready,
+    fuse_results,
+    get_async_vector_store,
+    search_chunk_text,
+)
 from app.settings import settings
 from app.workflows.inngest_app import get_inngest_client
 
@@ -23,7 +46,19 @@ logger = logging.getLogger(__name__)
 
 inngest_client = get_inngest_client()
 
-embedder = OpenAIEmbedder(api_key=settings.openai_api_key, model=settings.embed_model)
+embedder = AsyncOpenAIEmbedder(
+    api_key=settings.openai_api_key, model=settings.embed_model, cache_size=1024
+)
+
+intent_classifier = LocalIntentClassifier(embedder.embed)
+
+context_policy = ContextPolicy(
+    min_chunks=settings.context_min_chunks,
+    max_chunks=settings.context_max_chunks,
+    relative_drop=settings.context_relative_drop,
+    flat_band=settings.context_flat_band,
+    score_floor=settings.context_score_floor,
+)
 
 adapter = ai.openai.Adapter(
     auth_key=settings.openai_api_key,
@@ -41,62 +76,369 @@ class AgenticRAGResult(BaseModel):
     reaction: str | None = None
     message_id: int | None = None
     num_contexts: int = 0
+    timings: dict[str, float] = {}
+    # Prompt token counts: local estimate and what the provider reported (incl. cached)
+    usage: dict[str, int] = {}
+    # Served from the semantic answer cache
+    cached: bool = False
 
 
-def _retrieve_data(doc_id: str | None, folder_id: int | None, question: str, top_k: int) -> list[dict]:
+class Retrieved(BaseModel):
+    chunks: list[dict] = []
+    # Milliseconds per retrieval stage
+    timings: dict[str, float] = {}
+
+
+def _metadata_filter(filters: dict | None) -> MetadataFilter | None:
     """
-    Synchronous helper to retrieve relevant chunks from Qdrant.
+    Builds the vector-search metadata filter from the event's `QueryFilters` payload.
     """
-    target_sha256s: list[str] | None = None
-    is_folder_search = False
-    
-    logger.info(f"Agent Query: doc_id={doc_id}, folder_id={folder_id}")
+    if not filters:
+        return None
+    metadata = MetadataFilter(
+        page_ranges=tuple((r["start"], r.get("end")) for r in filters.get("pages") or []),
+        chunk_index_gte=filters.get("chunk_index_gte"),
+        chunk_index_lte=filters.get("chunk_index_lte"),
+    )
+    return metadata if metadata.conditions() else None
 
-    with Session(engine) as session:
-        repo = DocumentRepo(session)
+
+@dataclasses.dataclass(frozen=True)
+class _Scope:
+    # Content hashes the query can see; None for all documents
+    sha256s: set[str] | None
+    # The requested document or folder has nothing to search
+    empty: bool = False
+    # (doc_id, filename) the scope's documents give each hash they share
+    documents: dict[str, tuple[str, str]] = dataclasses.field(default_factory=dict)
+
+
+async def _resolve_scope(doc_id: str | None, folder_id: int | None) -> _Scope:
+    async with async_session() as session:
+        repo = AsyncDocumentRepo(session)
         if doc_id:
-            doc = repo.get_by_doc_id(doc_id)
-            if doc:
-                target_sha256s = [doc.sha256]
-            else:
-                return []
-        elif folder_id:
-            is_folder_search = True
-            docs = repo.get_by_folder(folder_id)
-            target_sha256s = list(set([d.sha256 for d in docs]))
-            logger.info(f"Found {len(target_sha256s)} unique hashes in folder {folder_id}")
-            if not target_sha256s:
-                return []
-
-    # Lazy init Qdrant
-    store = QdrantVectorStore(
-        url=settings.qdrant_url, 
-        api_key=settings.qdrant_api_key,
-        collection=settings.qdrant_collection, 
-        dim=settings.embed_dim
+            doc = await repo.get_by_doc_id(doc_id)
+            if doc is None:
+                return _Scope(None, empty=True)
+            return _Scope({doc.sha256}, documents={doc.sha256: (doc.doc_id, doc.source_filename)})
+        if folder_id:
+            docs = sorted(await repo.get_by_folder(folder_id), key=lambda d: d.created_at)
+            documents: dict[str, tuple[str, str]] = {}
+            for d in docs:
+                documents.setdefault(d.sha256, (d.doc_id, d.source_filename))
+            return _Scope({d.sha256 for d in docs}, empty=not docs, documents=documents)
+    return _Scope(None)
+
+
+async def _label_chunks(chunks: list[dict], scope: _Scope) -> list[dict]:
+    """
+    Chunk rows are shared by every document with the same content, so their `doc_id` and
+    `source` are those of whichever copy was ingested first. Relabels them with the
+    document the query actually searched (the oldest copy when unscoped), and drops chunks
+    whose documents were all deleted but whose points await the deletion flush. Chunks
+    outside the scope are dropped too: the scopes payload folder search filters on is only
+    rewritten by that flush after a document moves.
+    """
+    if scope.sha256s is not None:
+        chunks = [c for c in chunks if not c.get("sha256") or c["sha256"] in scope.sha256s]
+    documents = dict(scope.documents)
+    missing = sorted({c["sha256"] for c in chunks if c.get("sha256")} - documents.keys())
+    resolved = True
+    if missing:
+        try:
+            async with async_session() as session:
+                found = await AsyncDocumentRepo(session).first_by_sha256s(missing)
+            documents.update({s: (d.doc_id, d.source_filename) for s, d in found.items()})
+        except Exception as e:
+            logger.warning(f"Could not resolve chunk sources: {e}")
+            resolved = False
+    out = []
+    for c in chunks:
+        doc = documents.get(c.get("sha256") or "")
+        if doc is not None:
+            out.append({**c, "doc_id": doc[0], "source": doc[1]})
+        elif not (resolved and c.get("sha256")):
+            out.append(c)
+    return out
+
+
+async def _join_flight(
+    run_id: str, question: str, doc_id: str | None, folder_id: int | None, params: dict
+) -> dict:
+    """
+    This run's role in the flight of identical queries: same documents (by content, so
+    a folder and the document it holds coalesce), normalized question and parameters.
+    Run as a step so a replay, possibly in another worker, keeps the role.
+    """
+    scope = await _resolve_scope(doc_id, folder_id)
+    key = json.dumps(
+        [scope_fingerprint(scope.sha256s), scope.empty, normalize_question(question), params],
+        sort_keys=True,
     )
+    key = hashlib.sha1(key.encode()).hexdigest()
+    return {"key": key, "leading": query_flights.join(key, run_id)}
+
+
+def _answer_scope_key(scope: _Scope, top_k: int, filters: dict | None) -> tuple:
+    return (scope_fingerprint(scope.sha256s), top_k, json.dumps(filters, sort_keys=True))
+
+
+async def _lookup_answer(
+    doc_id: str | None, folder_id: int | None, question: str, top_k: int, filters: dict | None
+) -> dict:
+    """
+    A cached answer to a near-identical question over the same documents, if any. The
+    cache version is returned so the answer computed on a miss can be stored safely.
+    """
+    version = answer_cache.version()
+    try:
+        scope = await _resolve_scope(doc_id, folder_id)
+        if scope.empty:
+            return {"answer": None, "version": version}
+        [qvec] = await embedder.embed([question])
+        hit = answer_cache.lookup(_answer_scope_key(scope, top_k, filters), question, qvec)
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {e}")
+        hit = None
+    if hit is None:
+        return {"answer": None, "version": version}
+    answer, similarity = hit
+    logger.info(f"Answer cache hit (similarity {similarity:.3f})")
+    return {"answer": answer, "version": version}
+
+
+async def _store_answer(
+    doc_id: str | None,
+    folder_id: int | None,
+    question: str,
+    top_k: int,
+    filters: dict | None,
+    out: AgenticRAGResult,
+    version: int,
+) -> None:
+    try:
+        scope = await _resolve_scope(doc_id, folder_id)
+        [qvec] = await embedder.embed([question])
+        answer = out.model_dump(exclude={"message_id", "timings", "usage", "cached"})
+        scope_key = _answer_scope_key(scope, top_k, filters)
+        answer_cache.put(scope_key, question, qvec, answer, scope.sha256s, version)
+    except Exception as e:
+        logger.warning(f"Could not cache answer: {e}")
+
+
+async def _keyword_hits(
+    store: Any,
+    question: str,
+    limit: int,
+    sha256s: list[str] | None,
+    metadata: MetadataFilter | None,
+) -> list[RetrievedChunk]:
+    """
+    Postgres full-text hits for stores without a keyword leg of their own; empty otherwise.
+    """
+    if not settings.text_search or store.hybrid:
+        return []
+    try:
+        return await search_chunk_text(question, limit, sha256s, metadata)
+    except Exception as e:
+        logger.warning(f"Full-text search failed, using vector hits only: {e}")
+        return []
+
+
+async def _retrieve_data(
+    doc_id: str | None,
+    folder_id: int | None,
+    question: str,
+    top_k: int,
+    filters: dict | None = None,
+    expansions: list[str] | None = None,
+    mmr_lambda: float | None = None,
+    mmr_oversample: int | None = None,
+) -> dict:
+    """
+    Retrieves relevant chunks for the question. Every I/O call (scope lookup, embedding,
+    vector search) is awaited, so concurrent runs share the worker's event loop.
+    """
+    timings: dict[str, float] = {}
+    mark = time.perf_counter()
+
+    def lap(stage: str) -> None:
+        nonlocal mark
+        now = time.perf_counter()
+        timings[stage] = round((now - mark) * 1000, 2)
+        mark = now
+
+    logger.info(f"Agent Query: doc_id={doc_id}, folder_id={folder_id}")
+
+    scope = await _resolve_scope(doc_id, folder_id)
+    if scope.empty:
+        return Retrieved().model_dump()
+    # Folder search goes through the tenant index instead of a MatchAny over hashes, once
+    # every point carries its scopes
+    folder_query = bool(folder_id and not doc_id)
+    use_scopes = folder_query and await asyncio.to_thread(folder_scopes_ready)
+    target_scopes = [folder_scope(folder_id)] if use_scopes else None
+    target_sha256s = sorted(scope.sha256s) if scope.sha256s and not use_scopes else None
+    scope_sha256s = scope.sha256s
+    scope_list = sorted(scope_sha256s) if scope_sha256s else None
+    folder_hashes = len(scope_sha256s) if folder_query and scope_sha256s else 0
+    if folder_query:
+        logger.info(f"Found {folder_hashes} unique hashes in folder {folder_id}")
+
+    cache_key = (
+        "folder" if folder_hashes > 1 else "flat",
+        scope_fingerprint(scope_sha256s),
+        normalize_question(question),
+        top_k,
+        json.dumps(filters, sort_keys=True),
+        tuple(expansions or ()),
+        mmr_lambda,
+        mmr_oversample,
+    )
+    cached = retrieval_cache.get(cache_key)
+    lap("scope")
+    if cached is not None:
+        logger.info(f"Retrieval cache hit ({len(cached['chunks'])} chunks)")
+        chunks = await _label_chunks(cached["chunks"], scope)
+        return Retrieved(chunks=chunks, timings=timings).model_dump()
+    cache_version = retrieval_cache.version()
+
+    store = get_async_vector_store()
+    metadata = _metadata_filter(filters)
+    similarity = store.similarity_scores
     
-    qvec = embedder.embed([question])[0]
+    # The question plus any reformulations, embedded together and searched in one request
+    queries = [question] + [q for q in dict.fromkeys(expansions or []) if q != question]
+    if len(queries) > 1:
+        logger.info(f"Multi-query retrieval with {len(queries)} queries")
+    qvecs = await embedder.embed(queries)
+    lap("embed")
     
-    if is_folder_search:
-        effective_top_k = max(top_k, 20)
-        logger.info(f"Executing folder search with top_k={effective_top_k}...")
-        chunks = store.search(qvec, top_k=effective_top_k, sha256s=target_sha256s)
+    if folder_hashes > 1:
+        # At most `folder_doc_quota` hits per document, so a single verbose document
+        # cannot take over a comparison across the folder
+        quota = max(settings.folder_doc_quota, -(-top_k // folder_hashes))
+        logger.info(f"Executing grouped folder search: {folder_hashes} docs x {quota} hits...")
+        keywords = _keyword_hits(store, question, folder_hashes * quota, scope_list, metadata)
+        if len(queries) == 1:
+            chunks, lexical = await asyncio.gather(
+                store.search_grouped(
+                    qvecs[0],
+                    top_k_groups=folder_hashes,
+                    group_size=quota,
+                    sha256s=target_sha256s,
+                    query_text=question,
+                    scopes=target_scopes,
+                    metadata=metadata,
+                ),
+                keywords,
+            )
+        else:
+            # Grouped queries cannot be batched; the quota is applied after fusion instead
+            lists, lexical = await asyncio.gather(
+                store.search_batch(
+                    qvecs,
+                    top_k=folder_hashes * quota,
+                    sha256s=target_sha256s,
+                    query_texts=queries,
+                    scopes=target_scopes,
+                    metadata=metadata,
+                ),
+                keywords,
+            )
+            chunks = fuse_results(lists, similarity)
+        if lexical:
+            chunks = fuse_results([chunks, lexical], similarity=False)
+            similarity = False
+        lap("search")
+        chunks = interleave_groups(
+            context_policy.above_floor(chunks, similarity),
+            settings.folder_max_chunks,
+            per_group=quota,
+        )
     else:
-        chunks = store.search(qvec, top_k=top_k, sha256s=target_sha256s)
-        
-    logger.info(f"Retrieved {len(chunks)} chunks.")
-    unique_sources = {c.source for c in chunks}
-    logger.info(f"Unique sources in chunks: {unique_sources}")
-
-    return [dataclasses.asdict(c) for c in chunks]
+        lambda_ = settings.mmr_lambda if mmr_lambda is None else mmr_lambda
+        oversample = settings.mmr_oversample if mmr_oversample is None else mmr_oversample
+        use_mmr = settings.mmr_rerank and lambda_ < 1.0 and oversample > 1
+
+        # Over-fetch so the context policy can go past top_k when scores stay flat, and MMR
+        # has near-duplicates to choose between
+        limit = max(top_k, context_policy.max_chunks)
+        if use_mmr:
+            limit = max(limit, top_k * oversample)
+        keywords = _keyword_hits(store, question, limit, scope_list, metadata)
+        if len(queries) == 1:
+            ranked, lexical = await asyncio.gather(
+                store.search(
+                    qvecs[0],
+                    top_k=limit,
+                    sha256s=target_sha256s,
+                    query_text=question,
+                    scopes=target_scopes,
+                    metadata=metadata,
+                    with_vectors=use_mmr,
+                ),
+                keywords,
+            )
+        else:
+            lists, lexical = await asyncio.gather(
+                store.search_batch(
+                    qvecs,
+                    top_k=limit,
+                    sha256s=target_sha256s,
+                    query_texts=queries,
+                    scopes=target_scopes,
+                    metadata=metadata,
+                    with_vectors=use_mmr,
+                ),
+                keywords,
+            )
+            ranked = fuse_results(lists, similarity)
+        # Keyword hits are fused by rank; they carry no vector, so MMR keeps them last
+        if lexical:
+            ranked = fuse_results([ranked, lexical], similarity=False)
+            similarity = False
+        lap("search")
+
+        # The policy decides how many chunks to use; MMR decides which
+        chunks = context_policy.select(ranked, top_k, similarity=similarity)
+        if use_mmr:
+            pool = context_policy.above_floor(ranked[: len(chunks) * oversample], similarity)
+            reranked = mmr_rerank(qvecs[0], pool, len(chunks), lambda_)
+            chunks = [dataclasses.replace(c, vector=None) for c in reranked]
+            lap("mmr")
+
+    chunks = await store.expand_neighbors(chunks, settings.neighbor_window)
+    lap("expand")
+    logger.info(f"Retrieved {len(chunks)} chunks in {sum(timings.values()):.0f} ms {timings}")
+
+    # Cached unlabelled: renames and deletions of twins show up without invalidation
+    result = Retrieved(chunks=[dataclasses.asdict(c) for c in chunks], timings=timings).model_dump()
+    retrieval_cache.put(cache_key, result, scope_sha256s, version=cache_version)
+    labelled = await _label_chunks(result["chunks"], scope)
+    logger.info(f"Unique sources in chunks: {sorted({c['source'] for c in labelled})}")
+    return {**result, "chunks": labelled}
+
+
+async def _classify_local(question: str) -> dict | None:
+    """
+    Intent from the keyword rules, else from the centroid model over the question's
+    embedding (which retrieval then finds in the embedder's cache); None if it could not
+    be computed.
+    """
+    try:
+        return dataclasses.asdict(await intent_classifier.classify(question))
+    except Exception as e:
+        logger.warning(f"Local intent classification failed, falling back to the LLM: {e}")
+        return None
 
 
-def _build_context_pack(retrieved: list[dict]) -> str:
-    return "\n\n".join(
-        f"[chunk_id={c['chunk_id']} | source={c['source']} | page={c.get('page_number')} | chunk_index={c.get('chunk_index')}]\n{c['text']}"
-        for c in retrieved
-    )
+def _sampled(key: str, rate: float) -> bool:
+    """
+    Deterministic per-key sampling, so a run makes the same choice every time Inngest
+    re-enters it.
+    """
+    return int(hashlib.sha1(key.encode()).hexdigest()[:8], 16) < rate * 0xFFFFFFFF
 
 
 def _prepare_classify_prompt(question: str) -> str:
@@ -118,44 +460,31 @@ If intent is "clarify", provide a polite `clarifying_question` to ask the user.
 """.strip()
 
 
-def _prepare_generation_prompt(question: str, context_pack: str, intent: str) -> str:
-    intent_instruction = ""
-    if intent == "summarize":
-        intent_instruction = "Focus on providing a comprehensive yet concise overview. Capture the main themes and key points."
-    elif intent == "extract":
-        intent_instruction = "Focus on precision. List the extracted data clearly, preferably in bullet points or a structured format."
-    else:  # qa
-        intent_instruction = "Answer the question directly and accurately based on the evidence."
-
+def _prepare_expansion_prompt(question: str, count: int) -> str:
     return f"""
-You are DocuAgent, an advanced AI research assistant.
-Your goal is to answer the user's question using ONLY the provided context chunks.
+You rewrite search queries for a document retrieval system.
 
-Intent: {intent.upper()}
-Instruction: {intent_instruction}
-
-Guidelines:
-1. **Groundedness**: Use ONLY the context below. Do not hallucinate. If the answer is not in the context, set `needs_clarification` to true.
-2. **Citations**: You MUST cite your sources. Every distinct claim should have a citation pointing to the specific chunk.
-3. **Tone**: Professional, helpful, and concise. Use Markdown for readability.
-4. **Analysis**: Synthesize information from multiple chunks if necessary. Handle conflicts by noting the discrepancy.
-
-Context:
-{context_pack}
+Write up to {count} alternative search queries for the user request below. If the request has
+several parts, write one focused sub-question per part; otherwise rephrase it using different
+wording and likely synonyms. Keep names, numbers and identifiers exactly as written.
 
 User request:
 {question}
 
-Return ONLY JSON with:
-- answer: string (Markdown supported)
-- citations: array of {{"chunk_id":"...","source":"...","page_number":123,"quote":"..."}}
-  - quote must be short (<= ~25 words) and exact from the text.
-- needs_clarification: boolean
-- clarifying_question: string | null (Ask ONE specific question if context is missing)
-- reaction: string | null (Any single emoji that reflects the nature of the answer/finding)
+Return ONLY JSON:
+{{"queries": ["...", "..."]}}
 """.strip()
 
 
+def _parse_expansion(raw_response: dict[str, Any], count: int) -> list[str]:
+    try:
+        content = raw_response["choices"][0]["message"]["content"]
+        queries = json.loads(content).get("queries") or []
+        return [q.strip() for q in queries if isinstance(q, str) and q.strip()][:count]
+    except Exception:
+        return []
+
+
 def _parse_intent(raw_response: dict[str, Any]) -> dict:
     try:
         content = raw_response["choices"][0]["message"]["content"]
@@ -178,6 +507,15 @@ def _parse_generation(raw_response: dict[str, Any]) -> dict:
         }
 
 
+def _parse_usage(raw_response: dict[str, Any]) -> dict[str, int]:
+    usage = raw_response.get("usage") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+    }
+
+
 def _save_result_to_db(thread_id: int | None, out: AgenticRAGResult):
     if not thread_id:
         return
@@ -210,86 +548,217 @@ async def agent_query(ctx: inngest.Context):
     doc_id: str | None = ctx.event.data.get("doc_id")
     folder_id: int | None = ctx.event.data.get("folder_id")
     thread_id: int | None = ctx.event.data.get("thread_id")
-
-    # 1. Retrieve Context
-    retrieved = await ctx.step.run(
-        "retrieve", 
-        lambda: _retrieve_data(doc_id, folder_id, question, top_k)
+    filters: dict | None = ctx.event.data.get("filters")
+    mmr_lambda: float | None = ctx.event.data.get("mmr_lambda")
+    mmr_oversample: int | None = ctx.event.data.get("mmr_oversample")
+    expand_query = ctx.event.data.get("expand_query")
+    if expand_query is None:
+        expand_query = settings.query_expansion
+    use_answer_cache = (
+        ctx.event.data.get("use_answer_cache", True) and settings.answer_cache_size > 0
     )
 
-    if not retrieved:
-        out = AgenticRAGResult(
-            intent="clarify",
-            needs_clarification=True,
-            clarifying_question=(
-                "I couldn’t find relevant content in your indexed PDFs. "
-                "Try specifying doc_id (if you have many PDFs) or upload the correct file."
-            ),
-            num_contexts=0,
+    # Identical questions already being answered in this process share that run's result;
+    # each run still saves its own message to its own thread. A follower whose wait runs
+    # out, or whose leader runs in another worker, answers the query itself.
+    flight: dict | None = None
+    if settings.single_flight_timeout_s > 0:
+        params = {
+            "top_k": top_k,
+            "filters": filters,
+            "expand_query": bool(expand_query),
+            "mmr_lambda": mmr_lambda,
+            "mmr_oversample": mmr_oversample,
+            "use_answer_cache": bool(use_answer_cache),
+        }
+        flight = await ctx.step.run(
+            "join-flight", _join_flight, ctx.run_id, question, doc_id, folder_id, params
         )
+    if flight is not None and not flight["leading"]:
+        wait_s = min(settings.single_flight_wait_s, settings.single_flight_timeout_s)
+        shared = await ctx.step.run("await-in-flight", query_flights.wait, flight["key"], wait_s)
+        if shared is not None:
+            out = AgenticRAGResult(**shared)
+            _save_result_to_db(thread_id, out)
+            return out.model_dump()
+
+    def finish(out: AgenticRAGResult) -> dict:
+        if flight is not None and flight["leading"]:
+            query_flights.finish(flight["key"], ctx.run_id, out.model_dump(exclude={"message_id"}))
         _save_result_to_db(thread_id, out)
         return out.model_dump()
 
-    sources = sorted({c["source"] for c in retrieved if c.get("source")})
-    context_pack = _build_context_pack(retrieved)
-
-    # 2. Classify Intent
-    cls_response = await ctx.step.ai.infer(
-        "classify-intent",
-        adapter=adapter,
-        body={
+    # A leader that fails wakes its followers, which then answer the query themselves.
+    # Inngest's step interrupts are BaseExceptions and pass through.
+    try:
+        # 0. Reuse the answer to a near-identical question over the same documents
+        cache_version: int | None = None
+        if use_answer_cache:
+            lookup = await ctx.step.run(
+                "answer-cache", _lookup_answer, doc_id, folder_id, question, top_k, filters
+            )
+            if lookup["answer"] is not None:
+                return finish(AgenticRAGResult(**lookup["answer"], cached=True))
+            cache_version = lookup["version"]
+
+        # 1. Optional LLM reformulations of the question, searched alongside it
+        expansions: list[str] = []
+        if expand_query:
+            exp_response = await ctx.step.ai.infer(
+                "expand-query",
+                adapter=adapter,
+                body={
+                    "temperature": 0,
+                    "max_tokens": 300,
+                    "messages": [
+                        {"role": "system", "content": "Return only JSON. No markdown."},
+                        {
+                            "role": "user",
+                            "content": _prepare_expansion_prompt(
+                                question, settings.query_expansion_count
+                            ),
+                        },
+                    ],
+                },
+            )
+            expansions = _parse_expansion(
+                typing.cast(dict[str, Any], exp_response), settings.query_expansion_count
+            )
+
+        classify_body = {
             "temperature": 0,
             "max_tokens": 200,
             "messages": [
-                {"role": "system", "content": "Return only JSON. No markdown."}, 
+                {"role": "system", "content": "Return only JSON. No markdown."},
                 {"role": "user", "content": _prepare_classify_prompt(question)},
             ],
-        },
-    )
-    
-    intent_data = _parse_intent(typing.cast(dict[str, Any], cls_response))
-    intent = intent_data.get("intent") or "qa"
+        }
 
-    if intent == "clarify":
-        clarifying_q = intent_data.get("clarifying_question") or "What exactly do you want and which PDF does it refer to?"
-        out = AgenticRAGResult(
-            intent="clarify",
-            needs_clarification=True,
-            clarifying_question=clarifying_q,
-            sources=sources,
-            num_contexts=len(retrieved),
+        def retrieve():
+            return ctx.step.run(
+                "retrieve",
+                _retrieve_data,
+                doc_id, folder_id, question, top_k, filters, expansions, mmr_lambda, mmr_oversample,
+            )
+
+        def classify():
+            return ctx.step.ai.infer("classify-intent", adapter=adapter, body=classify_body)
+
+        # 2. Classify Intent. Keyword rules settle clear requests without any I/O. Otherwise the
+        # centroid model scores the question embedding (cached for retrieval), and only what
+        # neither settles goes to the LLM, which by default runs alongside retrieval.
+        local: dict | None = None
+        retrieval = None
+        if settings.local_intent:
+            local = await ctx.step.run("classify-local", _classify_local, question)
+        confident = local is not None and local["confidence"] >= settings.intent_min_confidence
+        # A sample of confident runs still asks the LLM so the two can be compared.
+        ask_llm = not confident or _sampled(ctx.run_id, settings.intent_shadow_rate)
+
+        cls_response = None
+        if ask_llm and settings.skip_retrieval_on_clarify:
+            cls_response = await classify()
+        elif ask_llm:
+            retrieval, cls_response = await ctx.group.parallel((retrieve, classify))
+
+        llm_data = None
+        if cls_response is not None:
+            llm_data = _parse_intent(typing.cast(dict[str, Any], cls_response))
+        if local is not None and (confident or llm_data is None):
+            intent_data = {"intent": local["intent"], "clarifying_question": None}
+            method = local["method"]
+        else:
+            intent_data = llm_data or {"intent": "qa", "clarifying_question": None}
+            method = "llm"
+        intent_metrics.record(
+            ctx.run_id,
+            method,
+            local=local["intent"] if local else None,
+            llm=llm_data.get("intent") if llm_data else None,
+        )
+        intent = intent_data.get("intent") or "qa"
+        clarifying_q = (
+            intent_data.get("clarifying_question")
+            or "What exactly do you want and which PDF does it refer to?"
         )
-        _save_result_to_db(thread_id, out)
-        return out.model_dump()
 
-    # 3. Generate Answer
-    gen_response = await ctx.step.ai.infer(
-        "generate-grounded",
-        adapter=adapter,
-        body={
-            "temperature": 0.2,
-            "max_tokens": 900,
-            "messages": [
-                {"role": "system", "content": "Return only JSON. No markdown."}, 
-                {"role": "user", "content": _prepare_generation_prompt(question, context_pack, intent)},
-            ],
-        },
-    )
+        if intent == "clarify" and retrieval is None:
+            out = AgenticRAGResult(
+                intent="clarify", needs_clarification=True, clarifying_question=clarifying_q
+            )
+            return finish(out)
+
+        # 3. Retrieve Context, unless it already ran in parallel with classification
+        if retrieval is None:
+            retrieval = await retrieve()
+        retrieved = retrieval["chunks"]
+        timings = retrieval["timings"]
+
+        if not retrieved:
+            out = AgenticRAGResult(
+                intent="clarify",
+                needs_clarification=True,
+                clarifying_question=(
+                    "I couldn’t find relevant content in your indexed PDFs. "
+                    "Try specifying doc_id (if you have many PDFs) or upload the correct file."
+                ),
+                num_contexts=0,
+                timings=timings,
+            )
+            return finish(out)
+
+        sources = sorted({c["source"] for c in retrieved if c.get("source")})
+
+        if intent == "clarify":
+            out = AgenticRAGResult(
+                intent="clarify",
+                needs_clarification=True,
+                clarifying_question=clarifying_q,
+                sources=sources,
+                num_contexts=len(retrieved),
+                timings=timings,
+            )
+            return finish(out)
+
+        # 4. Generate Answer from as many chunks as fit the token budget
+        prompt = build_generation_prompt(question, retrieved, intent, settings.context_token_budget)
+        sources = sorted({c["source"] for c in prompt.chunks if c.get("source")})
+        gen_response = await ctx.step.ai.infer(
+            "generate-grounded",
+            adapter=adapter,
+            body={
+                "temperature": 0.2,
+                "max_tokens": settings.generation_max_tokens,
+                "messages": prompt.messages,
+            },
+        )
 
-    gen_data = _parse_generation(typing.cast(dict[str, Any], gen_response))
-
-    # 4. Finalize & Save
-    out = AgenticRAGResult(
-        intent=intent if intent in ("qa", "summarize", "extract") else "qa",
-        answer=(gen_data.get("answer") or "").strip(),
-        citations=gen_data.get("citations") or [],
-        needs_clarification=bool(gen_data.get("needs_clarification", False)),
-        clarifying_question=gen_data.get("clarifying_question"),
-        reaction=gen_data.get("reaction"),
-        sources=sources,
-        num_contexts=len(retrieved),
-    )
-    
-    _save_result_to_db(thread_id, out)
+        gen_data = _parse_generation(typing.cast(dict[str, Any], gen_response))
+        usage = {
+            "prompt_tokens_estimated": prompt.prompt_tokens,
+            "context_tokens": prompt.context_tokens,
+            **_parse_usage(typing.cast(dict[str, Any], gen_response)),
+        }
+        logger.info(f"Generation used {len(prompt.chunks)}/{len(retrieved)} chunks, tokens {usage}")
 
-    return out.model_dump()
\ No newline at end of file
+        # 5. Finalize & Save
+        out = AgenticRAGResult(
+            intent=intent if intent in ("qa", "summarize", "extract") else "qa",
+            answer=(gen_data.get("answer") or "").strip(),
+            citations=gen_data.get("citations") or [],
+            needs_clarification=bool(gen_data.get("needs_clarification", False)),
+            clarifying_question=gen_data.get("clarifying_question"),
+            reaction=gen_data.get("reaction"),
+            sources=sources,
+            num_contexts=len(prompt.chunks),
+            timings=timings,
+            usage=usage,
+        )
+
+        if cache_version is not None and out.answer and not out.needs_clarification:
+            await _store_answer(doc_id, folder_id, question, top_k, filters, out, cache_version)
+        return finish(out)
+    except Exception:
+        if flight is not None and flight["leading"]:
+            query_flights.fail(flight["key"], ctx.run_id)
+        raise
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+from collections.abc import AsyncIterator
+from typing import Any
+
+from openai import AsyncOpenAI
+
+from app.services.prompts import build_generation_prompt
+from app.settings import settings
+from app.workflows.agent_query import (
+    AgenticRAGResult,
+    _classify_local,
+    _lookup_answer,
+    _parse_expansion,
+    _parse_generation,
+    _parse_intent,
+    _prepare_classify_prompt,
+    _prepare_expansion_prompt,
+    _retrieve_data,
+    _save_result_to_db,
+    _store_answer,
+)
+
+logger = logging.getLogger(__name__)
+
+chat_client = AsyncOpenAI(api_key=settings.openai_api_key)
+
+_ANSWER_KEY = re.compile(r'"answer"\s*:\s*"')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class AnswerFieldStream:
+    """
+    Decodes the `answer` string of a JSON object while the object is still streaming in,
+    so its text can be forwarded before the rest (citations etc.) is complete.
+    """
+
+    def __init__(self) -> None:
+        self.buf = ""
+        self.pos: int | None = None
+        self.done = False
+
+    def feed(self, delta: str) -> str:
+        self.buf += delta
+        if self.done:
+            return ""
+        if self.pos is None:
+            m = _ANSWER_KEY.search(self.buf)
+            if m is None:
+                return ""
+            self.pos = m.end()
+
+        out: list[str] = []
+        i, buf = self.pos, self.buf
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.done = True
+                i += 1
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+            # Escapes are only decoded once complete; the rest waits for the next delta.
+            if i + 1 >= len(buf):
+                break
+            if buf[i + 1] != "u":
+                out.append(_ESCAPES.get(buf[i + 1], buf[i + 1]))
+                i += 2
+                continue
+            width = 6
+            if i + 6 <= len(buf) and 0xD800 <= int(buf[i + 2 : i + 6], 16) <= 0xDBFF:
+                width = 12  # surrogate pair
+            if i + width > len(buf):
+                break
+            out.append(json.loads(f'"{buf[i : i + width]}"'))
+            i += width
+        self.pos = i
+        return "".join(out)
+
+
+def sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _classify(question: str, local: dict | None) -> dict:
+    """
+    The local intent when it is confident, else the LLM's.
+    """
+    if local is not None and local["confidence"] >= settings.intent_min_confidence:
+        return {"intent": local["intent"], "clarifying_question": None}
+    resp = await chat_client.chat.completions.create(
+        model=settings.chat_model,
+        temperature=0,
+        max_tokens=200,
+        messages=[
+            {"role": "system", "content": "Return only JSON. No markdown."},
+            {"role": "user", "content": _prepare_classify_prompt(question)},
+        ],
+    )
+    return _parse_intent(resp.model_dump())
+
+
+async def _expand(question: str) -> list[str]:
+    """
+    LLM reformulations of the question, searched alongside it.
+    """
+    count = settings.query_expansion_count
+    resp = await chat_client.chat.completions.create(
+        model=settings.chat_model,
+        temperature=0,
+        max_tokens=300,
+        messages=[
+            {"role": "system", "content": "Return only JSON. No markdown."},
+            {"role": "user", "content": _prepare_expansion_prompt(question, count)},
+        ],
+    )
+    return _parse_expansion(resp.model_dump(), count)
+
+
+async def _finish(thread_id: int | None, out: AgenticRAGResult) -> str:
+    await asyncio.to_thread(_save_result_to_db, thread_id, out)
+    return sse("final", out.model_dump())
+
+
+async def stream_agent_query(
+    question: str,
+    top_k: int,
+    doc_id: str | None = None,
+    folder_id: int | None = None,
+    thread_id: int | None = None,
+    filters: dict | None = None,
+    mmr_lambda: float | None = None,
+    mmr_oversample: int | None = None,
+    use_answer_cache: bool = True,
+    expand_query: bool | None = None,
+) -> AsyncIterator[str]:
+    """
+    The agent query as server-sent events: `meta` once retrieval is done, `token` events
+    with answer text as it is generated, then one `final` event carrying the complete
+    `AgenticRAGResult` (citations, reaction, saved message id). Failures end the stream
+    with an `error` event.
+    """
+    try:
+        cache_version: int | None = None
+        if use_answer_cache and settings.answer_cache_size > 0:
+            lookup = await _lookup_answer(doc_id, folder_id, question, top_k, filters)
+            if lookup["answer"] is not None:
+                yield await _finish(thread_id, AgenticRAGResult(**lookup["answer"], cached=True))
+                return
+            cache_version = lookup["version"]
+
+        if expand_query is None:
+            expand_query = settings.query_expansion
+        expansions = await _expand(question) if expand_query else []
+
+        # Keyword rules first; otherwise the centroid model scores the question embedding
+        # (cached for retrieval), and the LLM only classifies what neither settles
+        local = await _classify_local(question) if settings.local_intent else None
+        # Intent and retrieval are independent; run them together
+        intent_data, retrieval = await asyncio.gather(
+            _classify(question, local),
+            _retrieve_data(
+                doc_id, folder_id, question, top_k, filters, expansions,
+                mmr_lambda, mmr_oversample,
+            ),
+        )
+        intent = intent_data.get("intent") or "qa"
+        retrieved, timings = retrieval["chunks"], retrieval["timings"]
+
+        if not retrieved or intent == "clarify":
+            if retrieved:
+                clarifying_q = intent_data.get("clarifying_question") or "What exactly do you want and which PDF does it refer to?"
+            else:
+                clarifying_q = (
+                    "I couldn’t find relevant content in your indexed PDFs. "
+                    "Try specifying doc_id (if you have many PDFs) or upload the correct file."
+                )
+            out = AgenticRAGResult(
+                intent="clarify",
+                needs_clarification=True,
+                clarifying_question=clarifying_q,
+                sources=sorted({c["source"] for c in retrieved if c.get("source")}),
+                num_contexts=len(retrieved),
+                timings=timings,
+            )
+            yield await _finish(thread_id, out)
+            return
+
+        prompt = build_generation_prompt(question, retrieved, intent, settings.context_token_budget)
+        sources = sorted({c["source"] for c in prompt.chunks if c.get("source")})
+        yield sse("meta", {"intent": intent, "sources": sources, "num_contexts": len(prompt.chunks), "timings": timings})
+
+        stream = await chat_client.chat.completions.create(
+            model=settings.chat_model,
+            temperature=0.2,
+            max_tokens=settings.generation_max_tokens,
+            messages=prompt.messages,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        answer = AnswerFieldStream()
+        usage: dict[str, int] = {"prompt_tokens_estimated": prompt.prompt_tokens, "context_tokens": prompt.context_tokens}
+        async for chunk in stream:
+            if chunk.usage is not None:
+                details = chunk.usage.prompt_tokens_details
+                usage.update(
+                    prompt_tokens=chunk.usage.prompt_tokens,
+                    cached_tokens=(details.cached_tokens or 0) if details else 0,
+                    completion_tokens=chunk.usage.completion_tokens,
+                )
+            if not chunk.choices:
+                continue
+            text = answer.feed(chunk.choices[0].delta.content or "")
+            if text:
+                yield sse("token", {"text": text})
+
+        gen_data = _parse_generation({"choices": [{"message": {"content": answer.buf}}]})
+        out = AgenticRAGResult(
+            intent=intent if intent in ("qa", "summarize", "extract") else "qa",
+            answer=(gen_data.get("answer") or "").strip(),
+            citations=gen_data.get("citations") or [],
+            needs_clarification=bool(gen_data.get("needs_clarification", False)),
+            clarifying_question=gen_data.get("clarifying_question"),
+            reaction=gen_data.get("reaction"),
+            sources=sources,
+            num_contexts=len(prompt.chunks),
+            timings=timings,
+            usage=usage,
+        )
+        if cache_version is not None and out.answer and not out.needs_clarification:
+            await _store_answer(doc_id, folder_id, question, top_k, filters, out, cache_version)
+        yield await _finish(thread_id, out)
+    except Exception as e:
+        logger.exception("Streaming query failed")
+        yield sse("error", {"detail": str(e)})
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
-import uuid
-
 import inngest
+import numpy as np
 from pydantic import BaseModel
 from sqlmodel import Session
 
 from app.services.chunking import LlamaIndexChunker
 from app.services.db import engine
 from app.services.embeddings import OpenAIEmbedder
-from app.services.repositories import DocumentRepo
+from app.services.query_cache import invalidate_documents
+from app.services.repositories import ChunkRepo, DocumentRepo
 from app.services.storage import LocalStorage
-from app.services.vector_store import QdrantVectorStore
+from app.services.tokens import count_tokens
+from app.services.vector_store import (
+    chunk_point_id,
+    get_sparse_encoder,
+    get_vector_store,
+    load_scopes,
+)
 from app.settings import settings
 from app.workflows.inngest_app import get_inngest_client
 
@@ -19,6 +25,7 @@ inngest_client = get_inngest_client()
 
 chunker = LlamaIndexChunker()
 embedder = OpenAIEmbedder(api_key=settings.openai_api_key, model=settings.embed_model)
+sparse_encoder = get_sparse_encoder()
 storage = LocalStorage(settings.uploads_dir)
 
 
@@ -55,55 +62,79 @@ async def _load_and_chunk(doc_id: str, pdf_path: str, source_id: str, sha256: st
 
 def _embed_and_upsert(payload_dict: dict) -> dict:
     """
-    Synchronous helper to embed chunks and upsert to Qdrant.
+    Synchronous helper to embed chunks and bulk upload them to Qdrant.
     """
     payload = Chunked.model_validate(payload_dict)
     
     if not payload.chunks:
         return Upserted(ingested=0).model_dump()
 
-    # Lazy init Qdrant
-    store = QdrantVectorStore(
-        url=settings.qdrant_url, 
-        api_key=settings.qdrant_api_key,
-        collection=settings.qdrant_collection, 
-        dim=settings.embed_dim
-    )
+    store = get_vector_store()
     
     BATCH_SIZE = 100
-    total_ingested = 0
+    ids = []
+    payloads = []
+    vec_batches = []
+    sparse_vecs = [] if store.hybrid else None
     
     for i in range(0, len(payload.chunks), BATCH_SIZE):
         batch_chunks = payload.chunks[i : i + BATCH_SIZE]
         batch_metadatas = payload.chunk_metadatas[i : i + BATCH_SIZE]
         
-        # Embed batch
-        vecs = embedder.embed(batch_chunks)
-        
-        # Generate IDs and payloads for batch
-        ids = []
-        payloads = []
+        # Embed batch as a float32 matrix; sparse term weights are computed locally for hybrid search
+        vec_batches.append(embedder.embed_array(batch_chunks))
+        if sparse_vecs is not None:
+            sparse_vecs.extend(sparse_encoder.encode_document(t) for t in batch_chunks)
         
+        rows = []
         for j, text in enumerate(batch_chunks):
             global_index = i + j
-            # Create deterministic ID based on doc_id and index
-            chunk_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{payload.doc_id}:{global_index}"))
+            # Vector sets are owned by the content hash, so twins and re-ingests overwrite
+            # the same points instead of duplicating them
+            chunk_id = chunk_point_id(payload.sha256 or payload.doc_id, global_index)
             ids.append(chunk_id)
             
-            payloads.append({
+            rows.append({
+                "chunk_id": chunk_id,
                 "doc_id": payload.doc_id,
                 "source": payload.source_id,
                 "sha256": payload.sha256,
                 "chunk_index": global_index,
+                "page_number": batch_metadatas[j]["page_number"],
                 "text": text,
+                "token_count": count_tokens(text),
+            })
+            # Qdrant only keeps filter keys; text is hydrated from Postgres at search time
+            payloads.append({
+                "doc_id": payload.doc_id,
+                "sha256": payload.sha256,
+                "chunk_index": global_index,
                 "page_number": batch_metadatas[j]["page_number"]
             })
 
-        # Upsert batch
-        store.upsert(ids, vecs, payloads)
-        total_ingested += len(batch_chunks)
+        # Write chunk rows before vectors so every searchable point can be hydrated
+        with Session(engine) as session:
+            ChunkRepo(session).upsert_many(rows)
+
+    # Folder scopes are read after embedding so moves made meanwhile are picked up
+    scopes = load_scopes([payload.sha256]).get(payload.sha256, [])
+    for p in payloads:
+        p["scopes"] = scopes
+
+    # One parallel upload without per-batch acknowledgement, then a single barrier so the
+    # document is only marked ingested once every point is searchable.
+    store.bulk_upsert(
+        ids,
+        np.vstack(vec_batches),
+        payloads,
+        sparse_vecs,
+        batch_size=settings.qdrant_upload_batch_size,
+        parallel=settings.qdrant_upload_parallel,
+    )
+    store.wait_for_points(payload.doc_id, len(ids), timeout=settings.qdrant_upload_wait_timeout)
+    invalidate_documents([payload.sha256 or payload.doc_id])
 
-    return Upserted(ingested=total_ingested).model_dump()
+    return Upserted(ingested=len(ids)).model_dump()
 
 
 @inngest_client.create_function(
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import datetime as dt
+import logging
+
+import inngest
+from pydantic import BaseModel
+from sqlmodel import Session
+
+from app.services.db import engine
+from app.services.repositories import ChunkRepo, DocumentRepo, VectorDeletionRepo
+from app.services.storage import LocalStorage
+from app.services.vector_store import get_vector_store, sync_scopes
+from app.settings import settings
+from app.workflows.inngest_app import get_inngest_client
+
+logger = logging.getLogger(__name__)
+
+inngest_client = get_inngest_client()
+
+storage = LocalStorage(settings.uploads_dir)
+
+VECTOR_GC_EVENT = "rag/vector_gc"
+
+
+class Flushed(BaseModel):
+    claimed: int
+    deleted: list[str]
+    kept: list[str]
+
+
+def request_vector_gc() -> None:
+    """
+    Nudges the flush function after deletions were queued. Best effort: the queue lives in
+    Postgres, so anything left behind is picked up by the next flush.
+    """
+    try:
+        inngest_client.send_sync(inngest.Event(name=VECTOR_GC_EVENT, data={}))
+    except Exception as e:
+        logger.warning(f"Could not schedule vector flush: {e}")
+
+
+def _flush_batch() -> dict:
+    """
+    Deletes the vector sets, chunk rows and stored PDFs of one batch of queued hashes that
+    no document references any more. Hashes still referenced (twins, moved documents,
+    re-uploads) are kept and get their folder scopes rewritten in one batched update.
+
+    Everything from the reference check to the last delete runs in one transaction holding
+    the hashes' locks, so an upload of the same content waits instead of losing its PDF
+    or vectors to a check made just before it.
+    """
+    with Session(engine) as session:
+        queue = VectorDeletionRepo(session)
+        pending = queue.lock_batch(settings.vector_gc_batch_size)
+        if not pending:
+            return Flushed(claimed=0, deleted=[], kept=[]).model_dump()
+
+        sha256s = [p.sha256 for p in pending]
+        paths = {p.sha256: p.storage_path for p in pending}
+        queue.lock_sha256s(sha256s)
+        referenced = DocumentRepo(session).referenced_sha256s(sha256s)
+        orphans = [s for s in sha256s if s not in referenced]
+
+        # One filtered delete for the whole batch; the queue rows stay locked (and are
+        # retried) if it fails.
+        get_vector_store().delete_by_sha256s(orphans)
+        for sha256 in orphans:
+            path = paths.get(sha256)
+            if path:
+                try:
+                    storage.delete(path)
+                except Exception as e:
+                    logger.warning(f"Failed to delete stored PDF {path}: {e}")
+        ChunkRepo(session).delete_by_sha256s(orphans, commit=False)
+        # Commits the chunk deletes with the queue removal and releases the locks
+        queue.remove(sha256s)
+
+    # Surviving hashes may have gained or lost a folder. Query-time scope resolution
+    # covers the gap, so a failure requeues them for the next flush instead of failing this one.
+    try:
+        sync_scopes(sorted(referenced))
+    except Exception as e:
+        logger.warning(f"Could not sync folder scopes for {len(referenced)} hashes: {e}")
+        with Session(engine) as session:
+            VectorDeletionRepo(session).enqueue_sha256s({s: paths.get(s) for s in referenced})
+
+    return Flushed(claimed=len(sha256s), deleted=orphans, kept=sorted(referenced)).model_dump()
+
+
+@inngest_client.create_function(
+    fn_id="RAG: Flush vector deletions",
+    trigger=inngest.TriggerEvent(event=VECTOR_GC_EVENT),
+    # Bursts of deletes (a folder, several documents in a row) collapse into one run.
+    debounce=inngest.Debounce(period=dt.timedelta(seconds=settings.vector_gc_debounce_s)),
+    concurrency=[inngest.Concurrency(limit=1)],
+)
+async def flush_vector_deletions(ctx: inngest.Context):
+    deleted = 0
+    for i in range(settings.vector_gc_max_batches):
+        flushed = await ctx.step.run(f"flush-batch-{i}", _flush_batch)
+        deleted += len(flushed["deleted"])
+        if flushed["claimed"] < settings.vector_gc_batch_size:
+            break
+    return {"deleted": deleted}
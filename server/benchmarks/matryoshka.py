@@ -0,0 +1,114 @@
+"""
+Recall vs latency of two-stage (truncated candidate vector + full re-score) search.
+
+Stored chunk vectors are used as queries, each excluding its own point so it cannot find
+itself. Ground truth is an exact (brute force) search on the full vector; each configuration
+is compared against it with recall@k and p50/p95 latency. Every approximate run uses the
+collection profile's search params. Requires the Qdrant backend.
+
+    python -m benchmarks.matryoshka --queries 100 --top-k 10 --candidates 20,50,100,200
+"""
+
+import argparse
+import statistics
+import time
+
+from qdrant_client.models import Filter, HasIdCondition, Prefetch, SearchParams
+
+from app.services.vector_store import QdrantVectorStore, get_vector_store
+
+
+def _timed(fn) -> tuple[set[str], float]:
+    start = time.perf_counter()
+    points = fn()
+    return {str(p.id) for p in points}, (time.perf_counter() - start) * 1000
+
+
+def _report(name: str, recalls: list[float], latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name:<28} recall={statistics.mean(recalls):.3f}  "
+        f"p50={statistics.median(latencies):7.2f} ms  p95={p95:7.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--candidates", default="20,50,100,200")
+    args = parser.parse_args()
+
+    store = get_vector_store()
+    if not isinstance(store, QdrantVectorStore):
+        raise SystemExit("This benchmark needs the Qdrant backend (VECTOR_BACKEND=qdrant).")
+    layout = store.layout
+    if not layout.mini:
+        raise SystemExit(
+            f"Collection '{store.collection}' has no truncated vector; "
+            "run migrate_qdrant.py reindex first."
+        )
+
+    samples, _ = store.client.scroll(
+        collection_name=store.collection,
+        limit=args.queries,
+        with_payload=False,
+        with_vectors=[layout.dense],
+    )
+    # Each query excludes the point it was taken from
+    queries = [
+        (layout.dense_vector(p.vector), Filter(must_not=[HasIdCondition(has_id=[p.id])]))
+        for p in samples
+    ]
+    params = store.profile.search_params()
+    k = args.top_k
+    print(
+        f"{len(queries)} queries, top_k={k}, mini_dim={layout.mini_dim}, "
+        f"profile={store.profile.name}\n"
+    )
+
+    truth: list[set[str]] = []
+    exact_lat: list[float] = []
+    for q, not_self in queries:
+        ids, ms = _timed(lambda q=q, not_self=not_self: store.client.query_points(
+            store.collection, query=q, using=layout.dense, limit=k, query_filter=not_self,
+            search_params=SearchParams(exact=True),
+        ).points)
+        truth.append(ids)
+        exact_lat.append(ms)
+    _report("exact full-dim", [1.0] * len(queries), exact_lat)
+
+    def run(name: str, search) -> None:
+        recalls, lat = [], []
+        for (q, not_self), expected in zip(queries, truth, strict=True):
+            ids, ms = _timed(lambda q=q, not_self=not_self: search(q, not_self))
+            recalls.append(len(ids & expected) / max(1, len(expected)))
+            lat.append(ms)
+        _report(name, recalls, lat)
+
+    run("hnsw full-dim", lambda q, not_self: store.client.query_points(
+        store.collection, query=q, using=layout.dense, limit=k, query_filter=not_self,
+        search_params=params,
+    ).points)
+
+    run(f"hnsw {layout.mini_dim}-dim only", lambda q, not_self: store.client.query_points(
+        store.collection, query=q[: layout.mini_dim], using=layout.mini, limit=k,
+        query_filter=not_self, search_params=params,
+    ).points)
+
+    for c in (int(x) for x in args.candidates.split(",")):
+        run(f"two-stage candidates={c}", lambda q, not_self, c=c: store.client.query_points(
+            store.collection,
+            prefetch=Prefetch(
+                query=q[: layout.mini_dim], using=layout.mini, limit=max(c, k),
+                filter=not_self, params=params,
+            ),
+            query=q, using=layout.dense, limit=k, query_filter=not_self, search_params=params,
+        ).points)
+
+
+if __name__ == "__main__":
+    main()
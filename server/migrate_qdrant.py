@@ -0,0 +1,215 @@
+import argparse
+import os
+import sys
+
+# Add the current directory to sys.path so we can import app
+sys.path.append(os.getcwd())
+
+from sqlmodel import Session, select
+
+from app.services.db import engine
+from app.services.models import Document
+from app.services.qdrant_profiles import PROFILES, get_profile
+from app.services.repositories import ChunkRepo
+from app.services.vector_store import (
+    SCOPES_KEY,
+    QdrantVectorStore,
+    get_qdrant_client,
+    get_sparse_encoder,
+    load_chunk_texts,
+    load_scopes,
+)
+from app.settings import settings
+
+
+def _store(profile_name: str, collection: str | None = None) -> QdrantVectorStore:
+    store = QdrantVectorStore(
+        client=get_qdrant_client(),
+        collection=collection or settings.qdrant_collection,
+        dim=settings.embed_dim,
+        profile=get_profile(profile_name),
+        mini_dim=settings.matryoshka_dim,
+        candidates=settings.matryoshka_candidates,
+        sparse_encoder=get_sparse_encoder() if settings.hybrid_search else None,
+        hybrid_candidates=settings.hybrid_candidates,
+        chunk_loader=load_chunk_texts,
+    )
+    store.bootstrap()
+    return store
+
+
+def apply_profile(profile_name: str, dry_run: bool) -> None:
+    store = _store(profile_name)
+    info = store.client.get_collection(store.collection)
+    print(f"Collection '{store.collection}': {info.points_count} points, status={info.status}")
+    print(f"  current vectors:      {info.config.params.vectors}")
+    print(f"  current hnsw:         {info.config.hnsw_config}")
+    print(f"  current quantization: {info.config.quantization_config}")
+    print(f"Target profile: {store.profile}")
+
+    if dry_run:
+        print("Dry run, nothing changed.")
+        return
+
+    store.apply_profile()
+    print("Profile applied. Qdrant re-optimizes segments in the background; "
+          "watch the collection status until it is green again.")
+
+
+def reindex(target: str, profile_name: str, batch_size: int) -> None:
+    """
+    Copies every point into a new collection created with the current layout (named dense
+    vector, truncated candidate vector and BM25 sparse vector). Dense vectors are reused and
+    sparse vectors are computed locally from the chunk text, so nothing is re-embedded.
+    """
+    source = _store(profile_name)
+    if target == source.collection:
+        raise SystemExit("Target collection must differ from the source collection.")
+    dest = _store(profile_name, collection=target)
+    print(f"Reindexing '{source.collection}' -> '{dest.collection}' with layout {dest.layout}")
+
+    copied = 0
+    offset = None
+    while True:
+        points, offset = source.client.scroll(
+            collection_name=source.collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            payloads = [p.payload or {} for p in points]
+            # New collections are flagged as scoped, so points copied from before scoped
+            # search get their scopes here
+            unscoped = [pl for pl in payloads if SCOPES_KEY not in pl and pl.get("sha256")]
+            if unscoped:
+                scopes = load_scopes(sorted({pl["sha256"] for pl in unscoped}))
+                for pl in unscoped:
+                    pl[SCOPES_KEY] = scopes.get(pl["sha256"], [])
+            sparse = None
+            if dest.layout.sparse and dest.sparse_encoder:
+                texts = load_chunk_texts(
+                    [str(p.id) for p in points if "text" not in (p.payload or {})]
+                )
+                sparse = [
+                    dest.sparse_encoder.encode_document(
+                        pl["text"] if "text" in pl else texts.get(str(p.id), ("", "", None))[1]
+                    )
+                    for p, pl in zip(points, payloads, strict=True)
+                ]
+            dest.upsert(
+                [str(p.id) for p in points],
+                [source.layout.dense_vector(p.vector) for p in points],
+                payloads,
+                sparse,
+            )
+            copied += len(points)
+            print(f"  copied {copied} points")
+        if offset is None:
+            break
+
+    print(f"Done. Set QDRANT_COLLECTION={dest.collection} and restart the server; "
+          f"delete '{source.collection}' once the new collection is verified.")
+
+
+def slim_payloads(batch_size: int) -> None:
+    """
+    Moves chunk text out of Qdrant payloads into the Postgres chunks table, leaving only
+    ids and filter keys in Qdrant. Safe to re-run.
+    """
+    store = _store(settings.qdrant_profile)
+    moved = 0
+    offset = None
+    while True:
+        points, offset = store.client.scroll(
+            collection_name=store.collection,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        fat = [p for p in points if p.payload and "text" in p.payload]
+        if fat:
+            rows = [
+                {
+                    "chunk_id": str(p.id),
+                    "doc_id": p.payload["doc_id"],
+                    "sha256": p.payload.get("sha256", ""),
+                    "source": p.payload.get("source", ""),
+                    "chunk_index": p.payload.get("chunk_index", 0),
+                    "page_number": p.payload.get("page_number"),
+                    "text": p.payload["text"],
+                }
+                for p in fat
+            ]
+            with Session(engine) as session:
+                ChunkRepo(session).upsert_many(rows)
+            store.client.delete_payload(
+                collection_name=store.collection,
+                keys=["text", "source"],
+                points=[p.id for p in fat],
+            )
+            moved += len(fat)
+            print(f"  moved {moved} chunks to Postgres")
+        if offset is None:
+            break
+    print(f"Done. {moved} payloads slimmed.")
+
+
+def backfill_scopes(batch_size: int) -> None:
+    """
+    Writes the folder scopes payload (and its tenant index) for points ingested before
+    scoped search. Safe to re-run.
+    """
+    store = _store(settings.qdrant_profile)
+    with Session(engine) as session:
+        sha256s = sorted(set(session.exec(select(Document.sha256)).all()))
+    print(f"Backfilling scopes for {len(sha256s)} content hashes in '{store.collection}'")
+    done = 0
+    for i in range(0, len(sha256s), batch_size):
+        scopes = load_scopes(sha256s[i : i + batch_size])
+        store.set_scopes(scopes)
+        done += len(scopes)
+        print(f"  updated {done} hashes")
+    # Folder queries switch from content-hash filters to the tenant index
+    store.mark_scopes_ready()
+    print("Done. Collection flagged as backfilled.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qdrant collection maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_profile = sub.add_parser(
+        "apply-profile", help="Migrate an existing collection to a performance profile"
+    )
+    p_profile.add_argument("--profile", default=settings.qdrant_profile, choices=sorted(PROFILES))
+    p_profile.add_argument("--dry-run", action="store_true")
+
+    p_reindex = sub.add_parser(
+        "reindex", help="Copy points into a new collection with the current vector layout"
+    )
+    p_reindex.add_argument("--target", required=True, help="Name of the new collection")
+    p_reindex.add_argument("--profile", default=settings.qdrant_profile, choices=sorted(PROFILES))
+    p_reindex.add_argument("--batch-size", type=int, default=256)
+
+    p_slim = sub.add_parser(
+        "slim-payloads", help="Move chunk text from Qdrant payloads into Postgres"
+    )
+    p_slim.add_argument("--batch-size", type=int, default=256)
+
+    p_scopes = sub.add_parser(
+        "backfill-scopes", help="Write folder scope payloads for tenant-indexed search"
+    )
+    p_scopes.add_argument("--batch-size", type=int, default=256)
+
+    args = parser.parse_args()
+    if args.command == "apply-profile":
+        apply_profile(args.profile, args.dry_run)
+    elif args.command == "reindex":
+        reindex(args.target, args.profile, args.batch_size)
+    elif args.command == "slim-payloads":
+        slim_payloads(args.batch_size)
+    elif args.command == "backfill-scopes":
+        backfill_scopes(args.batch_size)
@@ -15,7 +15,7 @@ from alembic import command
 # Checking imports in app/main.py or app/services/db.py...
 # I'll rely on what's available or try to import everything.
 from app.services.db import engine
-from app.services.vector_store import QdrantVectorStore
+from app.services.vector_store import get_qdrant_client, get_vector_store
 from app.settings import settings
 
 
@@ -49,23 +49,12 @@ def reset_postgres():
 def reset_qdrant():
     print(f"Resetting Qdrant collection: {settings.qdrant_collection}...")
     try:
-        store = QdrantVectorStore(
-            url=settings.qdrant_url,
-            api_key=settings.qdrant_api_key,
-            collection=settings.qdrant_collection,
-            dim=settings.embed_dim
-        )
         # Delete the collection
-        store.client.delete_collection(settings.qdrant_collection)
+        get_qdrant_client().delete_collection(settings.qdrant_collection)
         print("Qdrant collection deleted.")
         
-        # Re-create (happens automatically in init if not exists, so we just init)
-        store = QdrantVectorStore(
-            url=settings.qdrant_url,
-            api_key=settings.qdrant_api_key,
-            collection=settings.qdrant_collection,
-            dim=settings.embed_dim
-        )
+        # Re-create (bootstrap creates the collection if it does not exist)
+        get_vector_store()
         print("Qdrant collection recreated.")
     except Exception as e:
         print(f"Error resetting Qdrant: {e}")
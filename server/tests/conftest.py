@@ -0,0 +1,8 @@
+from __future__ import annotations
+
+import os
+
+# Workflow modules build their clients at import; placeholders keep them importable
+# without a database or API key. Tests never reach either.
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.workflows.agent_query import _label_chunks, _Scope
+
+
+def _chunk(chunk_id: str, sha256: str) -> dict:
+    return {"chunk_id": chunk_id, "sha256": sha256, "doc_id": "first", "source": "first.pdf"}
+
+
+def test_label_chunks_relabels_with_the_scoped_document():
+    scope = _Scope({"a"}, documents={"a": ("doc-2", "copy.pdf")})
+    [chunk] = asyncio.run(_label_chunks([_chunk("c1", "a")], scope))
+    assert (chunk["doc_id"], chunk["source"]) == ("doc-2", "copy.pdf")
+
+
+def test_label_chunks_drops_hits_outside_the_scope():
+    # e.g. a document moved out of the folder whose scopes payload the flush has not
+    # rewritten yet
+    scope = _Scope({"a"}, documents={"a": ("doc-1", "a.pdf")})
+    chunks = asyncio.run(_label_chunks([_chunk("c1", "a"), _chunk("c2", "moved")], scope))
+    assert [c["chunk_id"] for c in chunks] == ["c1"]
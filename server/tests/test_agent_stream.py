@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+
+from app.workflows import agent_stream
+from app.workflows.agent_stream import AnswerFieldStream
+
+
+def _feed(deltas: list[str]) -> tuple[str, list[str]]:
+    stream = AnswerFieldStream()
+    out = [stream.feed(d) for d in deltas]
+    return "".join(out), out
+
+
+def _split_everywhere(text: str):
+    for i in range(1, len(text)):
+        yield [text[:i], text[i:]]
+
+
+ANSWER = 'Line 1\nTab\there "quoted" \\ slash/ é 😀 done'
+DOC = json.dumps({"answer": ANSWER, "citations": []})
+
+
+def test_whole_document_in_one_delta():
+    text, _ = _feed([DOC])
+    assert text == ANSWER
+
+
+@pytest.mark.parametrize("deltas", list(_split_everywhere(DOC)))
+def test_any_split_point_decodes_the_same(deltas):
+    assert _feed(deltas)[0] == ANSWER
+
+
+def test_char_by_char_with_escapes_and_surrogate_pair():
+    text, out = _feed(list(DOC))
+    assert text == ANSWER
+    # Nothing is emitted half-decoded
+    assert all("\\" not in piece or piece == "\\" for piece in out)
+
+
+def test_surrogate_pair_split_between_its_halves():
+    doc = '{"answer": "a\\ud83d\\ude00b"}'
+    cut = doc.index("\\ude00")
+    text, out = _feed([doc[:cut], doc[cut:]])
+    assert text == "a😀b"
+    assert out == ["a", "😀b"]
+
+
+def test_escape_split_after_backslash():
+    text, out = _feed(['{"answer": "x\\', 'ny"}'])
+    assert text == "x\ny"
+    assert out == ["x", "\ny"]
+
+
+def test_key_split_across_deltas_and_text_after_answer_ignored():
+    text, _ = _feed(['{"ans', 'wer"', ': "hi', '", "reaction": "x"}'])
+    assert text == "hi"
+
+
+def test_buffer_keeps_the_full_document():
+    stream = AnswerFieldStream()
+    for d in (DOC[:10], DOC[10:]):
+        stream.feed(d)
+    assert stream.buf == DOC
+    assert stream.done
+
+
+def test_llm_classification_runs_alongside_retrieval(monkeypatch):
+    started: dict[str, asyncio.Event] = {}
+
+    async def both_started(name: str) -> None:
+        started[name].set()
+        # Deadlocks (and times out) if the other call only starts after this one returns
+        await asyncio.wait_for(asyncio.gather(*(e.wait() for e in started.values())), 1)
+
+    async def classify(question, local):
+        assert local is None
+        await both_started("classify")
+        return {"intent": "qa", "clarifying_question": None}
+
+    async def retrieve(*args, **kwargs):
+        await both_started("retrieve")
+        return {"chunks": [], "timings": {}}
+
+    async def classify_local(question):
+        return None
+
+    async def finish(thread_id, out):
+        return out
+
+    monkeypatch.setattr(agent_stream, "_classify_local", classify_local)
+    monkeypatch.setattr(agent_stream, "_classify", classify)
+    monkeypatch.setattr(agent_stream, "_retrieve_data", retrieve)
+    monkeypatch.setattr(agent_stream, "_finish", finish)
+
+    async def run():
+        started.update(classify=asyncio.Event(), retrieve=asyncio.Event())
+        stream = agent_stream.stream_agent_query(
+            "Who signed it?", 5, use_answer_cache=False, expand_query=False
+        )
+        return [event async for event in stream]
+
+    [out] = asyncio.run(run())
+    assert out.intent == "clarify" and out.num_contexts == 0
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from app.services.context_pack import build_context_pack, strip_overlap
+
+
+def _chunk(chunk_id: str, text: str, index: int | None, page: int = 1, source: str = "a.pdf"):
+    return {
+        "chunk_id": chunk_id,
+        "text": text,
+        "chunk_index": index,
+        "page_number": page,
+        "source": source,
+        "sha256": f"sha-{source}",
+    }
+
+
+PREV = "The agreement may be terminated by either party with sixty days written notice."
+NEXT = "sixty days written notice. Termination does not affect accrued rights."
+
+
+def test_strip_overlap_removes_the_repeated_prefix():
+    assert strip_overlap(PREV, NEXT) == "Termination does not affect accrued rights."
+
+
+def test_strip_overlap_keeps_unrelated_or_short_text():
+    assert strip_overlap(PREV, "Something else entirely, with no overlap.") == (
+        "Something else entirely, with no overlap."
+    )
+    assert strip_overlap(PREV, "notice.") == "notice."
+
+
+def test_strip_overlap_can_empty_a_contained_chunk():
+    tail = PREV[-30:]
+    assert strip_overlap(PREV, tail) == ""
+
+
+def test_consecutive_chunks_share_one_header_without_overlap():
+    pack = build_context_pack([_chunk("c2", NEXT, 1), _chunk("c1", PREV, 0)])
+    assert pack.count("### source=a.pdf | page=1") == 1
+    assert pack.index("[chunk_id=c1]") < pack.index("[chunk_id=c2]")
+    assert pack.count("sixty days written notice") == 1
+    assert "[...]" not in pack
+
+
+def test_gap_marker_between_non_adjacent_chunks():
+    pack = build_context_pack([_chunk("c1", PREV, 0), _chunk("c5", "Governing law is Ohio.", 4)])
+    assert "[...]" in pack
+
+
+def test_duplicates_and_groups_split_by_page_and_source():
+    chunks = [
+        _chunk("c1", PREV, 0),
+        _chunk("c1", PREV, 0),
+        _chunk("c9", "Page two text.", 8, page=2),
+        _chunk("x1", "Other file.", 0, source="b.pdf"),
+    ]
+    pack = build_context_pack(chunks)
+    assert pack.count("[chunk_id=c1]") == 1
+    assert "### source=a.pdf | page=2" in pack
+    assert "### source=b.pdf | page=1" in pack
+
+
+def test_chunk_covered_by_its_predecessor_is_cited_through_it():
+    chunks = [
+        _chunk("c1", PREV, 0),
+        # Entirely repeats the end of c1, and c3 the end of c2
+        _chunk("c2", PREV[-30:], 1),
+        _chunk("c3", PREV[-25:], 2),
+        _chunk("c4", NEXT, 3),
+    ]
+    pack = build_context_pack(chunks)
+    assert f"[chunk_id=c1, c2, c3]\n{PREV}" in pack
+    assert "[chunk_id=c4]" in pack
+    assert pack.count("[chunk_id=") == 2
+
+
+def test_group_without_text_gets_no_header():
+    pack = build_context_pack([_chunk("c1", PREV, 0, page=1), _chunk("e1", "   ", 5, page=3)])
+    assert "page=3" not in pack
+    assert pack.count("###") == 1
+
+
+def test_empty_input():
+    assert build_context_pack([]) == ""
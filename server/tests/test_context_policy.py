@@ -0,0 +1,66 @@
+from app.services.context_policy import ContextPolicy, interleave_groups
+from app.services.vector_store import RetrievedChunk
+
+
+def _hits(*scores: float | None, sha: str = "doc") -> list[RetrievedChunk]:
+    return [
+        RetrievedChunk(chunk_id=f"{sha}-{i}", source="s", text="t", sha256=sha, score=s)
+        for i, s in enumerate(scores)
+    ]
+
+
+policy = ContextPolicy(
+    min_chunks=2, max_chunks=5, relative_drop=0.2, flat_band=0.05, score_floor=0.2
+)
+
+
+def test_select_runs_past_target_while_scores_are_flat():
+    hits = _hits(0.90, 0.89, 0.88, 0.87, 0.80)
+    # The fifth hit is outside the flat band of the best score.
+    assert len(policy.select(hits, 2)) == 4
+
+
+def test_select_never_exceeds_max_chunks():
+    assert len(policy.select(_hits(*[0.9] * 10), 8)) == 5
+
+
+def test_select_cuts_at_a_score_drop_and_the_floor():
+    assert len(policy.select(_hits(0.9, 0.85, 0.5, 0.49), 4)) == 2
+    assert len(policy.select(_hits(0.3, 0.25, 0.21, 0.19), 4)) == 3
+
+
+def test_select_keeps_min_chunks_regardless_of_scores():
+    assert len(policy.select(_hits(0.9, 0.1, 0.05), 3)) == 2
+
+
+def test_select_cuts_rank_only_scores_at_target():
+    assert len(policy.select(_hits(0.03, 0.02, 0.01), 2, similarity=False)) == 2
+    assert len(policy.select(_hits(0.9, None, 0.8), 2)) == 2
+    assert policy.select([], 3) == []
+
+
+def test_folder_selection_caps_each_document():
+    chunks = _hits(0.9, 0.8, 0.7, sha="a") + _hits(0.6, 0.1, sha="b") + _hits(0.5, sha="c")
+    kept = interleave_groups(policy.above_floor(chunks), cap=10, per_group=2)
+    # Two per document at most, and b's second hit is under the floor.
+    assert [c.chunk_id for c in kept] == ["a-0", "b-0", "c-0", "a-1"]
+
+
+def test_interleave_gives_every_document_a_turn_before_seconds():
+    chunks = _hits(0.9, 0.8, 0.7, sha="a") + _hits(0.6, 0.5, sha="b") + _hits(0.4, sha="c")
+    kept = interleave_groups(chunks, cap=4)
+    assert [c.chunk_id for c in kept] == ["a-0", "b-0", "c-0", "a-1"]
+
+
+def test_interleave_drains_uneven_groups():
+    chunks = _hits(0.9, 0.8, 0.7, 0.6, sha="a") + _hits(0.5, sha="b")
+    kept = interleave_groups(chunks, cap=10)
+    assert [c.chunk_id for c in kept] == ["a-0", "b-0", "a-1", "a-2", "a-3"]
+
+
+def test_interleave_keeps_group_order_and_stops_at_cap():
+    # Groups are ordered by their first appearance, not by document id.
+    chunks = _hits(0.9, 0.3, sha="z") + _hits(0.8, sha="a")
+    assert [c.chunk_id for c in interleave_groups(chunks, cap=10)] == ["z-0", "a-0", "z-1"]
+    assert [c.chunk_id for c in interleave_groups(chunks, cap=1)] == ["z-0"]
+    assert interleave_groups([], cap=3) == []
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.services.intent import CentroidClassifier, LocalIntentClassifier, rule_intent
+
+
+@pytest.mark.parametrize(
+    ("question", "intent"),
+    [
+        ("Tell me about it.", "clarify"),
+        ("hello", "clarify"),
+        ("", "clarify"),
+        ("Summarize the report", "summarize"),
+        ("Give me a TL;DR of chapter 2", "summarize"),
+        ("List all dates in the contract", "extract"),
+        ("Find every invoice numbers mentioned", "extract"),
+        ("What are all the amounts due?", "extract"),
+        ("What are the main findings of this paper?", "summarize"),
+        ("What is this document about?", "summarize"),
+        # Plain questions are left to the centroid model or the LLM
+        ("What is the notice period for termination?", None),
+        ("Can you help me with this?", None),
+        ("Who signed it?", None),
+        ("Summarize and list every figures", None),
+    ],
+)
+def test_rule_intent(question: str, intent: str | None):
+    guess = rule_intent(question)
+    assert (guess.intent if guess else None) == intent
+    if guess:
+        assert guess.method == "rules"
+        assert guess.confidence == 1.0
+
+
+def test_centroid_prediction_and_margin():
+    model = CentroidClassifier.fit({"qa": [[1.0, 0.0]], "summarize": [[0.0, 1.0]]})
+    guess = model.predict([0.9, 0.1])
+    assert guess.intent == "qa"
+    assert guess.method == "centroid"
+    assert 0.0 < guess.confidence < 1.0
+    assert model.predict([0.5, 0.5]).confidence == pytest.approx(0.0, abs=1e-6)
+
+
+def test_classifier_embeds_only_what_the_rules_leave_open():
+    embedded: list[list[str]] = []
+
+    async def embed(texts: list[str]) -> list[list[float]]:
+        embedded.append(texts)
+        return [list(np.eye(4)[hash(t) % 4]) for t in texts]
+
+    clf = LocalIntentClassifier(embed)
+
+    async def run():
+        assert (await clf.classify("Summarize this")).method == "rules"
+        assert embedded == []
+        given = await clf.classify("Who signed it?", [1.0, 0.0, 0.0, 0.0])
+        return given, await clf.classify("Who signed it?")
+
+    given, embedded_guess = asyncio.run(run())
+    assert given.method == embedded_guess.method == "centroid"
+    # The seed examples once, then the question when no vector was given
+    assert embedded[1:] == [["Who signed it?"]]
+    assert "Who signed it?" not in embedded[0]
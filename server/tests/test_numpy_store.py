@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pytest
+
+from app.domain.errors import VectorStoreError
+from app.services.numpy_store import NumpyVectorStore
+from app.services.vector_store import MetadataFilter
+
+DIM = 4
+
+
+def _loader(ids: list[str]) -> dict[str, tuple[str, str, int | None]]:
+    return {i: ("a.pdf", f"text of {i}", 3) for i in ids}
+
+
+def _open(path) -> NumpyVectorStore:
+    return NumpyVectorStore(str(path), DIM, chunk_loader=_loader)
+
+
+def _vec(*values: float) -> list[float]:
+    return list(values) + [0.0] * (DIM - len(values))
+
+
+def _payload(sha256: str, index: int, page: int, scopes: list[str] | None = None) -> dict:
+    return {
+        "doc_id": f"doc-{sha256}",
+        "sha256": sha256,
+        "chunk_index": index,
+        "page_number": page,
+        "scopes": scopes,
+    }
+
+
+@pytest.fixture
+def store(tmp_path) -> NumpyVectorStore:
+    s = _open(tmp_path)
+    s.upsert(
+        ["a0", "a1", "b0"],
+        [_vec(1, 0), _vec(0.9, 0.1), _vec(0, 1)],
+        [_payload("a", 0, 1, ["root"]), _payload("a", 1, 2, ["root"]), _payload("b", 0, 5)],
+    )
+    return s
+
+
+def test_search_ranks_by_cosine_and_hydrates_text(store):
+    hits = store.search(_vec(1, 0), top_k=2)
+    assert [h.chunk_id for h in hits] == ["a0", "a1"]
+    assert hits[0].score == pytest.approx(1.0, abs=1e-3)
+    assert hits[0].text == "text of a0"
+    assert hits[0].sha256 == "a" and hits[0].page_number == 1
+    assert store.search(_vec(1, 0), top_k=10, with_vectors=True)[0].vector is not None
+
+
+def test_filters(store):
+    assert {h.chunk_id for h in store.search(_vec(1, 0), 10, sha256s=["b"])} == {"b0"}
+    assert {h.chunk_id for h in store.search(_vec(1, 0), 10, doc_ids=["doc-a"])} == {"a0", "a1"}
+    assert {h.chunk_id for h in store.search(_vec(1, 0), 10, scopes=["root"])} == {"a0", "a1"}
+    pages = MetadataFilter(page_ranges=((2, None),))
+    assert {h.chunk_id for h in store.search(_vec(1, 0), 10, metadata=pages)} == {"a1", "b0"}
+    first = MetadataFilter(chunk_index_lte=0)
+    hits = store.search(_vec(1, 0), 10, sha256s=["a"], metadata=first)
+    assert [h.chunk_id for h in hits] == ["a0"]
+    assert store.search(_vec(1, 0), 10, sha256s=["missing"]) == []
+
+
+def test_batch_and_grouped_search(store):
+    lists = store.search_batch([_vec(1, 0), _vec(0, 1)], top_k=1)
+    assert [[h.chunk_id for h in hits] for hits in lists] == [["a0"], ["b0"]]
+    grouped = store.search_grouped(_vec(1, 0), top_k_groups=2, group_size=1)
+    assert [h.chunk_id for h in grouped] == ["a0", "b0"]
+
+
+def test_upsert_replaces_existing_rows(store):
+    store.upsert(["a0"], [_vec(0, 0, 1)], [_payload("a", 0, 9, ["root"])])
+    hits = store.search(_vec(0, 0, 1), top_k=1)
+    assert hits[0].chunk_id == "a0" and hits[0].page_number == 9
+    assert len(store.search(_vec(1, 0), top_k=10)) == 3
+
+
+def test_delete_and_retrieve(store):
+    store.delete_by_sha256s(["a"])
+    assert [h.chunk_id for h in store.search(_vec(1, 0), 10)] == ["b0"]
+    store.delete_by_doc_id("doc-b")
+    assert store.search(_vec(1, 0), 10) == []
+    assert store.retrieve(["a0", "b0"]) == []
+
+
+def test_scopes_ready_tracks_unscoped_rows(store):
+    assert not store.scopes_ready()
+    store.set_scopes({"b": ["folder:1"]})
+    assert store.scopes_ready()
+    assert [h.chunk_id for h in store.search(_vec(0, 1), 10, scopes=["folder:1"])] == ["b0"]
+    store.upsert(["c0"], [_vec(1, 1)], [_payload("c", 0, 1)])
+    assert not store.scopes_ready()
+    store.delete_by_sha256s(["c"])
+    assert store.scopes_ready()
+
+
+def test_state_survives_reopening(store, tmp_path):
+    store.set_scopes({"b": []})
+    store.delete_by_sha256s(["a"])
+    reopened = _open(tmp_path)
+    assert [h.chunk_id for h in reopened.search(_vec(0, 1), 10)] == ["b0"]
+    assert reopened.scopes_ready()
+
+
+def test_writes_append_to_the_log_and_other_instances_catch_up(store, tmp_path):
+    other = _open(tmp_path)
+    size = (tmp_path / "index.jsonl").stat().st_size
+    store.set_scopes({"b": ["folder:2"]})
+    lines = (tmp_path / "index.jsonl").read_bytes()[size:].splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["b0"]
+    assert [h.chunk_id for h in other.search(_vec(0, 1), 10, scopes=["folder:2"])] == ["b0"]
+    other.upsert(["d0"], [_vec(0, 0, 0, 1)], [_payload("d", 0, 1, [])])
+    assert store.search(_vec(0, 0, 0, 1), 1)[0].chunk_id == "d0"
+
+
+def test_compaction_rewrites_the_log(tmp_path):
+    s = _open(tmp_path)
+    ids = [f"x{i}" for i in range(10)]
+    s.upsert(ids, np.eye(DIM)[np.arange(10) % DIM], [_payload(i, 0, 1, []) for i in ids])
+    other = _open(tmp_path)
+    s.delete_by_sha256s(ids[:6])
+    lines = (tmp_path / "index.jsonl").read_text().splitlines()
+    assert len(lines) == 1 + 4  # header + live rows
+    assert {h.chunk_id for h in s.search(_vec(1, 0), 10)} == set(ids[6:])
+    assert {h.chunk_id for h in other.search(_vec(1, 0), 10)} == set(ids[6:])
+
+
+def test_legacy_index_is_imported(tmp_path):
+    vectors = np.memmap(tmp_path / "vectors.f16", dtype=np.float16, mode="w+", shape=(1024, DIM))
+    vectors[0], vectors[1] = _vec(1, 0), _vec(0, 1)
+    vectors.flush()
+    del vectors
+    (tmp_path / "index.json").write_text(json.dumps({
+        "dim": DIM,
+        "ids": ["old", "gone"],
+        "payloads": [_payload("a", 0, 1), _payload("b", 0, 1)],
+        "alive": [True, False],
+    }))
+    s = _open(tmp_path)
+    assert [h.chunk_id for h in s.search(_vec(1, 0), 10)] == ["old"]
+    assert not (tmp_path / "index.json").exists()
+    assert [h.chunk_id for h in _open(tmp_path).search(_vec(1, 0), 10)] == ["old"]
+
+
+def test_dimension_mismatch_is_rejected(store, tmp_path):
+    with pytest.raises(VectorStoreError):
+        NumpyVectorStore(str(tmp_path), DIM + 1)
+
+
+def test_set_scopes_updates_several_hashes_in_one_append(store, tmp_path):
+    size = (tmp_path / "index.jsonl").stat().st_size
+    store.set_scopes({"a": ["folder:1"], "b": ["folder:2"]})
+    appended = (tmp_path / "index.jsonl").read_bytes()[size:].splitlines()
+    assert sorted(json.loads(line)["id"] for line in appended) == ["a0", "a1", "b0"]
+    assert {h.chunk_id for h in store.search(_vec(1, 0), 10, scopes=["folder:1"])} == {"a0", "a1"}
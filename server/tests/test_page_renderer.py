@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.domain.errors import RenderRequestError
+from app.services import page_renderer
+from app.services.page_renderer import PageRenderer, RenderKey
+
+
+@pytest.fixture
+def renderer(tmp_path, monkeypatch):
+    calls: list[int] = []
+    release = threading.Event()
+
+    def fake_render(pdf_path, page_number, dpi, fmt, clip):
+        calls.append(page_number)
+        release.wait(5)
+        if page_number < 1:
+            raise ValueError("Page out of range")
+        time.sleep(0.01)
+        return f"page-{page_number}".encode()
+
+    monkeypatch.setattr(page_renderer, "_render_page", fake_render)
+    r = PageRenderer(str(tmp_path), max_cache_mb=1, max_workers=2)
+    pool = ThreadPoolExecutor(2)
+    monkeypatch.setattr(r, "_get_pool", lambda: pool)
+    r.calls, r.release = calls, release
+    yield r
+    release.set()
+    pool.shutdown()
+
+
+def test_concurrent_requests_share_one_render(renderer):
+    async def main():
+        key = RenderKey("abc", 1, 100)
+        pending = asyncio.gather(*(renderer.render("x.pdf", key) for _ in range(3)))
+        await asyncio.sleep(0.05)
+        renderer.release.set()
+        assert await pending == [b"page-1"] * 3
+        assert renderer.calls == [1]
+        # Served from the disk cache afterwards
+        assert await renderer.render("x.pdf", key) == b"page-1"
+        assert renderer.calls == [1]
+
+    asyncio.run(main())
+
+
+def test_cancelled_requester_does_not_cancel_the_others(renderer):
+    async def main():
+        key = RenderKey("abc", 2, 100)
+        first = asyncio.create_task(renderer.render("x.pdf", key))
+        second = asyncio.create_task(renderer.render("x.pdf", key))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        renderer.release.set()
+        assert await second == b"page-2"
+        assert first.cancelled()
+        assert renderer.calls == [2]
+
+    asyncio.run(main())
+
+
+def test_render_errors_reach_every_waiter(renderer):
+    async def main():
+        key = RenderKey("abc", 0, 100)
+        pending = asyncio.gather(
+            renderer.render("x.pdf", key), renderer.render("x.pdf", key), return_exceptions=True
+        )
+        await asyncio.sleep(0.05)
+        renderer.release.set()
+        results = await pending
+        assert all(isinstance(r, RenderRequestError) for r in results)
+        assert renderer._inflight == {}
+
+    asyncio.run(main())
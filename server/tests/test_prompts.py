@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import tiktoken
+
+from app.services import tokens
+from app.services.prompts import CHUNK_OVERHEAD_TOKENS, fit_to_budget
+
+
+def _chunk(chunk_id: str, tokens: int, score: float | None = None) -> dict:
+    chunk = {"chunk_id": chunk_id, "text": "x", "token_count": tokens}
+    if score is not None:
+        chunk["score"] = score
+    return chunk
+
+
+def _cost(*tokens: int) -> int:
+    return sum(t + CHUNK_OVERHEAD_TOKENS for t in tokens)
+
+
+def test_everything_fits():
+    chunks = [_chunk("a", 10), _chunk("b", 20)]
+    assert fit_to_budget(chunks, _cost(10, 20)) == chunks
+
+
+def test_incoming_order_wins_over_scores():
+    # MMR may rank a diverse, lower-scored chunk ahead of a near-duplicate
+    chunks = [_chunk("a", 50, 0.2), _chunk("b", 50, 0.9), _chunk("c", 50, 0.5)]
+    kept = fit_to_budget(chunks, _cost(50, 50))
+    assert [c["chunk_id"] for c in kept] == ["a", "b"]
+
+
+def test_unscored_chunks_fill_in_retrieval_order():
+    chunks = [_chunk("a", 30), _chunk("b", 30), _chunk("c", 30)]
+    assert [c["chunk_id"] for c in fit_to_budget(chunks, _cost(30, 30))] == ["a", "b"]
+
+
+def test_smaller_chunks_still_fill_the_remainder():
+    chunks = [_chunk("a", 40), _chunk("b", 100), _chunk("c", 10)]
+    kept = fit_to_budget(chunks, _cost(40, 10))
+    assert [c["chunk_id"] for c in kept] == ["a", "c"]
+
+
+def test_first_chunk_is_kept_even_over_budget():
+    chunks = [_chunk("a", 500, 0.1), _chunk("b", 5, 0.9)]
+    assert [c["chunk_id"] for c in fit_to_budget(chunks, 10)] == ["a"]
+
+
+def test_empty_input():
+    assert fit_to_budget([], 100) == []
+
+
+def test_token_count_falls_back_to_an_estimate(monkeypatch):
+    def offline(*args, **kwargs):
+        raise OSError("no network")
+
+    monkeypatch.setattr(tiktoken, "encoding_for_model", offline)
+    tokens._encoding.cache_clear()
+    try:
+        assert not tokens.load_encoding("some-model")
+        assert tokens.count_tokens("x" * 9, "some-model") == 3
+    finally:
+        tokens._encoding.cache_clear()
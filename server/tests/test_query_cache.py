@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import pytest
+
+from app.services import query_cache
+from app.services.query_cache import (
+    ScopedTTLCache,
+    SemanticAnswerCache,
+    normalize_question,
+    scope_fingerprint,
+)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(query_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_normalize_question_and_scope_fingerprint():
+    assert normalize_question("  What is  the TOTAL? ") == "what is the total"
+    assert scope_fingerprint(["b", "a", "a"]) == scope_fingerprint({"a", "b"})
+    assert scope_fingerprint(None) == query_cache.ANY_SCOPE
+
+
+def test_get_put_and_stats():
+    cache: ScopedTTLCache[int] = ScopedTTLCache(4, 60)
+    assert cache.get("k") is None
+    cache.put("k", 1, ["a"])
+    assert cache.get("k") == 1
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_entries_expire(clock):
+    cache: ScopedTTLCache[int] = ScopedTTLCache(4, 10)
+    cache.put("k", 1, ["a"])
+    clock.now += 10
+    assert cache.get("k") == 1
+    clock.now += 0.1
+    assert cache.get("k") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache: ScopedTTLCache[int] = ScopedTTLCache(2, 60)
+    cache.put("a", 1, ["x"])
+    cache.put("b", 2, ["x"])
+    cache.get("a")
+    cache.put("c", 3, ["x"])
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_invalidate_drops_tagged_and_all_document_entries():
+    cache: ScopedTTLCache[int] = ScopedTTLCache(8, 60)
+    cache.put("one", 1, ["a"])
+    cache.put("both", 2, ["a", "b"])
+    cache.put("other", 3, ["c"])
+    cache.put("all", 4, None)
+    assert cache.invalidate(["b"]) == 2
+    assert cache.get("both") is None
+    assert cache.get("all") is None
+    assert cache.get("one") == 1
+    assert cache.get("other") == 3
+    # Dropped keys no longer count against their other tags
+    assert cache.invalidate(["a"]) == 1
+
+
+def test_put_computed_before_an_invalidation_is_discarded():
+    cache: ScopedTTLCache[int] = ScopedTTLCache(4, 60)
+    version = cache.version()
+    cache.invalidate(["a"])
+    cache.put("k", 1, ["a"], version)
+    assert cache.get("k") is None
+    cache.put("k", 2, ["a"], cache.version())
+    assert cache.get("k") == 2
+
+
+def test_clear_also_bumps_the_version():
+    cache: ScopedTTLCache[int] = ScopedTTLCache(4, 60)
+    cache.put("k", 1, ["a"])
+    version = cache.version()
+    cache.clear()
+    cache.put("j", 1, ["a"], version)
+    assert cache.stats()["size"] == 0
+
+
+def test_disabled_cache_stores_nothing():
+    cache: ScopedTTLCache[int] = ScopedTTLCache(0, 60)
+    cache.put("k", 1, ["a"])
+    assert cache.get("k") is None
+
+
+def test_question_identifiers():
+    assert query_cache.question_identifiers("Total of invoice 1042?") == {"1042"}
+    assert query_cache.question_identifiers('Revenue in Q3 2023 per "Project Blue"') == {
+        "q3",
+        "2023",
+        "project blue",
+    }
+    assert query_cache.question_identifiers("What does ACME deliver?") == {"acme"}
+    assert query_cache.question_identifiers("summarize the contract") == frozenset()
+
+
+def _answers(threshold: float = 0.9) -> SemanticAnswerCache:
+    return SemanticAnswerCache(8, 60, threshold)
+
+
+def test_similar_question_reuses_the_answer_above_the_threshold():
+    cache = _answers()
+    cache.put("scope", "What is the payment term?", [1.0, 0.0], {"answer": "30 days"}, ["a"])
+    hit = cache.lookup("scope", "what's the payment term", [0.95, 0.05])
+    assert hit is not None
+    assert hit[0] == {"answer": "30 days"}
+    assert hit[1] == pytest.approx(0.9986, abs=1e-3)
+
+
+def test_dissimilar_question_or_other_scope_misses():
+    cache = _answers()
+    cache.put("scope", "What is the payment term?", [1.0, 0.0], {"answer": "30 days"}, ["a"])
+    assert cache.lookup("scope", "Who signed it?", [0.6, 0.8]) is None
+    assert cache.lookup("other", "What is the payment term?", [1.0, 0.0]) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_questions_naming_different_identifiers_never_share_answers():
+    cache = _answers()
+    cache.put("scope", "Total of invoice 1042?", [1.0, 0.0], {"answer": "$10"}, ["a"])
+    # Same embedding on purpose: only the invoice number differs
+    assert cache.lookup("scope", "Total of invoice 1043?", [1.0, 0.0]) is None
+    assert cache.lookup("scope", "Total of the invoice?", [1.0, 0.0]) is None
+    assert cache.lookup("scope", "total of invoice 1042", [1.0, 0.0]) is not None
+
+
+def test_best_match_wins_and_invalidation_drops_answers():
+    cache = _answers(0.5)
+    cache.put("scope", "payment term", [1.0, 0.0], {"answer": "near"}, ["a"])
+    cache.put("scope", "payment terms overview", [0.6, 0.8], {"answer": "far"}, ["b"])
+    assert cache.lookup("scope", "payment term?", [0.99, 0.1])[0] == {"answer": "near"}
+    cache.invalidate(["a"])
+    assert cache.lookup("scope", "payment term?", [0.99, 0.1])[0] == {"answer": "far"}
+
+
+def test_answer_hit_refreshes_recency():
+    cache = SemanticAnswerCache(2, 60, 0.9)
+    cache.put("scope", "payment term", [1.0, 0.0], {"answer": "hot"}, ["a"])
+    cache.put("scope", "who signed", [0.0, 1.0], {"answer": "cold"}, ["a"])
+    assert cache.lookup("scope", "payment term", [1.0, 0.0])[0] == {"answer": "hot"}
+    cache.put("scope", "governing law", [0.7, 0.7], {"answer": "new"}, ["a"])
+    # The entry just served outlives the older, unused one
+    assert cache.lookup("scope", "payment term", [1.0, 0.0])[0] == {"answer": "hot"}
+    assert cache.lookup("scope", "who signed", [0.0, 1.0]) is None
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import numpy as np
+
+from app.services.rerank import mmr, mmr_rerank
+from app.services.vector_store import RetrievedChunk
+
+QUERY = [1.0, 0.0, 0.0]
+# Two near-duplicates closest to the query, then a distinct but still relevant vector
+CANDIDATES = np.array(
+    [
+        [0.95, 0.31, 0.0],
+        [0.94, 0.34, 0.0],
+        [0.80, 0.0, 0.60],
+        [0.0, 1.0, 0.0],
+    ],
+    dtype=np.float32,
+)
+
+
+def test_lambda_one_is_pure_relevance_order():
+    assert mmr(QUERY, CANDIDATES, 4, lambda_=1.0) == [0, 1, 2, 3]
+
+
+def test_lower_lambda_skips_the_near_duplicate():
+    assert mmr(QUERY, CANDIDATES, 2, lambda_=0.5) == [0, 2]
+
+
+def test_lambda_zero_maximizes_diversity_after_the_best_hit():
+    picked = mmr(QUERY, CANDIDATES, 3, lambda_=0.0)
+    assert picked[0] == 0
+    assert 1 not in picked
+
+
+def test_k_larger_than_candidates_returns_each_once():
+    picked = mmr(QUERY, CANDIDATES, 10, lambda_=0.7)
+    assert sorted(picked) == [0, 1, 2, 3]
+    assert mmr(QUERY, CANDIDATES, 0) == []
+    assert mmr(QUERY, np.zeros((0, 3), dtype=np.float32), 3) == []
+
+
+def test_zero_vectors_do_not_produce_nans():
+    cands = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0]], dtype=np.float32)
+    assert mmr(QUERY, cands, 2) == [1, 0]
+    assert sorted(mmr([0.0, 0.0, 0.0], cands, 2)) == [0, 1]
+
+
+def test_truncated_candidate_vectors_use_the_query_prefix():
+    cands = np.array([[0.0, 1.0], [1.0, 0.0]], dtype=np.float32)
+    assert mmr([1.0, 0.0, 5.0], cands, 1) == [1]
+
+
+def _chunk(chunk_id: str, vector: list[float] | None) -> RetrievedChunk:
+    return RetrievedChunk(chunk_id=chunk_id, source="a.pdf", text="t", vector=vector)
+
+
+def test_mmr_rerank_keeps_vectorless_chunks_last():
+    chunks = [
+        _chunk("dup1", CANDIDATES[0].tolist()),
+        _chunk("plain", None),
+        _chunk("dup2", CANDIDATES[1].tolist()),
+        _chunk("other", CANDIDATES[2].tolist()),
+    ]
+    assert [c.chunk_id for c in mmr_rerank(QUERY, chunks, 2, 0.5)] == ["dup1", "other"]
+    out = mmr_rerank(QUERY, chunks, 4, 0.5)
+    assert out[-1].chunk_id == "plain" and len(out) == 4
+
+
+def test_mmr_rerank_without_enough_vectors_keeps_the_order():
+    chunks = [_chunk("a", None), _chunk("b", [1.0, 0.0, 0.0]), _chunk("c", None)]
+    assert [c.chunk_id for c in mmr_rerank(QUERY, chunks, 2)] == ["a", "b"]
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+
+from app.services import single_flight
+from app.services.single_flight import SingleFlight
+
+
+def test_first_run_leads_and_the_rest_follow():
+    async def main():
+        flights = SingleFlight(60)
+        assert flights.join("k", "run-1") is True
+        assert flights.join("k", "run-2") is False
+        assert flights.join("other", "run-3") is True
+        # A replay of the leader keeps leading
+        assert flights.join("k", "run-1") is True
+        assert flights.stats() == {
+            "in_flight": 2, "leaders": 2, "followers": 1, "shared": 0, "failed": 0
+        }
+
+    asyncio.run(main())
+
+
+def test_followers_receive_the_leaders_result():
+    async def main():
+        flights = SingleFlight(60)
+        flights.join("k", "leader")
+        flights.join("k", "follower")
+        waiting = asyncio.gather(flights.wait("k", 5), flights.wait("k", 5))
+        await asyncio.sleep(0)
+        flights.finish("k", "leader", {"answer": "42"})
+        assert await waiting == [{"answer": "42"}, {"answer": "42"}]
+        assert flights.stats()["in_flight"] == 0
+        assert flights.stats()["shared"] == 2
+
+    asyncio.run(main())
+
+
+def test_only_the_leader_can_finish():
+    async def main():
+        flights = SingleFlight(60)
+        flights.join("k", "leader")
+        flights.finish("k", "someone-else", {"answer": "wrong"})
+        assert flights.stats()["in_flight"] == 1
+        assert await flights.wait("k", 0.01) is None
+
+    asyncio.run(main())
+
+
+def test_wait_gives_up_after_the_timeout_or_without_a_flight():
+    async def main():
+        flights = SingleFlight(60)
+        assert await flights.wait("missing", 5) is None
+        flights.join("k", "leader")
+        assert await flights.wait("k", 0.01) is None
+        # The flight survives a follower giving up
+        flights.finish("k", "leader", {"answer": "late"})
+        assert flights.stats()["shared"] == 0
+
+    asyncio.run(main())
+
+
+def test_stale_or_finished_leader_is_replaced(monkeypatch):
+    async def main():
+        now = [1000.0]
+        monkeypatch.setattr(single_flight.time, "monotonic", lambda: now[0])
+        flights = SingleFlight(10)
+        flights.join("k", "leader")
+        now[0] += 11
+        assert flights.join("k", "next") is True
+        flights.finish("k", "leader", {"answer": "stale"})
+        assert flights.stats()["in_flight"] == 1
+        flights.finish("k", "next", {"answer": "fresh"})
+        assert flights.join("k", "third") is True
+
+    asyncio.run(main())
+
+
+def test_failing_leader_releases_its_followers_at_once():
+    async def main():
+        flights = SingleFlight(60)
+        flights.join("k", "leader")
+        flights.join("k", "follower")
+        waiting = asyncio.gather(flights.wait("k", 5), flights.wait("k", 5))
+        await asyncio.sleep(0)
+        flights.fail("k", "someone-else")
+        assert flights.stats()["in_flight"] == 1
+        flights.fail("k", "leader")
+        # Well before the wait timeout: both fall back to answering themselves
+        assert await asyncio.wait_for(waiting, 1) == [None, None]
+        assert flights.stats()["in_flight"] == 0
+        assert flights.stats()["shared"] == 0
+        assert flights.stats()["failed"] == 1
+        # The next run leads a fresh flight
+        assert flights.join("k", "follower") is True
+
+    asyncio.run(main())
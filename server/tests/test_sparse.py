@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from app.services.sparse import BM25SparseEncoder, tokenize
+
+
+def test_compound_identifiers_are_kept_whole_and_split():
+    assert tokenize("Total of INV-2024-0042") == ["total", "inv-2024-0042", "inv", "2024", "0042"]
+
+
+def test_stopwords_are_dropped():
+    assert tokenize("What is the total of the invoice?") == ["total", "invoice"]
+
+
+def test_non_latin_words_are_tokens():
+    assert tokenize("Договор поставки №5") == ["договор", "поставки", "5"]
+    assert tokenize("Café in der Straße") == ["café", "der", "strasse"]
+
+
+def test_cjk_runs_become_bigrams():
+    assert tokenize("東京都") == ["東京", "京都"]
+    assert tokenize("日") == ["日"]
+
+
+def test_query_matches_document_terms_across_scripts():
+    enc = BM25SparseEncoder()
+    doc = enc.encode_document("Договор поставки заключён в Москве")
+    query = enc.encode_query("договор поставки")
+    assert set(query.indices) <= set(doc.indices)
+    assert len(query.indices) == 2
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy.dialects import postgresql
+
+from app.services.repositories import AsyncChunkRepo
+from app.services.vector_store import MetadataFilter
+from app.settings import settings
+from app.workflows import agent_query
+
+
+class _Session:
+    def __init__(self) -> None:
+        self.stmt = None
+
+    async def exec(self, stmt):
+        self.stmt = stmt
+        return SimpleNamespace(all=lambda: [])
+
+
+def test_search_text_builds_a_ranked_tsquery_with_filters():
+    session = _Session()
+    repo = AsyncChunkRepo(session)
+    asyncio.run(
+        repo.search_text(
+            "payment terms",
+            limit=7,
+            sha256s=["a", "b"],
+            page_ranges=((2, 4), (9, None)),
+            chunk_index_gte=1,
+        )
+    )
+    compiled = session.stmt.compile(dialect=postgresql.dialect())
+    sql = " ".join(str(compiled).split())
+    assert "chunks.text_tsv @@ websearch_to_tsquery(" in sql
+    assert "chunks.sha256 IN (" in sql
+    assert "(chunks.page_number >= %(page_number_1)s::INTEGER AND chunks.page_number <= " in sql
+    assert " OR chunks.page_number >= %(page_number_3)s::INTEGER)" in sql
+    assert "chunks.chunk_index >= " in sql
+    assert "ORDER BY ts_rank_cd(chunks.text_tsv" in sql
+    params = compiled.params
+    assert "payment terms" in params.values()
+    assert {2, 4, 9, 1, 7} <= set(v for v in params.values() if isinstance(v, int))
+
+
+def test_keyword_leg_only_runs_for_stores_without_one(monkeypatch):
+    calls = []
+
+    async def fake_search(question, limit, sha256s, metadata):
+        calls.append((question, limit, sha256s, metadata))
+        return ["hit"]
+
+    monkeypatch.setattr(agent_query, "search_chunk_text", fake_search)
+    monkeypatch.setattr(settings, "text_search", True)
+    metadata = MetadataFilter(page_ranges=((1, 2),))
+
+    hybrid = SimpleNamespace(hybrid=True)
+    dense = SimpleNamespace(hybrid=False)
+    assert asyncio.run(agent_query._keyword_hits(hybrid, "q", 5, None, metadata)) == []
+    assert asyncio.run(agent_query._keyword_hits(dense, "q", 5, ["a"], metadata)) == ["hit"]
+    assert calls == [("q", 5, ["a"], metadata)]
+
+    monkeypatch.setattr(settings, "text_search", False)
+    assert asyncio.run(agent_query._keyword_hits(dense, "q", 5, None, None)) == []
+
+
+def test_keyword_leg_failure_falls_back_to_vector_hits(monkeypatch):
+    async def broken(*args):
+        raise RuntimeError("no tsvector on this database")
+
+    monkeypatch.setattr(agent_query, "search_chunk_text", broken)
+    monkeypatch.setattr(settings, "text_search", True)
+    store = SimpleNamespace(hybrid=False)
+    assert asyncio.run(agent_query._keyword_hits(store, "q", 5, None, None)) == []
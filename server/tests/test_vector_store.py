@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from pydantic import ValidationError
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue, Range
+
+from app.api.schemas import QueryFilters
+from app.services.vector_store import (
+    MetadataFilter,
+    QdrantVectorStore,
+    RetrievedChunk,
+    _build_filter,
+    chunk_point_id,
+    fuse_results,
+    merge_neighbors,
+    neighbor_ids,
+)
+from app.workflows.agent_query import _metadata_filter
+
+
+def test_bulk_upsert_goes_through_the_ingest_client():
+    client, ingest = MagicMock(), MagicMock()
+    store = QdrantVectorStore(client, "docs", dim=2, ingest_client=ingest)
+    store.bulk_upsert(["a"], np.ones((1, 2)), [{"doc_id": "d"}], parallel=2)
+    ingest.upload_collection.assert_called_once()
+    assert ingest.upload_collection.call_args.kwargs["parallel"] == 2
+    client.upload_collection.assert_not_called()
+
+
+def test_bulk_upsert_falls_back_to_the_shared_client():
+    client = MagicMock()
+    store = QdrantVectorStore(client, "docs", dim=2)
+    store.bulk_upsert(["a"], np.ones((1, 2)), [{"doc_id": "d"}])
+    client.upload_collection.assert_called_once()
+
+
+def test_set_scopes_sends_one_batched_update():
+    client = MagicMock()
+    store = QdrantVectorStore(client, "docs", dim=2)
+    store.set_scopes({"a": ["folder:1"], "b": []})
+    client.batch_update_points.assert_called_once()
+    ops = client.batch_update_points.call_args.kwargs["update_operations"]
+    assert [op.set_payload.payload for op in ops] == [{"scopes": ["folder:1"]}, {"scopes": []}]
+    assert [op.set_payload.filter.must[0].match.value for op in ops] == ["a", "b"]
+    store.set_scopes({})
+    assert client.batch_update_points.call_count == 1
+
+
+def _payload(page: int | None, index: int | None) -> dict:
+    return {"page_number": page, "chunk_index": index}
+
+
+def test_page_ranges_match_inclusively_and_open_ended():
+    pages = MetadataFilter(page_ranges=((2, 4), (10, None)))
+    assert [p for p in (1, 2, 4, 5, 9, 10, 500) if pages.matches(_payload(p, 0))] == [2, 4, 10, 500]
+    assert not pages.matches(_payload(None, 0))
+
+
+def test_chunk_index_bounds():
+    window = MetadataFilter(chunk_index_gte=2, chunk_index_lte=3)
+    assert [i for i in range(6) if window.matches(_payload(1, i))] == [2, 3]
+    assert not window.matches(_payload(1, None))
+    assert MetadataFilter().matches(_payload(None, None))
+
+
+def test_qdrant_conditions_mirror_matches():
+    [single] = MetadataFilter(page_ranges=((2, 4),)).conditions()
+    assert single == FieldCondition(key="page_number", range=Range(gte=2, lte=4))
+
+    metadata = MetadataFilter(page_ranges=((1, 1), (7, None)), chunk_index_lte=5)
+    [either, index] = metadata.conditions()
+    assert isinstance(either, Filter)
+    assert [c.range for c in either.should] == [Range(gte=1, lte=1), Range(gte=7, lte=None)]
+    assert index == FieldCondition(key="chunk_index", range=Range(gte=None, lte=5))
+    assert MetadataFilter().conditions() == []
+
+
+def test_build_filter_combines_scope_hash_and_metadata():
+    assert _build_filter(None, None) is None
+    flt = _build_filter(
+        ["doc"], ["a", "b"], scopes=["folder:1"], metadata=MetadataFilter(chunk_index_gte=1)
+    )
+    assert flt.must == [
+        FieldCondition(key="scopes", match=MatchValue(value="folder:1")),
+        FieldCondition(key="doc_id", match=MatchValue(value="doc")),
+        FieldCondition(key="sha256", match=MatchAny(any=["a", "b"])),
+        FieldCondition(key="chunk_index", range=Range(gte=1, lte=None)),
+    ]
+
+
+def test_request_filters_become_a_metadata_filter():
+    filters = QueryFilters(pages=[{"start": 3, "end": 5}, {"start": 9}], chunk_index_gte=0)
+    assert _metadata_filter(filters.model_dump()) == MetadataFilter(
+        page_ranges=((3, 5), (9, None)), chunk_index_gte=0
+    )
+    # Nothing to filter on
+    assert _metadata_filter(QueryFilters().model_dump()) is None
+    assert _metadata_filter(None) is None
+
+
+def test_page_range_validation():
+    with pytest.raises(ValidationError):
+        QueryFilters(pages=[{"start": 5, "end": 4}])
+    with pytest.raises(ValidationError):
+        QueryFilters(pages=[{"start": 0}])
+
+
+def _chunk(
+    index: int, score: float | None = None, page: int = 1, sha: str = "doc"
+) -> RetrievedChunk:
+    return RetrievedChunk(
+        chunk_id=chunk_point_id(sha, index),
+        source="s",
+        text=f"t{index}",
+        chunk_index=index,
+        page_number=page,
+        sha256=sha,
+        score=score,
+    )
+
+
+def test_neighbor_ids_skip_negative_indexes_and_known_ids():
+    hits = [_chunk(0), _chunk(2)]
+    # 1 is a neighbour of both hits and 2 is itself a hit; -1 does not exist.
+    assert neighbor_ids(hits, 1) == [chunk_point_id("doc", 1), chunk_point_id("doc", 3)]
+    assert neighbor_ids([_chunk(5)], 0) == []
+
+
+def test_neighbor_ids_ignore_chunks_without_position():
+    unplaced = RetrievedChunk(chunk_id="x", source="s", text="t", sha256="doc")
+    assert neighbor_ids([unplaced], 2) == []
+
+
+def test_merge_neighbors_reading_order_at_hit_rank():
+    hits = [_chunk(5, 0.9), _chunk(1, 0.5)]
+    neighbors = [_chunk(i) for i in (0, 2, 4, 6)]
+    merged = merge_neighbors(hits, neighbors, 1)
+    assert [c.chunk_index for c in merged] == [4, 5, 6, 0, 1, 2]
+    assert [c.score for c in merged] == [0.9, 0.9, 0.9, 0.5, 0.5, 0.5]
+
+
+def test_merge_neighbors_stops_at_document_bounds():
+    # Chunk 3 is the last chunk; the id for chunk 4 was requested but nothing came back.
+    merged = merge_neighbors([_chunk(0, 0.9), _chunk(3, 0.8)], [_chunk(1), _chunk(2)], 1)
+    assert [c.chunk_index for c in merged] == [0, 1, 2, 3]
+
+
+def test_merge_neighbors_dedupes_overlapping_runs():
+    hits = [_chunk(3, 0.9), _chunk(4, 0.7)]
+    merged = merge_neighbors(hits, [_chunk(2), _chunk(5)], 1)
+    # The second hit is absorbed into the first run and does not start a run of its own.
+    assert [c.chunk_index for c in merged] == [2, 3, 4]
+    assert [c.score for c in merged] == [0.9, 0.9, 0.9]
+    assert len({c.chunk_id for c in merged}) == len(merged)
+
+
+def test_merge_neighbors_stays_on_the_hit_page():
+    merged = merge_neighbors([_chunk(3, 0.9, page=2)], [_chunk(2, page=1), _chunk(4, page=2)], 1)
+    assert [c.chunk_index for c in merged] == [3, 4]
+
+
+def _ids(chunks: list[RetrievedChunk]) -> list[int | None]:
+    return [c.chunk_index for c in chunks]
+
+
+def test_fuse_similarity_keeps_each_chunks_best_score():
+    first = [_chunk(1, 0.9), _chunk(2, 0.5)]
+    second = [_chunk(2, 0.8), _chunk(3, 0.7)]
+    fused = fuse_results([first, second])
+    assert _ids(fused) == [1, 2, 3]
+    assert [c.score for c in fused] == [0.9, 0.8, 0.7]
+
+
+def test_fuse_rrf_rewards_agreement_across_lists():
+    first = [_chunk(1), _chunk(2), _chunk(3)]
+    second = [_chunk(3), _chunk(2), _chunk(4)]
+    fused = fuse_results([first, second], similarity=False, k=60)
+    # 2 and 3 appear in both lists; 3's ranks (3rd, 1st) beat 2's (2nd, 2nd) only by a hair.
+    assert _ids(fused) == [3, 2, 1, 4]
+    assert fused[0].score == 1 / 63 + 1 / 61
+    assert all(a.score >= b.score for a, b in zip(fused, fused[1:], strict=False))
+
+
+def test_fuse_rrf_counts_a_repeated_chunk_once_per_list():
+    fused = fuse_results([[_chunk(1), _chunk(1)], [_chunk(2)]], similarity=False, k=0)
+    assert _ids(fused) == [1, 2]
+    assert [c.score for c in fused] == [1.0, 1.0]
+    # Ranks are list positions, so the skipped duplicate still occupies one.
+    fused = fuse_results([[_chunk(1), _chunk(1), _chunk(3)]], similarity=False, k=0)
+    assert [c.score for c in fused] == [1.0, 1 / 3]
+
+
+def test_fuse_empty_lists():
+    assert fuse_results([]) == []
+    assert fuse_results([[], []], similarity=False) == []
+    assert _ids(fuse_results([[], [_chunk(4, 0.3)]])) == [4]